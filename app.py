@@ -1,6 +1,10 @@
 import os
 import json
 import uuid
+import hashlib
+import errno
+import shutil
+import tempfile
 import sys
 import io
 import base64
@@ -9,13 +13,29 @@ import redis
 import threading
 import time
 import socket
-from celery import Celery
+import struct
+import sqlite3
+import tarfile
+import zipfile
+import numpy as np
+try:
+    import fcntl
+except ImportError:  # Not available on Windows
+    fcntl = None
+from celery import Celery, group
+from kombu import Queue
 from flask_socketio import SocketIO
 from dotenv import load_dotenv
 from os.path import join, dirname
-from datetime import datetime
-from PIL import Image
-from flask import Flask, render_template, request, jsonify, session, send_from_directory
+from collections import deque
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from functools import partial, wraps
+from itertools import groupby
+from PIL import ExifTags, Image, ImageOps, UnidentifiedImageError, features
+from werkzeug.utils import secure_filename
+from flask import Flask, Request, Response, render_template, request, jsonify, session, send_from_directory, make_response, stream_with_context
 
 # Configure logging
 logging.basicConfig(
@@ -28,6 +48,19 @@ dotenv_path = join(dirname(__file__), '.env')  # Address of your .env file
 load_dotenv(dotenv_path)
 
 PROJECTS_FOLDER = os.getenv('PROJECTS_FOLDER', 'projects')
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')
+# Fields probed from image headers at ingest and returned by the listing endpoints.
+# width and height are the displayed dimensions, after the EXIF orientation.
+IMAGE_METADATA_FIELDS = ('width', 'height', 'mode', 'format', 'orientation')
+MAX_IMAGE_PAGE_SIZE = int(os.getenv('MAX_IMAGE_PAGE_SIZE', 1000))
+# Metadata storage backend: 'files' (JSON files and directory listings) or 'sqlite'
+STORAGE_BACKEND = os.getenv('STORAGE_BACKEND', 'files').lower()
+# Keep writing annotation JSON files when the sqlite backend is used
+SQLITE_EXPORT_JSON = os.getenv('SQLITE_EXPORT_JSON', 'true').lower() == 'true'
+# Number of files of a batch upload handled by one Celery task
+UPLOAD_BATCH_CHUNK_SIZE = int(os.getenv('UPLOAD_BATCH_CHUNK_SIZE', 100))
+# Store uploaded content once in a shared blob area and hardlink it into projects
+UPLOAD_DEDUP = os.getenv('UPLOAD_DEDUP', 'false').lower() == 'true'
 # Ensure projects directory exists
 if not os.path.exists(PROJECTS_FOLDER):
     os.makedirs(PROJECTS_FOLDER)
@@ -53,6 +86,35 @@ app.config.update(
     broker_connection_retry_on_startup=os.getenv('BROKER_CONNECTION_RETRY_ON_STARTUP', 'true').lower() == 'true'
 )
 
+# Celery task queues
+# Latency-sensitive single-image uploads get their own queue, so bulk ingests and
+# exports never sit in front of them; run dedicated workers per queue with
+# `celery -A app.celery worker -Q <queue>` to size their concurrency separately.
+# Within a queue the Redis broker serves lower priority numbers first.
+INTERACTIVE_QUEUE = 'ingest-interactive'
+BULK_QUEUE = 'ingest-bulk'
+EXPORT_QUEUE = 'export'
+PRIORITY_HIGH = 0
+PRIORITY_NORMAL = 5
+PRIORITY_LOW = 9
+# Batch uploads with at most this many files are handled as interactive work
+UPLOAD_INTERACTIVE_MAX_FILES = int(os.getenv('UPLOAD_INTERACTIVE_MAX_FILES', 20))
+
+app.config.update(
+    task_queues=[Queue(INTERACTIVE_QUEUE), Queue(BULK_QUEUE), Queue(EXPORT_QUEUE)],
+    task_default_queue=BULK_QUEUE,
+    task_default_priority=PRIORITY_NORMAL,
+    task_routes={'*.export_*': {'queue': EXPORT_QUEUE}},
+    # Reserve few tasks per worker process, so a long bulk task can't hold back
+    # others that an idle process could run (override per worker with --prefetch-multiplier)
+    worker_prefetch_multiplier=int(os.getenv('CELERY_PREFETCH_MULTIPLIER', 1)),
+    broker_transport_options={
+        'priority_steps': list(range(PRIORITY_HIGH, PRIORITY_LOW + 1)),
+        'sep': ':',
+        'queue_order_strategy': 'priority'
+    }
+)
+
 # Initialize Celery
 def make_celery(app):
     celery = Celery(
@@ -75,18 +137,90 @@ celery = make_celery(app)
 
 # Initialize SocketIO and Redis
 # Simple Redis client for fallback when Redis is not available
+class SimpleRedisPipeline:
+    """Queues SimpleRedisClient calls and runs them on execute(), like a redis-py pipeline"""
+
+    def __init__(self, client):
+        self.client = client
+        self.commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self.client, name)
+
+        def queue(*args, **kwargs):
+            self.commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        commands, self.commands = self.commands, []
+        return [method(*args, **kwargs) for method, args, kwargs in commands]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.commands = []
+        return False
+
+
 class SimpleRedisClient:
+    # Seconds between two sweeps of expired keys
+    SWEEP_INTERVAL = 60
+
     def __init__(self):
         self.data = {}
+        self.expires = {}
+        self.last_sweep = time.monotonic()
         logger.warning("Using in-memory store as Redis is not available")
 
-    def hset(self, key, field, value):
+    def _expire_key(self, key):
+        expires_at = self.expires.get(key)
+        if expires_at is not None and expires_at <= time.monotonic():
+            self.data.pop(key, None)
+            self.expires.pop(key, None)
+
+    def expire(self, key, seconds):
+        now = time.monotonic()
+        if now - self.last_sweep >= self.SWEEP_INTERVAL:
+            self.last_sweep = now
+            for expired_key in [k for k, expires_at in self.expires.items() if expires_at <= now]:
+                self._expire_key(expired_key)
+        if key not in self.data:
+            return False
+        self.expires[key] = now + seconds
+        return True
+
+    def pipeline(self, transaction=True):
+        return SimpleRedisPipeline(self)
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        self._expire_key(key)
         if key not in self.data:
             self.data[key] = {}
-        self.data[key][field] = value
+        if field is not None:
+            self.data[key][field] = value
+        if mapping:
+            self.data[key].update(mapping)
         return 1
 
+    def hincrby(self, key, field, amount=1):
+        self._expire_key(key)
+        if key not in self.data:
+            self.data[key] = {}
+        value = int(self.data[key].get(field, 0)) + amount
+        self.data[key][field] = str(value)
+        return value
+
+    def hgetall(self, key):
+        self._expire_key(key)
+        return {
+            field.encode('utf-8'): value.encode('utf-8') if isinstance(value, str) else value
+            for field, value in self.data.get(key, {}).items()
+        }
+
     def hget(self, key, field):
+        self._expire_key(key)
         if key in self.data and field in self.data[key]:
             value = self.data[key][field]
             if isinstance(value, str):
@@ -94,9 +228,48 @@ class SimpleRedisClient:
             return value
         return None
 
+    def hmget(self, key, *fields):
+        return [self.hget(key, field) for field in fields]
+
+    def zadd(self, key, mapping):
+        self._expire_key(key)
+        zset = self.data.setdefault(key, {})
+        added = sum(1 for member in mapping if member not in zset)
+        zset.update({member: float(score) for member, score in mapping.items()})
+        return added
+
+    def zrem(self, key, *members):
+        self._expire_key(key)
+        zset = self.data.get(key, {})
+        return sum(1 for member in members if zset.pop(member, None) is not None)
+
+    def zrangebyscore(self, key, min, max):
+        self._expire_key(key)
+        low = float('-inf') if min == '-inf' else float(min)
+        high = float('inf') if max == '+inf' else float(max)
+        return [
+            member.encode('utf-8')
+            for member, score in sorted(self.data.get(key, {}).items(), key=lambda item: item[1])
+            if low <= score <= high
+        ]
+
+    def zcard(self, key):
+        self._expire_key(key)
+        return len(self.data.get(key, {}))
+
+    def zremrangebyscore(self, key, min, max):
+        stale = self.zrangebyscore(key, min, max)
+        return self.zrem(key, *(member.decode('utf-8') for member in stale))
+
     def exists(self, key):
+        self._expire_key(key)
         return key in self.data
 
+    def delete(self, *keys):
+        for key in keys:
+            self.expires.pop(key, None)
+        return sum(1 for key in keys if self.data.pop(key, None) is not None)
+
     def publish(self, channel, message):
         logger.info(f"Would publish to {channel}: {message}")
         # In the simple version, we directly emit the event to Socket.IO
@@ -524,450 +697,3695 @@ except Exception as e:
     redis_client = SimpleRedisClient()
 
 # Upload queue status
-upload_tasks = {}
-
-# Celery task for processing uploads
-@celery.task(bind=True)
-def process_upload_task(self_or_task, project_id, filename, temp_file_path):
-    """
-    Celery task for processing an uploaded image.
-    This runs asynchronously to avoid blocking the main thread.
-    """
-    # Get task ID
-    task_id = getattr(self_or_task, 'id', None) or self_or_task.request.id
-
-    # Use the global Redis client if available, otherwise initialize a new one
-    if redis_client and not isinstance(redis_client, SimpleRedisClient):
-        task_redis_client = redis_client
-        logger.info("Using global Redis client for task")
-    else:
-        # Initialize Redis client for this task using the retry function
-        try:
-            logger.info("Initializing new Redis client for task")
-            task_redis_client = initialize_redis_with_retries(max_retries=3, initial_delay=2)
-        except Exception as e:
-            logger.error(f"Failed to connect to Redis for task: {e}")
-            # Fall back to the global redis client
-            task_redis_client = redis_client
-
-    # Helper function to update progress and publish events
-    def update_progress(progress, status='processing', event_type='upload_progress', additional_data=None):
-        # Update Redis and publish event in one function
-        try:
-            # Update task status in Redis
-            task_redis_client.hset(f"upload_task:{task_id}", "progress", str(progress))
-            if status:
-                task_redis_client.hset(f"upload_task:{task_id}", "status", status)
-
-            # Prepare and publish event
-            event_data = {
-                'task_id': task_id,
-                'project_id': project_id,
-                'filename': filename,
-                'progress': progress,
-                'status': status
-            }
-
-            # Add any additional data
-            if additional_data:
-                event_data.update(additional_data)
-
-            # Publish event
-            task_redis_client.publish('socketio_events', json.dumps({
-                'event': event_type,
-                'data': event_data
-            }))
-
-            logger.info(f"Task {task_id}: {status} ({progress}%)")
-        except Exception as e:
-            logger.error(f"Error updating progress: {e}")
+# Redis keeps the state of upload tasks, batches and resumable uploads for this long
+UPLOAD_TASK_TTL = int(os.getenv('UPLOAD_TASK_TTL', 24 * 3600))
 
-    try:
-        # Initialize task
-        update_progress(0, 'processing')
-
-        # Set up project directories
-        project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
-        images_path = os.path.join(project_path, 'images')
-        try:
-            os.makedirs(images_path, exist_ok=True)
-        except Exception as e:
-            logger.error(f"Failed to create images directory: {str(e)}")
-            update_progress(0, 'failed', 'upload_failed', {'error': f"Failed to create images directory: {str(e)}"})
-            return {'success': False, 'error': f"Failed to create images directory: {str(e)}"}
-
-        # Update progress to 25%
-        update_progress(25)
 
-        # Copy file from temp location to final destination using a streaming approach
-        # to avoid loading the entire file into memory
-        file_path = os.path.join(images_path, filename)
-        try:
-            with open(temp_file_path, 'rb') as src_file:
-                try:
-                    with open(file_path, 'wb') as dst_file:
-                        # Copy in chunks of 1MB to avoid memory issues
-                        chunk_size = 1024 * 1024  # 1MB
-                        while True:
-                            try:
-                                chunk = src_file.read(chunk_size)
-                                if not chunk:
-                                    break
-                                dst_file.write(chunk)
-                            except Exception as e:
-                                logger.error(f"Error during file copy operation: {str(e)}")
-                                update_progress(0, 'failed', 'upload_failed', {'error': f"Error during file copy operation: {str(e)}"})
-                                return {'success': False, 'error': f"Error during file copy operation: {str(e)}"}
-                except Exception as e:
-                    logger.error(f"Failed to open destination file for writing: {str(e)}")
-                    update_progress(0, 'failed', 'upload_failed', {'error': f"Failed to open destination file for writing: {str(e)}"})
-                    return {'success': False, 'error': f"Failed to open destination file for writing: {str(e)}"}
-        except Exception as e:
-            logger.error(f"Failed to open source file for reading: {str(e)}")
-            update_progress(0, 'failed', 'upload_failed', {'error': f"Failed to open source file for reading: {str(e)}"})
-            return {'success': False, 'error': f"Failed to open source file for reading: {str(e)}"}
-
-        # # Set permissions and clean up
-        # try:
-        #     os.chmod(file_path, 0o666)  # Read and write permissions for all users
-        # except Exception as e:
-        #     # This is not a critical error - file uploads will still work
-        #     # This commonly happens in Docker environments with mounted volumes,
-        #     # especially on Windows hosts where the container user doesn't have
-        #     # permission to change file modes in the mounted volume
-        #     logger.info(f"Non-critical: Could not set file permissions: {str(e)}")
-        #     # Continue with the upload process regardless of permission errors
-
-        # Remove temp file
-        try:
-            os.remove(temp_file_path)
-        except Exception as e:
-            # If we can't remove the temp file, log it but continue
-            logger.warning(f"Could not remove temporary file {temp_file_path}: {str(e)}")
-            # This is not a critical error - the upload has already been processed
+def project_uploads_key(project_id):
+    """Return the Redis sorted set of a project's active upload task IDs (scored by creation time)"""
+    return f"project_uploads:{project_id}"
 
-        # Update progress to 75%
-        update_progress(75)
 
-        # Create image info
-        image_info = {
-            'name': filename,
-            'path': file_path,
-            'uploaded': datetime.now().isoformat()
-        }
+def write_task_state(client, key, state, pipe=None):
+    """Write hash fields and refresh the key's expiry in one round trip"""
+    own_pipe = pipe is None
+    if own_pipe:
+        pipe = client.pipeline(transaction=False)
+    pipe.hset(key, mapping=state)
+    pipe.expire(key, UPLOAD_TASK_TTL)
+    if own_pipe:
+        pipe.execute()
 
-        # Store image info and mark as completed
-        task_redis_client.hset(f"upload_task:{task_id}", "image_info", json.dumps(image_info))
-        update_progress(100, 'completed', 'upload_completed', {'image_info': image_info})
+# Thread pool for evaluating many projects concurrently (batched counts)
+counts_executor = ThreadPoolExecutor(max_workers=int(os.getenv('COUNTS_WORKERS', 8)))
 
-        return {'success': True, 'image': image_info}
+# Image catalog
+# Builds the list of a project's images in a single os.scandir pass and keeps
+# the sorted result in memory. A cached listing is reused as long as the mtime
+# of the images directory is unchanged, which covers files added, removed or
+# renamed by any process (web workers and Celery alike).
+IMAGE_SORT_FIELDS = ('uploaded', 'name')
+IMAGE_SORT_ORDERS = ('asc', 'desc')
 
-    except Exception as e:
-        # Handle errors
-        logger.error(f"Error processing upload: {e}")
-        update_progress(0, 'failed', 'upload_failed', {'error': str(e)})
-        return {'success': False, 'error': str(e)}
 
-# Routes
-@app.route('/')
-def index():
-    """Home page with project management"""
-    return render_template('index.html')
+def image_sort_key(image, sort):
+    """Return the keyset pagination key of an image for a sort field"""
+    if sort == 'name':
+        return (image['name'],)
+    return (image['uploaded_ts'], image['name'])
 
-@app.route('/projects', methods=['GET', 'POST'])
-def projects():
-    """API for project management"""
-    if request.method == 'GET':
-        # List all projects
-        projects = []
-        if os.path.exists(app.config['PROJECTS_FOLDER']):
-            for project_name in os.listdir(app.config['PROJECTS_FOLDER']):
-                project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_name)
-                if os.path.isdir(project_path):
-                    config_path = os.path.join(project_path, 'config.json')
-                    if os.path.exists(config_path):
-                        try:
-                            with open(config_path, 'r') as f:
-                                config = json.load(f)
-                        except (json.JSONDecodeError, IOError) as e:
-                            logger.error(f"Error reading config file for project {project_name}: {str(e)}")
-                            continue
 
-                        # Count images by scanning the directory
-                        image_count = 0
-                        images_path = os.path.join(project_path, 'images')
-                        if os.path.exists(images_path):
-                            for filename in os.listdir(images_path):
-                                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                                    file_path = os.path.join(images_path, filename)
-                                    if os.path.isfile(file_path):
-                                        image_count += 1
-
-                        # Count annotations per class
-                        annotations_count = {}
-                        classes = config.get('classes', [])
-                        for i, class_name in enumerate(classes):
-                            annotations_count[class_name] = 0
-
-                        # Scan annotation files
-                        annotations_path = os.path.join(project_path, 'annotations')
-                        if os.path.exists(annotations_path):
-                            for filename in os.listdir(annotations_path):
-                                if filename.endswith('.json'):
-                                    annotation_file = os.path.join(annotations_path, filename)
-                                    try:
-                                        with open(annotation_file, 'r') as ann_file:
-                                            annotations = json.load(ann_file)
-                                            for annotation in annotations:
-                                                class_idx = annotation.get('class', 0)
-                                                if class_idx is not None and 0 <= class_idx < len(classes):
-                                                    class_name = classes[class_idx]
-                                                    annotations_count[class_name] = annotations_count.get(class_name, 0) + 1
-                                    except (json.JSONDecodeError, IOError):
-                                        pass
+class ImageCatalog:
+    """In-memory, mtime-validated cache of project image listings.
 
-                        projects.append({
-                            'id': project_name,
-                            'name': config.get('name', project_name),
-                            'created': config.get('created', ''),
-                            'classes': config.get('classes', []),
-                            'classColors': config.get('classColors', {}),
-                            'imageCount': image_count,
-                            'annotationsCount': annotations_count
-                        })
-        return jsonify(projects)
+    The upload time of an image is the one recorded when it was ingested (see
+    register_uploaded_images), falling back to its mtime for images that predate
+    it. st_ctime is not used: hardlinking a file (dedup, exports) changes it.
+    """
 
-    elif request.method == 'POST':
-        # Create new project
-        data = request.json
-        project_name = data.get('name', '').strip()
-        classes = data.get('classes', [])
-        class_colors = data.get('classColors', {})
+    def __init__(self, projects_folder):
+        self.projects_folder = projects_folder
+        # project_id -> ((directory mtime, metadata log version), {(sort, order): sorted images})
+        self._cache = {}
+        self._lock = threading.Lock()
 
-        if not project_name:
-            return jsonify({'error': 'Project name is required'}), 400
+    def _scan(self, images_path, uploaded_times):
+        images = []
+        with os.scandir(images_path) as entries:
+            for entry in entries:
+                if not entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                    continue
+                try:
+                    if not entry.is_file():
+                        continue
+                    uploaded = uploaded_times.get(entry.name) or entry.stat().st_mtime
+                except OSError:
+                    # File removed while scanning
+                    continue
+                images.append({
+                    'name': entry.name,
+                    'path': entry.path,
+                    'uploaded': datetime.fromtimestamp(uploaded).isoformat(),
+                    'uploaded_ts': uploaded
+                })
+        return images
+
+    def get_images(self, project_id, sort='uploaded', order='desc'):
+        """Return the project's images sorted by the given field (newest first by default).
+
+        The returned list and its items are shared with the cache and must not be modified.
+        """
+        images_path = os.path.join(self.projects_folder, project_id, 'images')
+        try:
+            version = (os.stat(images_path).st_mtime_ns, image_metadata.version(project_id))
+        except FileNotFoundError:
+            self.invalidate(project_id)
+            return []
+
+        with self._lock:
+            cached = self._cache.get(project_id)
+        if not cached or cached[0] != version:
+            uploaded_times = {
+                name: metadata['uploaded_ts']
+                for name, metadata in image_metadata.get(project_id).items() if metadata.get('uploaded_ts')
+            }
+            views = {('uploaded', 'asc'): sorted(self._scan(images_path, uploaded_times),
+                                                 key=lambda x: image_sort_key(x, 'uploaded'))}
+            cached = (version, views)
+            with self._lock:
+                self._cache[project_id] = cached
+
+        views = cached[1]
+        view = views.get((sort, order))
+        if view is None:
+            if sort == 'uploaded':
+                view = views[('uploaded', 'asc')][::-1]
+            else:
+                view = sorted(views[('uploaded', 'asc')], key=lambda x: image_sort_key(x, sort), reverse=(order == 'desc'))
+            views[(sort, order)] = view
+        return view
 
-        # Create unique project ID
-        project_id = str(uuid.uuid4())
-        project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    def get_image_names(self, project_id):
+        """Return the names of the project's images sorted newest first"""
+        return [image['name'] for image in self.get_images(project_id)]
 
-        # Create project directory structure
-        os.makedirs(project_path, exist_ok=True)
-        os.makedirs(os.path.join(project_path, 'images'), exist_ok=True)
-        os.makedirs(os.path.join(project_path, 'annotations'), exist_ok=True)
-        os.makedirs(os.path.join(project_path, 'export'), exist_ok=True)
+    def invalidate(self, project_id):
+        """Drop the cached listing of a project"""
+        with self._lock:
+            self._cache.pop(project_id, None)
 
-        # Create project config
-        config = {
-            'name': project_name,
-            'created': datetime.now().isoformat(),
-            'classes': classes,
-            'classColors': class_colors
-        }
 
-        with open(os.path.join(project_path, 'config.json'), 'w') as f:
-            json.dump(config, f)
+def image_info_response(image, metadata=None):
+    """Build the image info object returned by the API from a catalog entry.
 
-        return jsonify({
-            'id': project_id,
-            'name': project_name,
-            'created': config['created'],
-            'classes': classes,
-            'classColors': class_colors
-        })
+    Probed dimensions and format are taken from metadata, or from the entry itself.
+    Images big enough to get a tile pyramid at ingest are flagged as tiled.
+    """
+    info = {
+        'name': image['name'],
+        'path': image['path'],
+        'uploaded': image['uploaded']
+    }
+    metadata = metadata if metadata is not None else image
+    for field in IMAGE_METADATA_FIELDS:
+        if metadata.get(field) is not None:
+            info[field] = metadata[field]
+    if max(info.get('width', 0), info.get('height', 0)) > DEEPZOOM_MIN_SIZE:
+        info['tiled'] = True
+    return info
 
-    return jsonify({'error': 'Invalid request method.'})
 
-@app.route('/projects/<project_id>', methods=['GET', 'PUT', 'DELETE'])
-def project(project_id):
-    """API for individual project operations"""
-    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+def encode_image_cursor(image, sort):
+    """Encode an opaque pagination cursor pointing after the given image"""
+    payload = json.dumps([sort, list(image_sort_key(image, sort))])
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii')
 
-    if not os.path.exists(project_path):
-        return jsonify({'error': 'Project not found'}), 404
 
-    config_path = os.path.join(project_path, 'config.json')
+def decode_image_cursor(cursor, sort):
+    """Decode a pagination cursor, raising ValueError if it is invalid for the sort field"""
+    try:
+        cursor_sort, key = json.loads(base64.urlsafe_b64decode(cursor.encode('ascii')))
+    except Exception:
+        raise ValueError('Invalid cursor')
+    if cursor_sort != sort or not isinstance(key, list):
+        raise ValueError('Cursor does not match the requested sort')
+    # Same shape as image_sort_key, so comparisons with it can't raise TypeError
+    key_types = (str,) if sort == 'name' else ((int, float), str)
+    if len(key) != len(key_types) or not all(
+            isinstance(value, types) and not isinstance(value, bool) for value, types in zip(key, key_types)):
+        raise ValueError('Invalid cursor')
+    return tuple(key)
+
+
+def paginate_images(images, sort, order, limit=None, cursor=None):
+    """Return one page of an already sorted image list and the cursor of the next page.
+
+    The cursor is a keyset on the sort key (upload time + name, or name), so pages stay
+    stable while images are added or removed. Without a limit, everything after the cursor
+    is returned.
+    """
+    start = 0
+    if cursor:
+        cursor_key = decode_image_cursor(cursor, sort)
+        # Binary search for the first image strictly after the cursor in this order
+        lo, hi = 0, len(images)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            key = image_sort_key(images[mid], sort)
+            after = key > cursor_key if order == 'asc' else key < cursor_key
+            if after:
+                hi = mid
+            else:
+                lo = mid + 1
+        start = lo
 
-    if request.method == 'GET':
-        # Get project details
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+    end = len(images) if limit is None else min(len(images), start + limit)
+    page = images[start:end]
+    next_cursor = encode_image_cursor(page[-1], sort) if page and end < len(images) else None
+    return page, next_cursor
 
-        # Get list of images
-        images = []
-        image_count = 0
-        images_path = os.path.join(project_path, 'images')
-        if os.path.exists(images_path):
-            for filename in os.listdir(images_path):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                    file_path = os.path.join(images_path, filename)
-                    if os.path.isfile(file_path):
-                        images.append(filename)
-                        image_count += 1
-
-        # Count annotations per class
-        annotations_count = {}
-        classes = config.get('classes', [])
-        for i, class_name in enumerate(classes):
-            annotations_count[class_name] = 0
-
-        # Scan annotation files
-        annotations_path = os.path.join(project_path, 'annotations')
-        if os.path.exists(annotations_path):
-            for filename in os.listdir(annotations_path):
-                if filename.endswith('.json'):
-                    annotation_file = os.path.join(annotations_path, filename)
-                    try:
-                        with open(annotation_file, 'r') as ann_file:
-                            annotations = json.load(ann_file)
-                            for annotation in annotations:
-                                class_idx = annotation.get('class', 0)
-                                if class_idx is not None and 0 <= class_idx < len(classes):
-                                    class_name = classes[class_idx]
-                                    annotations_count[class_name] = annotations_count.get(class_name, 0) + 1
-                    except (json.JSONDecodeError, IOError):
-                        pass
 
-        return jsonify({
-            'id': project_id,
-            'name': config.get('name', ''),
-            'created': config.get('created', ''),
-            'classes': config.get('classes', []),
-            'classColors': config.get('classColors', {}),
-            'images': images,
-            'imageCount': image_count,
-            'annotationsCount': annotations_count
-        })
+def parse_image_list_args(args):
+    """Parse the pagination and sort query parameters of the image listing endpoints.
 
-    elif request.method == 'PUT':
-        # Update project
-        data = request.json
+    Returns (sort, order, limit, cursor); raises ValueError on invalid values.
+    """
+    sort = args.get('sort', 'uploaded')
+    if sort not in IMAGE_SORT_FIELDS:
+        raise ValueError(f"Invalid sort field '{sort}', expected one of {', '.join(IMAGE_SORT_FIELDS)}")
 
-        with open(config_path, 'r') as f:
-            config = json.load(f)
+    order = args.get('order', 'desc')
+    if order not in IMAGE_SORT_ORDERS:
+        raise ValueError(f"Invalid order '{order}', expected 'asc' or 'desc'")
 
-        if 'name' in data:
-            config['name'] = data['name']
+    limit = args.get('limit')
+    if limit is not None:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise ValueError('limit must be an integer')
+        if not 1 <= limit <= MAX_IMAGE_PAGE_SIZE:
+            raise ValueError(f'limit must be between 1 and {MAX_IMAGE_PAGE_SIZE}')
+
+    return sort, order, limit, args.get('cursor') or None
+
+
+def image_list_response(images, sort, order, limit, cursor, metadata=None):
+    """Build a (paginated) image listing response with the total count header"""
+    page, next_cursor = paginate_images(images, sort, order, limit, cursor)
+    metadata = metadata or {}
+    body = {'images': [image_info_response(image, metadata.get(image['name'], {})) for image in page]}
+    if limit is not None:
+        body['next_cursor'] = next_cursor
+    response = jsonify(body)
+    response.headers['X-Total-Count'] = str(len(images))
+    return response
 
-        if 'classes' in data:
-            config['classes'] = data['classes']
 
-        if 'classColors' in data:
-            config['classColors'] = data['classColors']
+image_catalog = ImageCatalog(PROJECTS_FOLDER)
 
-        with open(config_path, 'w') as f:
-            json.dump(config, f)
+# Per-project statistics index
+# Counts are kept in projects/<id>/stats.json and updated on every write path
+# (annotation save, mark as background, image upload and delete), so the
+# project list and counts endpoints don't have to rescan the project folders.
+# Annotation counts are keyed by class index and mapped to class names on read,
+# so renaming or adding classes doesn't invalidate the index.
+STATS_FILENAME = 'stats.json'
+STATS_LOCK_FILENAME = 'stats.lock'
 
-        return jsonify({
-            'id': project_id,
-            'name': config['name'],
-            'created': config['created'],
-            'classes': config['classes'],
-            'classColors': config.get('classColors', {})
-        })
+# In-process lock; the lock file below also serializes web and Celery processes
+stats_lock = threading.Lock()
 
-    elif request.method == 'DELETE':
-        # Delete project (this is dangerous, consider adding confirmation)
-        import shutil
-        shutil.rmtree(project_path)
-        return jsonify({'success': True})
-    return jsonify({'error': 'Invalid request method.'})
 
+def empty_project_stats():
+    """Return a stats record for a project without images or annotations"""
+    return {
+        'imageCount': 0,
+        'annotatedCount': 0,
+        'backgroundCount': 0,
+        'classCounts': {}
+    }
 
-@app.route('/projects/<project_id>/counts', methods=['GET'])
-def project_counts(project_id):
-    """API for getting just the image and annotation counts for a project"""
-    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
 
-    if not os.path.exists(project_path):
-        return jsonify({'error': 'Project not found'}), 404
+def summarize_annotations(annotations):
+    """Summarize the annotations of a single image for the stats index"""
+    summary = {'annotated': False, 'background': False, 'classCounts': {}}
+    if not isinstance(annotations, list) or len(annotations) == 0:
+        return summary
+
+    summary['annotated'] = True
+    for annotation in annotations:
+        if not isinstance(annotation, dict):
+            continue
+        if annotation.get('type') == 'background':
+            summary['background'] = True
+        class_idx = annotation.get('class', 0)
+        if isinstance(class_idx, int) and class_idx >= 0:
+            key = str(class_idx)
+            summary['classCounts'][key] = summary['classCounts'].get(key, 0) + 1
+    return summary
+
+
+def read_annotation_summary(annotation_file):
+    """Read an annotation file and summarize it, treating missing or invalid files as unannotated"""
+    if not os.path.exists(annotation_file):
+        return summarize_annotations(None)
+    try:
+        with open(annotation_file, 'r') as f:
+            return summarize_annotations(json.load(f))
+    except (json.JSONDecodeError, IOError):
+        return summarize_annotations(None)
 
-    config_path = os.path.join(project_path, 'config.json')
 
-    try:
-        with open(config_path, 'r') as f:
-            config = json.load(f)
-    except (json.JSONDecodeError, IOError) as e:
-        return jsonify({'error': f'Failed to read project config: {str(e)}'}), 500
+def compute_project_stats(project_path):
+    """Compute the stats record for a project by scanning its folders"""
+    stats = empty_project_stats()
 
-    # Count images
-    image_count = 0
     images_path = os.path.join(project_path, 'images')
     if os.path.exists(images_path):
-        for filename in os.listdir(images_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                file_path = os.path.join(images_path, filename)
-                if os.path.isfile(file_path):
-                    image_count += 1
-
-    # Count annotations per class
-    annotations_count = {}
-    classes = config.get('classes', [])
-    for i, class_name in enumerate(classes):
-        annotations_count[class_name] = 0
+        stats['imageCount'] = len(image_catalog.get_images(os.path.basename(project_path)))
 
-    # Scan annotation files
     annotations_path = os.path.join(project_path, 'annotations')
     if os.path.exists(annotations_path):
         for filename in os.listdir(annotations_path):
             if filename.endswith('.json'):
-                annotation_file = os.path.join(annotations_path, filename)
-                try:
-                    with open(annotation_file, 'r') as ann_file:
-                        annotations = json.load(ann_file)
-                        for annotation in annotations:
-                            class_idx = annotation.get('class', 0)
-                            if class_idx is not None and 0 <= class_idx < len(classes):
-                                class_name = classes[class_idx]
-                                annotations_count[class_name] = annotations_count.get(class_name, 0) + 1
-                except (json.JSONDecodeError, IOError):
-                    pass
+                summary = read_annotation_summary(os.path.join(annotations_path, filename))
+                apply_annotation_summary(stats, summary, 1)
+
+    return stats
+
+
+def apply_annotation_summary(stats, summary, sign):
+    """Add (sign=1) or remove (sign=-1) an image's annotation summary to/from a stats record"""
+    if summary['annotated']:
+        stats['annotatedCount'] = max(0, stats['annotatedCount'] + sign)
+    if summary['background']:
+        stats['backgroundCount'] = max(0, stats['backgroundCount'] + sign)
+    for key, count in summary['classCounts'].items():
+        new_count = stats['classCounts'].get(key, 0) + sign * count
+        if new_count > 0:
+            stats['classCounts'][key] = new_count
+        else:
+            stats['classCounts'].pop(key, None)
 
-    return jsonify({
-        'imageCount': image_count,
-        'annotationsCount': annotations_count
-    })
 
-@app.route('/projects/<project_id>/images', methods=['GET', 'POST'])
-def project_images(project_id):
-    """API for project images list"""
-    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+def write_project_stats(project_path, stats):
+    """Atomically persist a stats record"""
+    stats_path = os.path.join(project_path, STATS_FILENAME)
+    tmp_path = f"{stats_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump(stats, f)
+    os.replace(tmp_path, stats_path)
 
-    if not os.path.exists(project_path):
-        return jsonify({'error': 'Project not found'}), 404
 
-    images_path = os.path.join(project_path, 'images')
-    os.makedirs(images_path, exist_ok=True)
+class ProjectStatsLock:
+    """Serialize stats updates of a project across threads and processes"""
 
-    if request.method == 'GET':
-        # Scan the images directory and return a list of all image files
-        images = []
-        if os.path.exists(images_path):
-            for filename in os.listdir(images_path):
-                if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                    file_path = os.path.join(images_path, filename)
-                    if os.path.isfile(file_path):
-                        # Create image info object
-                        image_info = {
-                            'name': filename,
-                            'path': file_path,
-                            'uploaded': datetime.fromtimestamp(os.path.getctime(file_path)).isoformat()
-                        }
-                        images.append(image_info)
-
-        # Sort images by creation time (newest first)
-        images.sort(key=lambda x: x['uploaded'], reverse=True)
-
-        return jsonify({'images': images})
+    def __init__(self, project_path):
+        self.lock_path = os.path.join(project_path, STATS_LOCK_FILENAME)
+        self.lock_file = None
 
-    elif request.method == 'POST':
-        # We still accept POST requests to maintain compatibility
-        # but we don't save to images_list.json anymore
-        return jsonify({'success': True})
+    def __enter__(self):
+        stats_lock.acquire()
+        try:
+            if fcntl is not None:
+                self.lock_file = open(self.lock_path, 'a')
+                fcntl.flock(self.lock_file, fcntl.LOCK_EX)
+        except Exception:
+            stats_lock.release()
+            raise
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        try:
+            if self.lock_file is not None:
+                fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+                self.lock_file.close()
+                self.lock_file = None
+        finally:
+            stats_lock.release()
+        return False
+
+
+def rebuild_project_stats(project_path):
+    """Recompute and persist the stats record of a project"""
+    with ProjectStatsLock(project_path):
+        stats = compute_project_stats(project_path)
+        write_project_stats(project_path, stats)
+    return stats
+
+
+def load_project_stats(project_path):
+    """Load the stats record of a project, rebuilding it if it's missing or unreadable"""
+    stats_path = os.path.join(project_path, STATS_FILENAME)
+    try:
+        with open(stats_path, 'r') as f:
+            return json.load(f)
+    except (json.JSONDecodeError, IOError):
+        logger.info(f"Stats index missing or unreadable for {project_path}, rebuilding")
+        return rebuild_project_stats(project_path)
 
-    return jsonify({'error': 'Invalid request method.'})
 
-@app.route('/projects/<project_id>/upload', methods=['POST'])
+def apply_project_stats_change(project_path, image_delta=0, old_summary=None, new_summary=None):
+    """Apply an incremental change to the stats record of a project; the stats lock must be held"""
+    stats_path = os.path.join(project_path, STATS_FILENAME)
+    try:
+        with open(stats_path, 'r') as f:
+            stats = json.load(f)
+    except (json.JSONDecodeError, IOError):
+        # The rebuilt record already reflects the change on disk
+        write_project_stats(project_path, compute_project_stats(project_path))
+        return
+
+    stats['imageCount'] = max(0, stats['imageCount'] + image_delta)
+    if old_summary:
+        apply_annotation_summary(stats, old_summary, -1)
+    if new_summary:
+        apply_annotation_summary(stats, new_summary, 1)
+    write_project_stats(project_path, stats)
+
+
+def update_project_stats(project_path, image_delta=0, old_summary=None, new_summary=None):
+    """Apply an incremental change to the stats record of a project"""
+    try:
+        with ProjectStatsLock(project_path):
+            apply_project_stats_change(project_path, image_delta, old_summary, new_summary)
+    except Exception as e:
+        logger.error(f"Failed to update stats for {project_path}: {str(e)}")
+
+
+def annotations_count_by_class(stats, classes):
+    """Map the class-index counts of a stats record to class names"""
+    annotations_count = {}
+    for i, class_name in enumerate(classes):
+        annotations_count[class_name] = annotations_count.get(class_name, 0) + stats['classCounts'].get(str(i), 0)
+    return annotations_count
+
+
+# Filter membership index
+# Keeps, per project, the set of annotation stems (image names without extension)
+# that are annotated and that are marked as background, so the filter tabs don't
+# have to parse every annotation file. The index is persisted as a snapshot
+# (membership.json) plus an append-only log of changes (membership.log) that is
+# folded into the snapshot once it grows; other processes pick up changes by
+# reading the log tail.
+MEMBERSHIP_FILENAME = 'membership.json'
+MEMBERSHIP_LOG_FILENAME = 'membership.log'
+MEMBERSHIP_COMPACT_THRESHOLD = 10000
+# Number of recent membership changes kept in memory to patch cached filter views
+MEMBERSHIP_CHANGES_KEPT = 1000
+
+
+class FilterMembershipIndex:
+    """Persisted annotated/background membership sets per project"""
+
+    def __init__(self, projects_folder):
+        self.projects_folder = projects_folder
+        # project_id -> {'annotated', 'background', 'version', 'changes', 'snapshot_mtime', 'log_offset', 'log_lines'}
+        self._states = {}
+        # (project_id, tab, sort, order) -> {'images', 'version', 'filtered', 'keys', 'by_stem'}
+        self._views = {}
+        # (project_id, sort, order) -> (catalog images, {image name: position})
+        self._positions = {}
+        self._lock = threading.Lock()
+
+    def _paths(self, project_id):
+        project_path = os.path.join(self.projects_folder, project_id)
+        return (
+            project_path,
+            os.path.join(project_path, MEMBERSHIP_FILENAME),
+            os.path.join(project_path, MEMBERSHIP_LOG_FILENAME)
+        )
+
+    def _scan(self, project_path):
+        annotated, background = set(), set()
+        annotations_path = os.path.join(project_path, 'annotations')
+        if os.path.exists(annotations_path):
+            with os.scandir(annotations_path) as entries:
+                for entry in entries:
+                    if entry.name.endswith('.json'):
+                        summary = read_annotation_summary(entry.path)
+                        stem = entry.name[:-len('.json')]
+                        if summary['annotated']:
+                            annotated.add(stem)
+                        if summary['background']:
+                            background.add(stem)
+        return annotated, background
+
+    def _write_snapshot(self, project_path, snapshot_path, log_path, annotated, background):
+        tmp_path = f"{snapshot_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            json.dump({'annotated': sorted(annotated), 'background': sorted(background)}, f)
+        os.replace(tmp_path, snapshot_path)
+        # The snapshot now contains every logged change
+        open(log_path, 'w').close()
+
+    def _apply_log(self, state, log_path):
+        try:
+            with open(log_path, 'r') as f:
+                f.seek(state['log_offset'])
+                for line in f:
+                    if not line.endswith('\n'):
+                        # Partially written entry, read it next time
+                        break
+                    stem, annotated, background = json.loads(line)
+                    self._apply(state, stem, annotated, background)
+                    state['log_offset'] += len(line.encode('utf-8'))
+                    state['log_lines'] += 1
+        except FileNotFoundError:
+            pass
+
+    @staticmethod
+    def _apply(state, stem, annotated, background):
+        (state['annotated'].add if annotated else state['annotated'].discard)(stem)
+        (state['background'].add if background else state['background'].discard)(stem)
+        state['version'] += 1
+        state['changes'].append((state['version'], stem))
+
+    def _load(self, project_id):
+        """Load (or build) the index of a project; must be called with the project lock held"""
+        project_path, snapshot_path, log_path = self._paths(project_id)
+        try:
+            with open(snapshot_path, 'r') as f:
+                snapshot = json.load(f)
+            annotated, background = set(snapshot['annotated']), set(snapshot['background'])
+        except (json.JSONDecodeError, IOError, KeyError):
+            logger.info(f"Filter membership index missing for project {project_id}, rebuilding")
+            annotated, background = self._scan(project_path)
+            self._write_snapshot(project_path, snapshot_path, log_path, annotated, background)
+
+        previous = self._states.get(project_id)
+        state = {
+            'annotated': annotated,
+            'background': background,
+            'version': previous['version'] + 1 if previous else 0,
+            'changes': deque(maxlen=MEMBERSHIP_CHANGES_KEPT),
+            'snapshot_mtime': os.stat(snapshot_path).st_mtime_ns,
+            'log_offset': 0,
+            'log_lines': 0
+        }
+        self._apply_log(state, log_path)
+        self._states[project_id] = state
+        return state
+
+    def get(self, project_id):
+        """Return the up-to-date membership state of a project"""
+        project_path, snapshot_path, log_path = self._paths(project_id)
+        state = self._states.get(project_id)
+        if state:
+            try:
+                snapshot_mtime = os.stat(snapshot_path).st_mtime_ns
+                log_size = os.stat(log_path).st_size
+            except FileNotFoundError:
+                snapshot_mtime, log_size = None, 0
+            if snapshot_mtime == state['snapshot_mtime'] and log_size == state['log_offset']:
+                return state
+
+        with ProjectStatsLock(project_path):
+            state = self._states.get(project_id)
+            if state and os.path.exists(snapshot_path) and os.stat(snapshot_path).st_mtime_ns == state['snapshot_mtime']:
+                self._apply_log(state, log_path)
+                return state
+            return self._load(project_id)
+
+    def update(self, project_id, stem, summary):
+        """Record the new annotation summary of an image stem"""
+        project_path, snapshot_path, log_path = self._paths(project_id)
+        try:
+            with ProjectStatsLock(project_path):
+                state = self._states.get(project_id)
+                if not state or not os.path.exists(snapshot_path) or \
+                        os.stat(snapshot_path).st_mtime_ns != state['snapshot_mtime']:
+                    state = self._load(project_id)
+                else:
+                    self._apply_log(state, log_path)
+
+                line = json.dumps([stem, summary['annotated'], summary['background']]) + '\n'
+                with open(log_path, 'a') as f:
+                    f.write(line)
+                self._apply(state, stem, summary['annotated'], summary['background'])
+                state['log_offset'] += len(line.encode('utf-8'))
+                state['log_lines'] += 1
+
+                if state['log_lines'] >= MEMBERSHIP_COMPACT_THRESHOLD:
+                    self._write_snapshot(project_path, snapshot_path, log_path, state['annotated'], state['background'])
+                    state['snapshot_mtime'] = os.stat(snapshot_path).st_mtime_ns
+                    state['log_offset'] = 0
+                    state['log_lines'] = 0
+        except Exception as e:
+            logger.error(f"Failed to update filter membership index for project {project_id}: {str(e)}")
+
+    def rebuild(self, project_id):
+        """Rebuild the index of a project from its annotation files"""
+        project_path, snapshot_path, log_path = self._paths(project_id)
+        with ProjectStatsLock(project_path):
+            annotated, background = self._scan(project_path)
+            self._write_snapshot(project_path, snapshot_path, log_path, annotated, background)
+            return self._load(project_id)
+
+    @staticmethod
+    def _in_tab(state, status, stem):
+        if status == 'annotated':
+            return stem in state['annotated']
+        if status == 'background':
+            return stem in state['background']
+        return stem not in state['annotated']
+
+    @staticmethod
+    def _changed_stems(changes, since, until):
+        """Return the stems changed after version since, or None if those changes weren't all kept"""
+        if not changes or changes[0][0] > since + 1:
+            return None
+        return {stem for version, stem in changes if since < version <= until}
+
+    @staticmethod
+    def _keys(view, sort):
+        if view['keys'] is None:
+            view['keys'] = [image_sort_key(image, sort) for image in view['filtered']]
+        return view['keys']
+
+    @staticmethod
+    def _by_stem(view):
+        if view['by_stem'] is None:
+            by_stem = {}
+            for image in view['images']:
+                by_stem.setdefault(os.path.splitext(image['name'])[0], []).append(image)
+            view['by_stem'] = by_stem
+        return view['by_stem']
+
+    @staticmethod
+    def _search(keys, key, order):
+        """Return the index of the first key not before key in a list sorted in this order"""
+        lo, hi = 0, len(keys)
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if keys[mid] < key if order == 'asc' else keys[mid] > key:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo
+
+    def _patch_view(self, view, state, status, stems, version, sort, order):
+        """Return a copy of a cached view with the tab membership of stems brought up to date"""
+        by_stem = self._by_stem(view)
+        filtered, keys = list(view['filtered']), list(self._keys(view, sort))
+        for stem in stems:
+            for image in by_stem.get(stem, ()):
+                key = image_sort_key(image, sort)
+                index = self._search(keys, key, order)
+                present = index < len(keys) and keys[index] == key
+                if self._in_tab(state, status, stem):
+                    if not present:
+                        filtered.insert(index, image)
+                        keys.insert(index, key)
+                elif present:
+                    del filtered[index]
+                    del keys[index]
+        return {'images': view['images'], 'version': version, 'filtered': filtered, 'keys': keys, 'by_stem': by_stem}
+
+    def _view(self, project_id, tab, sort, order):
+        """Return the up-to-date cached view of a filter tab, or None for the unfiltered tab"""
+        images = image_catalog.get_images(project_id, sort, order)
+        status = TAB_STATUS_FILTERS.get(tab)
+        if status is None:
+            return None
+
+        state = self.get(project_id)
+        version = state['version']
+        changes = list(state['changes'])
+        key = (project_id, tab, sort, order)
+        with self._lock:
+            cached = self._views.get(key)
+        if cached and cached['images'] is images:
+            if cached['version'] == version:
+                return cached
+            # An annotation save moves a single image in or out of the tab, so patch the
+            # cached list instead of filtering the whole catalog again
+            stems = self._changed_stems(changes, cached['version'], version)
+            if stems is not None:
+                view = self._patch_view(cached, state, status, stems, version, sort, order)
+                with self._lock:
+                    self._views[key] = view
+                return view
+
+        if status == 'annotated':
+            members = state['annotated']
+            filtered = [image for image in images if os.path.splitext(image['name'])[0] in members]
+        elif status == 'background':
+            members = state['background']
+            filtered = [image for image in images if os.path.splitext(image['name'])[0] in members]
+        else:
+            members = state['annotated']
+            filtered = [image for image in images if os.path.splitext(image['name'])[0] not in members]
+
+        view = {'images': images, 'version': version, 'filtered': filtered, 'keys': None, 'by_stem': None}
+        with self._lock:
+            self._views[key] = view
+        return view
+
+    def filter_images(self, project_id, tab, sort='uploaded', order='desc'):
+        """Return the catalog images in a filter tab, in the catalog's sort order.
+
+        Filtered lists are cached until the image listing changes; membership changes
+        are patched into them.
+        """
+        view = self._view(project_id, tab, sort, order)
+        if view is None:
+            return image_catalog.get_images(project_id, sort, order)
+        return view['filtered']
+
+    def neighbor(self, project_id, tab, image_name, direction, sort='uploaded', order='desc'):
+        """Return the image before or after image_name in a filter tab (with wrap-around).
+
+        Returns the first image if image_name is not in the tab and None if the tab is empty.
+        Filtered tabs are binary searched by sort key; catalog positions are cached until
+        the listing changes.
+        """
+        view = self._view(project_id, tab, sort, order)
+        if view is None:
+            images = image_catalog.get_images(project_id, sort, order)
+            key = (project_id, sort, order)
+            with self._lock:
+                cached = self._positions.get(key)
+            if cached and cached[0] is images:
+                positions = cached[1]
+            else:
+                positions = {image['name']: i for i, image in enumerate(images)}
+                with self._lock:
+                    self._positions[key] = (images, positions)
+            current_index = positions.get(image_name)
+        else:
+            images = view['filtered']
+            current_index = None
+            candidates = self._by_stem(view).get(os.path.splitext(image_name)[0], ())
+            image = next((image for image in candidates if image['name'] == image_name), None)
+            if image is not None:
+                keys = self._keys(view, sort)
+                sort_key = image_sort_key(image, sort)
+                index = self._search(keys, sort_key, order)
+                if index < len(keys) and keys[index] == sort_key:
+                    current_index = index
+
+        if not images:
+            return None
+        if current_index is None:
+            return images[0]
+        step = -1 if direction == 'previous' else 1
+        return images[(current_index + step) % len(images)]
+
+    def invalidate(self, project_id):
+        """Drop the in-memory state of a project"""
+        with self._lock:
+            self._states.pop(project_id, None)
+            for cache in (self._views, self._positions):
+                for key in [key for key in cache if key[0] == project_id]:
+                    del cache[key]
+
+
+filter_index = FilterMembershipIndex(PROJECTS_FOLDER)
+
+# Image metadata
+# Width, height, mode and format of every image are probed from the file header
+# when an upload is processed (Pillow opens images lazily, so no pixel data is
+# decoded) and returned by the listing endpoints. With the files backend they are
+# kept in an append-only log of [name, metadata] lines (metadata is null for a
+# removed image), rewritten once it holds mostly superseded lines.
+IMAGE_META_LOG_FILENAME = 'image_meta.log'
+IMAGE_META_COMPACT_MIN_LINES = 1000
+
+
+def open_image(path, max_pixels):
+    """Lazily open an image, refusing more than max_pixels pixels.
+
+    Image.open checks the process-wide Image.MAX_IMAGE_PIXELS instead; this identifies
+    the format the same way, from Pillow's plugin registry, so a higher limit for large
+    images doesn't lift the decompression-bomb check of other threads.
+    """
+    with open(path, 'rb') as f:
+        prefix = f.read(16)
+    for load_plugins in (Image.preinit, Image.init):
+        load_plugins()
+        for format_id in list(Image.ID):
+            factory, accept = Image.OPEN[format_id]
+            try:
+                result = not accept or accept(prefix)
+                if not result or isinstance(result, str):
+                    continue
+                # Given a path, the image owns its file and closes it with the image
+                img = factory(path)
+            except (SyntaxError, IndexError, TypeError, struct.error):
+                continue
+            if img.width * img.height > max_pixels:
+                img.close()
+                raise Image.DecompressionBombError(
+                    f"Image size ({img.width * img.height} pixels) exceeds limit of {max_pixels} pixels")
+            return img
+    raise UnidentifiedImageError(f"cannot identify image file {path!r}")
+
+
+def image_orientation(img):
+    """Return the EXIF orientation (1-8) of an opened image without decoding its pixels"""
+    if img.format == 'PNG' and 'exif' not in img.info:
+        # PngImageFile.getexif() decodes the image to look for an eXIf chunk after the pixels
+        return 1
+    orientation = img.getexif().get(ExifTags.Base.Orientation, 1)
+    return orientation if orientation in range(1, 9) else 1
+
+
+def probe_image(path):
+    """Read the displayed dimensions, mode, format and EXIF orientation of an image from its header.
+
+    Raises ValueError if the file is not a readable image.
+    """
+    try:
+        # Large images are served as tiles, so they are accepted up to the pyramid limit
+        with open_image(path, DEEPZOOM_MAX_IMAGE_PIXELS) as img:
+            orientation = image_orientation(img)
+            # Orientations 5-8 turn the image by 90 degrees, as browsers, thumbnails and tiles show it
+            width, height = (img.height, img.width) if orientation >= 5 else (img.width, img.height)
+            return {'width': width, 'height': height, 'mode': img.mode, 'format': img.format,
+                    'orientation': orientation}
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not probe image {path}: {str(e)}")
+        raise ValueError('Not a readable image')
+
+
+def oriented_metadata(metadata, path):
+    """Return metadata with the displayed dimensions of an image.
+
+    Images probed before the orientation was recorded (or not at all) are probed again.
+    """
+    if metadata is None or metadata.get('orientation') is None:
+        return probe_image(path)
+    return metadata
+
+
+class ImageMetadataCatalog:
+    """Persisted probe results of the images of each project"""
+
+    def __init__(self, projects_folder):
+        self.projects_folder = projects_folder
+        # project_id -> {'images': {name: metadata}, 'inode', 'offset', 'lines'}
+        self._states = {}
+        self._lock = threading.Lock()
+
+    def _log_path(self, project_id):
+        return os.path.join(self.projects_folder, project_id, IMAGE_META_LOG_FILENAME)
+
+    @staticmethod
+    def _read(state, log_path):
+        with open(log_path, 'r') as f:
+            f.seek(state['offset'])
+            for line in f:
+                if not line.endswith('\n'):
+                    # Partially written entry, read it next time
+                    break
+                name, metadata = json.loads(line)
+                if metadata is None:
+                    state['images'].pop(name, None)
+                else:
+                    state['images'][name] = metadata
+                state['offset'] += len(line.encode('utf-8'))
+                state['lines'] += 1
+
+    def _refresh(self, project_id):
+        log_path = self._log_path(project_id)
+        try:
+            stat = os.stat(log_path)
+        except FileNotFoundError:
+            self._states.pop(project_id, None)
+            return None
+        state = self._states.get(project_id)
+        if not state or state['inode'] != stat.st_ino or stat.st_size < state['offset']:
+            # First read, or the log was compacted by another process
+            state = {'images': {}, 'inode': stat.st_ino, 'offset': 0, 'lines': 0}
+            self._states[project_id] = state
+        if stat.st_size > state['offset']:
+            self._read(state, log_path)
+        return state
+
+    def get(self, project_id):
+        """Return {image name: metadata} of a project"""
+        with self._lock:
+            state = self._refresh(project_id)
+            return state['images'] if state else {}
+
+    def version(self, project_id):
+        """Return a value that changes whenever the project's log is written (None without a log)"""
+        try:
+            stat = os.stat(self._log_path(project_id))
+        except FileNotFoundError:
+            return None
+        return stat.st_ino, stat.st_size, stat.st_mtime_ns
+
+    def update(self, project_id, changes):
+        """Record {image name: metadata or None} changes of a project"""
+        if not changes:
+            return
+        project_path = os.path.join(self.projects_folder, project_id)
+        log_path = self._log_path(project_id)
+        lines = ''.join(json.dumps([name, metadata]) + '\n' for name, metadata in changes.items())
+        try:
+            with ProjectStatsLock(project_path), self._lock:
+                with open(log_path, 'a') as f:
+                    f.write(lines)
+                state = self._refresh(project_id)
+                if state['lines'] > max(IMAGE_META_COMPACT_MIN_LINES, 2 * len(state['images'])):
+                    self._write(project_id, state['images'])
+        except Exception as e:
+            logger.error(f"Failed to update image metadata for project {project_id}: {str(e)}")
+
+    def _write(self, project_id, images):
+        log_path = self._log_path(project_id)
+        tmp_path = f"{log_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            for name, metadata in images.items():
+                f.write(json.dumps([name, metadata]) + '\n')
+        os.replace(tmp_path, log_path)
+        self._states.pop(project_id, None)
+        self._refresh(project_id)
+
+    def rebuild(self, project_id):
+        """Probe every image of a project and rewrite its log, keeping the recorded upload times"""
+        project_path = os.path.join(self.projects_folder, project_id)
+        previous = self.get(project_id)
+        images = {}
+        for name in image_catalog.get_image_names(project_id):
+            try:
+                images[name] = probe_image(os.path.join(project_path, 'images', name))
+                if previous.get(name, {}).get('uploaded_ts'):
+                    images[name]['uploaded_ts'] = previous[name]['uploaded_ts']
+            except ValueError as e:
+                logger.warning(f"Unreadable image {name} in project {project_id}: {str(e)}")
+        with ProjectStatsLock(project_path), self._lock:
+            self._write(project_id, images)
+        return images
+
+    def invalidate(self, project_id):
+        """Drop the in-memory state of a project"""
+        with self._lock:
+            self._states.pop(project_id, None)
+
+
+image_metadata = ImageMetadataCatalog(PROJECTS_FOLDER)
+
+# Thumbnails
+# Every image gets downscaled copies in projects/<id>/thumbs/<size>/<image name>.<ext>,
+# generated by a Celery task after the upload has been processed (and on demand by
+# the thumbnail endpoint for images that don't have them yet). The sizes are the
+# longest side in pixels; each size is downscaled from the next larger one.
+THUMBNAILS_DIRNAME = 'thumbs'
+THUMBNAIL_SIZES = (128, 256, 512)
+THUMBNAIL_FORMAT = 'WEBP' if features.check('webp') else 'JPEG'
+THUMBNAIL_EXTENSION = '.webp' if THUMBNAIL_FORMAT == 'WEBP' else '.jpg'
+
+
+def thumbnail_path(project_path, size, filename):
+    """Return the path of the thumbnail of an image at a size"""
+    return os.path.join(project_path, THUMBNAILS_DIRNAME, str(size), f"{filename}{THUMBNAIL_EXTENSION}")
+
+
+def thumbnails_stale(project_path, filename, size=None):
+    """Return True if a thumbnail of the image is missing or older than the image"""
+    # Only mtimes are compared: st_ctime changes whenever the image gets another
+    # hardlink (dedup, exports). Replaced images have their derivatives rebuilt
+    # explicitly (see queue_image_derivatives), as a linked blob can be older.
+    image_changed = os.stat(os.path.join(project_path, 'images', filename)).st_mtime_ns
+    for thumb_size in ([size] if size else THUMBNAIL_SIZES):
+        try:
+            if os.stat(thumbnail_path(project_path, thumb_size, filename)).st_mtime_ns < image_changed:
+                return True
+        except FileNotFoundError:
+            return True
+    return False
+
+
+def generate_thumbnails(project_path, filename, force=False):
+    """Write all thumbnail sizes of an image; returns False if the image can't be read"""
+    if not force and not thumbnails_stale(project_path, filename):
+        return True
+
+    try:
+        with Image.open(os.path.join(project_path, 'images', filename)) as img:
+            # Let the JPEG decoder downscale while decoding
+            img.draft('RGB', (max(THUMBNAIL_SIZES), max(THUMBNAIL_SIZES)))
+            img = ImageOps.exif_transpose(img)
+            has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+            img = img.convert('RGBA' if has_alpha and THUMBNAIL_FORMAT == 'WEBP' else 'RGB')
+
+            for size in sorted(THUMBNAIL_SIZES, reverse=True):
+                img.thumbnail((size, size), Image.LANCZOS)
+                path = thumbnail_path(project_path, size, filename)
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+                img.save(tmp_path, THUMBNAIL_FORMAT, quality=80)
+                os.replace(tmp_path, path)
+    except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Could not generate thumbnails of {filename}: {str(e)}")
+        return False
+    return True
+
+
+def remove_thumbnails(project_path, filename):
+    """Remove the thumbnails of an image"""
+    for size in THUMBNAIL_SIZES:
+        try:
+            os.remove(thumbnail_path(project_path, size, filename))
+        except FileNotFoundError:
+            pass
+
+
+# Deep zoom tiles
+# Large images are also served as a Deep Zoom (DZI) tile pyramid, so a viewer only
+# fetches the tiles of its viewport and zoom level. The pyramid of an image lives in
+# projects/<id>/tiles/<image name>.dzi and <image name>_files/<level>/<col>_<row>.<ext>.
+# It is built by a Celery task at ingest for images larger than DEEPZOOM_MIN_SIZE,
+# and queued by the tile endpoints for any other image the first time it's viewed.
+# Building decodes the image once and halves it level by level.
+DEEPZOOM_DIRNAME = 'tiles'
+DEEPZOOM_TILE_SIZE = 256
+DEEPZOOM_OVERLAP = 1
+DEEPZOOM_MIN_SIZE = int(os.getenv('DEEPZOOM_MIN_SIZE', 4096))
+# Pillow refuses to open images above 2x Image.MAX_IMAGE_PIXELS as decompression
+# bombs. Uploads and pyramid builds accept images up to this many pixels (checked
+# per open, see open_image); everything else keeps Pillow's limit. A build decodes
+# the whole image, at 3 bytes per pixel (4 with alpha) plus a quarter for the next
+# level, so this also bounds its memory: about 5 GiB at the default 1 GiB pixels.
+DEEPZOOM_MAX_IMAGE_PIXELS = int(os.getenv('DEEPZOOM_MAX_IMAGE_PIXELS', 1024 ** 3))
+# A queued build that didn't finish within this time is assumed to have died
+DEEPZOOM_PENDING_TIMEOUT = 600
+
+# Builds hold a whole decoded image in memory, run one at a time per process
+deepzoom_lock = threading.Lock()
+
+
+def deepzoom_paths(project_path, filename):
+    """Return the descriptor path and tiles folder of an image's pyramid"""
+    tiles_path = os.path.join(project_path, DEEPZOOM_DIRNAME)
+    return os.path.join(tiles_path, f"{filename}.dzi"), os.path.join(tiles_path, f"{filename}_files")
+
+
+def deepzoom_descriptor(width, height, tile_format):
+    """Return the DZI XML descriptor of an image"""
+    return (
+        '<?xml version="1.0" encoding="UTF-8"?>\n'
+        f'<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" TileSize="{DEEPZOOM_TILE_SIZE}" '
+        f'Overlap="{DEEPZOOM_OVERLAP}" Format="{tile_format}"><Size Width="{width}" Height="{height}"/></Image>\n'
+    )
+
+
+def deepzoom_stale(project_path, filename):
+    """Return True if an image's pyramid is missing or older than the image"""
+    descriptor_path, _ = deepzoom_paths(project_path, filename)
+    image_changed = os.stat(os.path.join(project_path, 'images', filename)).st_mtime_ns
+    try:
+        return os.stat(descriptor_path).st_mtime_ns < image_changed
+    except FileNotFoundError:
+        return True
+
+
+def build_tile_pyramid(project_path, filename):
+    """Build the Deep Zoom pyramid of an image; returns False if the image can't be read"""
+    descriptor_path, tiles_dir = deepzoom_paths(project_path, filename)
+    os.makedirs(os.path.dirname(tiles_dir), exist_ok=True)
+
+    with deepzoom_lock, open(f"{tiles_dir}.lock", 'a') as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        if not deepzoom_stale(project_path, filename):
+            # Built by another process while we were waiting
+            return True
+
+        build_dir = f"{tiles_dir}.{uuid.uuid4().hex}.tmp"
+        try:
+            with open_image(os.path.join(project_path, 'images', filename), DEEPZOOM_MAX_IMAGE_PIXELS) as img:
+                # Tiles follow the orientation browsers display the image in
+                img = ImageOps.exif_transpose(img)
+                has_alpha = img.mode in ('RGBA', 'LA') or (img.mode == 'P' and 'transparency' in img.info)
+                img = img.convert('RGBA' if has_alpha else 'RGB')
+                tile_format, save_format = ('png', 'PNG') if has_alpha else ('jpg', 'JPEG')
+                width, height = img.size
+
+                level = max(width, height).bit_length() - 1
+                if 1 << level < max(width, height):
+                    level += 1
+                while True:
+                    write_pyramid_level(img, os.path.join(build_dir, str(level)), tile_format, save_format)
+                    if level == 0:
+                        break
+                    # Halve, rounding up, for the next level
+                    img = img.reduce(2) if min(img.size) > 1 else img.resize(
+                        ((img.width + 1) // 2, (img.height + 1) // 2))
+                    level -= 1
+        except (OSError, SyntaxError, ValueError, Image.DecompressionBombError) as e:
+            logger.warning(f"Could not build tile pyramid of {filename}: {str(e)}")
+            shutil.rmtree(build_dir, ignore_errors=True)
+            return False
+
+        shutil.rmtree(tiles_dir, ignore_errors=True)
+        os.rename(build_dir, tiles_dir)
+        tmp_path = f"{descriptor_path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, 'w') as f:
+            f.write(deepzoom_descriptor(width, height, tile_format))
+        os.replace(tmp_path, descriptor_path)
+    return True
+
+
+def write_pyramid_level(img, level_dir, tile_format, save_format):
+    """Cut one pyramid level into overlapping tiles"""
+    os.makedirs(level_dir, exist_ok=True)
+    width, height = img.size
+    for col in range((width + DEEPZOOM_TILE_SIZE - 1) // DEEPZOOM_TILE_SIZE):
+        for row in range((height + DEEPZOOM_TILE_SIZE - 1) // DEEPZOOM_TILE_SIZE):
+            left = col * DEEPZOOM_TILE_SIZE - (DEEPZOOM_OVERLAP if col else 0)
+            top = row * DEEPZOOM_TILE_SIZE - (DEEPZOOM_OVERLAP if row else 0)
+            right = min((col + 1) * DEEPZOOM_TILE_SIZE + DEEPZOOM_OVERLAP, width)
+            bottom = min((row + 1) * DEEPZOOM_TILE_SIZE + DEEPZOOM_OVERLAP, height)
+            img.crop((left, top, right, bottom)).save(
+                os.path.join(level_dir, f"{col}_{row}.{tile_format}"), save_format, quality=85)
+
+
+def request_tile_pyramid(project_id, filename):
+    """Queue a pyramid build unless one is already pending; returns True if the pyramid is ready"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    if not deepzoom_stale(project_path, filename):
+        return True
+
+    descriptor_path, tiles_dir = deepzoom_paths(project_path, filename)
+    pending_path = f"{tiles_dir}.pending"
+    os.makedirs(os.path.dirname(tiles_dir), exist_ok=True)
+    try:
+        if time.time() - os.stat(pending_path).st_mtime < DEEPZOOM_PENDING_TIMEOUT:
+            return False
+        os.remove(pending_path)
+    except FileNotFoundError:
+        pass
+    try:
+        os.close(os.open(pending_path, os.O_CREAT | os.O_EXCL | os.O_WRONLY))
+    except FileExistsError:
+        return False
+
+    build_tile_pyramid_task.delay(project_id, filename)
+    # Built inline when tasks run eagerly
+    return not deepzoom_stale(project_path, filename)
+
+
+def remove_tile_pyramid(project_path, filename):
+    """Remove the pyramid of an image"""
+    descriptor_path, tiles_dir = deepzoom_paths(project_path, filename)
+    shutil.rmtree(tiles_dir, ignore_errors=True)
+    for path in (descriptor_path, f"{tiles_dir}.lock", f"{tiles_dir}.pending"):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+# SQLite metadata store
+# Optional storage backend (STORAGE_BACKEND=sqlite) that keeps image and annotation
+# metadata of a project in projects/<id>/metadata.db, so filters, counts and
+# navigation become indexed queries instead of directory scans. Image files stay in
+# images/. With SQLITE_EXPORT_JSON enabled (the default) the annotation JSON files
+# are still written next to the database for compatibility with the files backend.
+# Existing projects are moved over with 'python app.py --migrate-sqlite'.
+METADATA_DB_FILENAME = 'metadata.db'
+
+# Tab name -> image status filter
+TAB_STATUS_FILTERS = {
+    'all-images': None,
+    'annotated-images': 'annotated',
+    'unannotated-images': 'unannotated',
+    'background-images': 'background'
+}
+
+
+def annotation_status(annotations):
+    """Return the status of an image (unannotated, annotated or background) from its annotations"""
+    summary = summarize_annotations(annotations)
+    if summary['background']:
+        return 'background'
+    if summary['annotated']:
+        return 'annotated'
+    return 'unannotated'
+
+
+class ProjectMetadataStore:
+    """Per-project SQLite database of images and annotations"""
+
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS project (
+            key TEXT PRIMARY KEY,
+            value TEXT NOT NULL
+        );
+        CREATE TABLE IF NOT EXISTS images (
+            name TEXT PRIMARY KEY,
+            uploaded_ts REAL NOT NULL,
+            status TEXT NOT NULL DEFAULT 'unannotated',
+            width INTEGER,
+            height INTEGER,
+            mode TEXT,
+            format TEXT,
+            orientation INTEGER
+        );
+        CREATE TABLE IF NOT EXISTS annotations (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            image_name TEXT NOT NULL,
+            position INTEGER NOT NULL,
+            type TEXT,
+            class_idx INTEGER,
+            data TEXT NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_images_uploaded ON images (uploaded_ts, name);
+        CREATE INDEX IF NOT EXISTS idx_images_status ON images (status, uploaded_ts, name);
+        CREATE INDEX IF NOT EXISTS idx_annotations_image ON annotations (image_name, position);
+        CREATE INDEX IF NOT EXISTS idx_annotations_class ON annotations (class_idx);
+    """
+
+    IMAGE_COLUMNS = 'name, uploaded_ts, width, height, mode, format, orientation'
+
+    # Status filter -> SQL condition on images.status
+    STATUS_CONDITIONS = {
+        None: ('1 = 1', ()),
+        'annotated': ("status IN ('annotated', 'background')", ()),
+        'unannotated': ("status = 'unannotated'", ()),
+        'background': ("status = 'background'", ())
+    }
+
+    def __init__(self, project_path):
+        self.project_path = project_path
+        self.db_path = os.path.join(project_path, METADATA_DB_FILENAME)
+        self.images_path = os.path.join(project_path, 'images')
+
+    @contextmanager
+    def connect(self):
+        """Open a connection, committing on success and rolling back on error"""
+        conn = sqlite3.connect(self.db_path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            conn.execute('PRAGMA synchronous=NORMAL')
+            yield conn
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+    # Columns added after the first schema version, created on existing databases by initialize()
+    IMAGE_METADATA_COLUMNS = (('width', 'INTEGER'), ('height', 'INTEGER'), ('mode', 'TEXT'), ('format', 'TEXT'),
+                              ('orientation', 'INTEGER'))
+
+    def initialize(self):
+        """Create the database in WAL mode with its schema"""
+        with self.connect() as conn:
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.executescript(self.SCHEMA)
+            existing = {row['name'] for row in conn.execute('PRAGMA table_info(images)')}
+            for column, column_type in self.IMAGE_METADATA_COLUMNS:
+                if column not in existing:
+                    conn.execute(f'ALTER TABLE images ADD COLUMN {column} {column_type}')
+
+    def exists(self):
+        return os.path.exists(self.db_path)
+
+    def set_config(self, config):
+        """Store the project config (name, created, classes, classColors)"""
+        with self.connect() as conn:
+            conn.executemany(
+                'INSERT INTO project (key, value) VALUES (?, ?) '
+                'ON CONFLICT(key) DO UPDATE SET value = excluded.value',
+                [(key, json.dumps(value)) for key, value in config.items()]
+            )
+
+    def add_image(self, name, uploaded_ts):
+        """Register an image; re-adding an existing name keeps its annotations"""
+        with self.connect() as conn:
+            conn.execute(
+                'INSERT INTO images (name, uploaded_ts, status) VALUES (?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET uploaded_ts = excluded.uploaded_ts',
+                (name, uploaded_ts, annotation_status(self._get_annotations(conn, name)))
+            )
+
+    def add_images(self, images):
+        """Register many (name, uploaded_ts, metadata) images in one transaction"""
+        with self.connect() as conn:
+            rows = [
+                (name, uploaded_ts, annotation_status(self._get_annotations(conn, name)),
+                 *((metadata or {}).get(field) for field in IMAGE_METADATA_FIELDS))
+                for name, uploaded_ts, metadata in images
+            ]
+            conn.executemany(
+                'INSERT INTO images (name, uploaded_ts, status, width, height, mode, format, orientation) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?) '
+                'ON CONFLICT(name) DO UPDATE SET uploaded_ts = excluded.uploaded_ts, '
+                'width = excluded.width, height = excluded.height, mode = excluded.mode, format = excluded.format, '
+                'orientation = excluded.orientation',
+                rows
+            )
+
+    def remove_image(self, name):
+        """Remove an image and its annotations"""
+        with self.connect() as conn:
+            conn.execute('DELETE FROM annotations WHERE image_name = ?', (name,))
+            conn.execute('DELETE FROM images WHERE name = ?', (name,))
+
+    def _get_annotations(self, conn, name):
+        rows = conn.execute(
+            'SELECT data FROM annotations WHERE image_name = ? ORDER BY position', (name,)
+        ).fetchall()
+        return [json.loads(row['data']) for row in rows]
+
+    def get_annotations(self, name):
+        """Return the annotations of an image (empty list if there are none)"""
+        with self.connect() as conn:
+            return self._get_annotations(conn, name)
+
+    def iter_annotations(self, status='annotated'):
+        """Yield (image, annotations) for the images matching a status filter in name order, from one query"""
+        condition, params = self.STATUS_CONDITIONS[status]
+        sql = (
+            f'SELECT {self.IMAGE_COLUMNS}, data FROM images '
+            f'LEFT JOIN annotations ON annotations.image_name = images.name '
+            f'WHERE {condition} ORDER BY name, position'
+        )
+        with self.connect() as conn:
+            for _, rows in groupby(conn.execute(sql, params), key=lambda row: row['name']):
+                rows = list(rows)
+                yield self._row_to_image(rows[0]), [json.loads(row['data']) for row in rows if row['data'] is not None]
+
+    def save_annotations(self, name, annotations):
+        """Replace the annotations of an image and update its status"""
+        rows = []
+        for position, annotation in enumerate(annotations if isinstance(annotations, list) else []):
+            annotation_type = annotation.get('type') if isinstance(annotation, dict) else None
+            class_idx = annotation.get('class', 0) if isinstance(annotation, dict) else None
+            rows.append((
+                name,
+                position,
+                annotation_type,
+                class_idx if isinstance(class_idx, int) else None,
+                json.dumps(annotation)
+            ))
+
+        with self.connect() as conn:
+            conn.execute('DELETE FROM annotations WHERE image_name = ?', (name,))
+            conn.executemany(
+                'INSERT INTO annotations (image_name, position, type, class_idx, data) VALUES (?, ?, ?, ?, ?)',
+                rows
+            )
+            conn.execute('UPDATE images SET status = ? WHERE name = ?', (annotation_status(annotations), name))
+
+    def get_stats(self):
+        """Return a stats record in the same format as the files stats index"""
+        stats = empty_project_stats()
+        with self.connect() as conn:
+            for row in conn.execute('SELECT status, COUNT(*) AS n FROM images GROUP BY status'):
+                stats['imageCount'] += row['n']
+                if row['status'] in ('annotated', 'background'):
+                    stats['annotatedCount'] += row['n']
+                if row['status'] == 'background':
+                    stats['backgroundCount'] += row['n']
+            for row in conn.execute(
+                'SELECT class_idx, COUNT(*) AS n FROM annotations '
+                'WHERE class_idx IS NOT NULL AND class_idx >= 0 AND image_name IN (SELECT name FROM images) '
+                'GROUP BY class_idx'
+            ):
+                stats['classCounts'][str(row['class_idx'])] = row['n']
+        return stats
+
+    def _row_to_image(self, row):
+        image = {
+            'name': row['name'],
+            'path': os.path.join(self.images_path, row['name']),
+            'uploaded': datetime.fromtimestamp(row['uploaded_ts']).isoformat(),
+            'uploaded_ts': row['uploaded_ts']
+        }
+        for field in IMAGE_METADATA_FIELDS:
+            image[field] = row[field]
+        return image
+
+    def count_images(self, status=None):
+        """Count the images matching a status filter"""
+        condition, params = self.STATUS_CONDITIONS[status]
+        with self.connect() as conn:
+            return conn.execute(f'SELECT COUNT(*) FROM images WHERE {condition}', params).fetchone()[0]
+
+    def query_images(self, status=None, sort='uploaded', order='desc', limit=None, cursor_key=None):
+        """Return images matching a status filter in sort order, starting after a keyset cursor"""
+        condition, params = self.STATUS_CONDITIONS[status]
+        params = list(params)
+        columns = 'uploaded_ts, name' if sort == 'uploaded' else 'name'
+        direction = 'DESC' if order == 'desc' else 'ASC'
+
+        if cursor_key is not None:
+            comparison = '<' if order == 'desc' else '>'
+            placeholders = ', '.join('?' for _ in cursor_key)
+            condition += f' AND ({columns}) {comparison} ({placeholders})'
+            params.extend(cursor_key)
+
+        order_by = ', '.join(f'{column} {direction}' for column in columns.split(', '))
+        sql = f'SELECT {self.IMAGE_COLUMNS} FROM images WHERE {condition} ORDER BY {order_by}'
+        if limit is not None:
+            sql += ' LIMIT ?'
+            params.append(limit)
+
+        with self.connect() as conn:
+            return [self._row_to_image(row) for row in conn.execute(sql, params)]
+
+    def get_image(self, name):
+        """Return a single image or None"""
+        with self.connect() as conn:
+            row = conn.execute(f'SELECT {self.IMAGE_COLUMNS} FROM images WHERE name = ?', (name,)).fetchone()
+        return self._row_to_image(row) if row else None
+
+    def neighbor_image(self, status, image_name, direction, sort='uploaded', order='desc'):
+        """Return the image before or after image_name in a status filter (with wrap-around).
+
+        Both lookups are single index seeks. Returns the first image if image_name doesn't
+        match the filter and None if the filter is empty.
+        """
+        first = self.query_images(status, sort, order, limit=1)
+        if not first:
+            return None
+
+        current = self.get_image(image_name)
+        condition, params = self.STATUS_CONDITIONS[status]
+        if current is not None:
+            with self.connect() as conn:
+                matches = conn.execute(
+                    f'SELECT COUNT(*) FROM images WHERE name = ? AND {condition}', (image_name, *params)
+                ).fetchone()[0]
+            if not matches:
+                current = None
+        if current is None:
+            return first[0]
+
+        # The previous image is the next one in the opposite order
+        if direction == 'previous':
+            order = 'asc' if order == 'desc' else 'desc'
+        neighbor = self.query_images(status, sort, order, limit=1, cursor_key=image_sort_key(current, sort))
+        if neighbor:
+            return neighbor[0]
+        # Wrap around to the other end
+        return self.query_images(status, sort, order, limit=1)[0]
+
+
+# Databases whose schema was brought up to date by this process
+upgraded_metadata_dbs = set()
+
+
+def get_metadata_store(project_path):
+    """Return the SQLite store of a project, or None if the files backend is used for it"""
+    if STORAGE_BACKEND != 'sqlite':
+        return None
+    store = ProjectMetadataStore(project_path)
+    if not store.exists():
+        return None
+    if store.db_path not in upgraded_metadata_dbs:
+        # Adds columns introduced after the database was created
+        store.initialize()
+        upgraded_metadata_dbs.add(store.db_path)
+    return store
+
+
+def store_image_list_response(store, status, sort, order, limit, cursor):
+    """Build a (paginated) image listing response from the SQLite store"""
+    cursor_key = decode_image_cursor(cursor, sort) if cursor else None
+    # Fetch one extra row to know whether there is a next page
+    images = store.query_images(status, sort, order, limit + 1 if limit is not None else None, cursor_key)
+    next_cursor = None
+    if limit is not None and len(images) > limit:
+        images = images[:limit]
+        next_cursor = encode_image_cursor(images[-1], sort)
+
+    body = {'images': [image_info_response(image) for image in images]}
+    if limit is not None:
+        body['next_cursor'] = next_cursor
+    response = jsonify(body)
+    response.headers['X-Total-Count'] = str(store.count_images(status))
+    return response
+
+
+def migrate_project_to_sqlite(project_path):
+    """Build (or rebuild) the SQLite store of a project from its directory layout"""
+    store = ProjectMetadataStore(project_path)
+    store.initialize()
+
+    with open(os.path.join(project_path, 'config.json'), 'r') as f:
+        config = json.load(f)
+
+    project_id = os.path.basename(project_path)
+    image_catalog.invalidate(project_id)
+    images = image_catalog.get_images(project_id)
+    metadata = image_metadata.get(project_id)
+    annotations_path = os.path.join(project_path, 'annotations')
+
+    image_rows = []
+    annotation_rows = []
+    for image in images:
+        annotations = []
+        annotation_file = os.path.join(annotations_path, f"{os.path.splitext(image['name'])[0]}.json")
+        if os.path.exists(annotation_file):
+            try:
+                with open(annotation_file, 'r') as f:
+                    annotations = json.load(f)
+            except (json.JSONDecodeError, IOError) as e:
+                logger.warning(f"Skipping unreadable annotation file {annotation_file}: {str(e)}")
+        if not isinstance(annotations, list):
+            annotations = []
+
+        image_meta = metadata.get(image['name'], {})
+        image_rows.append((
+            image['name'], image['uploaded_ts'], annotation_status(annotations),
+            *(image_meta.get(field) for field in IMAGE_METADATA_FIELDS)
+        ))
+        for position, annotation in enumerate(annotations):
+            class_idx = annotation.get('class', 0) if isinstance(annotation, dict) else None
+            annotation_rows.append((
+                image['name'],
+                position,
+                annotation.get('type') if isinstance(annotation, dict) else None,
+                class_idx if isinstance(class_idx, int) else None,
+                json.dumps(annotation)
+            ))
+
+    with store.connect() as conn:
+        conn.execute('DELETE FROM annotations')
+        conn.execute('DELETE FROM images')
+        conn.executemany(
+            'INSERT INTO images (name, uploaded_ts, status, width, height, mode, format, orientation) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            image_rows
+        )
+        conn.executemany(
+            'INSERT INTO annotations (image_name, position, type, class_idx, data) VALUES (?, ?, ?, ?, ?)',
+            annotation_rows
+        )
+    store.set_config(config)
+
+    return len(image_rows), len(annotation_rows)
+
+
+def get_project_stats(project_path):
+    """Return the stats record of a project from the active backend"""
+    store = get_metadata_store(project_path)
+    if store:
+        return store.get_stats()
+    return load_project_stats(project_path)
+
+
+def save_image_annotations(project_path, image_name, annotations):
+    """Save the annotations of an image and keep the stats index in sync"""
+    annotations_path = os.path.join(project_path, 'annotations')
+    os.makedirs(annotations_path, exist_ok=True)
+    annotation_file = os.path.join(annotations_path, f"{os.path.splitext(image_name)[0]}.json")
+
+    store = get_metadata_store(project_path)
+    new_summary = summarize_annotations(annotations)
+    # The previous annotations are read under the stats lock, so concurrent saves of
+    # the same image replace each other's summary instead of both removing the old one
+    with ProjectStatsLock(project_path):
+        if store:
+            old_summary = summarize_annotations(store.get_annotations(image_name))
+            store.save_annotations(image_name, annotations)
+        else:
+            old_summary = read_annotation_summary(annotation_file)
+
+        if not store or SQLITE_EXPORT_JSON:
+            with open(annotation_file, 'w') as f:
+                json.dump(annotations, f)
+
+        try:
+            apply_project_stats_change(project_path, old_summary=old_summary, new_summary=new_summary)
+        except Exception as e:
+            logger.error(f"Failed to update stats for {project_path}: {str(e)}")
+    filter_index.update(os.path.basename(project_path), os.path.splitext(image_name)[0], new_summary)
+
+# Upload ingestion
+# Multipart uploads to the upload endpoints are spooled straight into
+# projects/<id>/.incoming (same filesystem as images/), so the finished file can
+# be renamed into place and every byte is written to disk only once.
+INCOMING_DIRNAME = '.incoming'
+UPLOAD_ENDPOINTS = {'upload_image', 'upload_image_batch', 'upload_archive'}
+
+
+def umask_file_mode():
+    """Return the mode open() gives new files under the process umask"""
+    umask = os.umask(0)
+    os.umask(umask)
+    return 0o666 & ~umask
+
+
+# Spool files are created 0600 by tempfile; they get this mode before they are
+# moved into images/, like files written there directly. Read once at import,
+# as changing the umask isn't thread-safe.
+UPLOAD_FILE_MODE = umask_file_mode()
+
+
+def incoming_dir(project_path):
+    """Return the folder holding in-flight uploads of a project"""
+    return os.path.join(project_path, INCOMING_DIRNAME)
+
+
+class HashingSpoolFile:
+    """Spool file wrapper that computes the SHA-256 of the bytes written to it"""
+
+    def __init__(self, file):
+        self._file = file
+        self._hash = hashlib.sha256()
+
+    def write(self, data):
+        self._hash.update(data)
+        return self._file.write(data)
+
+    def hexdigest(self):
+        return self._hash.hexdigest()
+
+    def __iter__(self):
+        return iter(self._file)
+
+    def __getattr__(self, name):
+        return getattr(self._file, name)
+
+
+class UploadRequest(Request):
+    """Request that spools file parts of upload endpoints into the project's incoming folder"""
+
+    def _get_file_stream(self, total_content_length, content_type, filename=None, content_length=None):
+        project_id = (self.view_args or {}).get('project_id')
+        if self.endpoint in UPLOAD_ENDPOINTS and project_id and not project_id.startswith('.'):
+            project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+            if os.path.isdir(project_path):
+                spool_dir = incoming_dir(project_path)
+                os.makedirs(spool_dir, exist_ok=True)
+                stream = tempfile.NamedTemporaryFile('wb+', dir=spool_dir, prefix='upload_', delete=False)
+                self.__dict__.setdefault('upload_temp_paths', []).append(stream.name)
+                return HashingSpoolFile(stream) if UPLOAD_DEDUP else stream
+        return super()._get_file_stream(total_content_length, content_type, filename, content_length)
+
+    def close(self):
+        super().close()
+        # Remove spooled parts that were not moved into place (failed or rejected uploads)
+        for path in self.__dict__.get('upload_temp_paths', []):
+            try:
+                if os.path.exists(path):
+                    os.remove(path)
+            except OSError as e:
+                logger.warning(f"Could not remove temporary upload file {path}: {str(e)}")
+
+
+app.request_class = UploadRequest
+
+
+# Upload admission control
+# Uploads are refused with 429 and a Retry-After header while a project, or the
+# whole server, has too many files queued for processing or too many bytes spooled
+# in incoming folders, so a few large drops can't starve interactive requests.
+# Queued files are tracked in Redis sorted sets scored by enqueue time (shared by
+# all web processes); a limit of 0 disables it.
+UPLOAD_MAX_QUEUED_PER_PROJECT = int(os.getenv('UPLOAD_MAX_QUEUED_PER_PROJECT', 5000))
+UPLOAD_MAX_QUEUED = int(os.getenv('UPLOAD_MAX_QUEUED', 20000))
+UPLOAD_MAX_INCOMING_BYTES_PER_PROJECT = int(os.getenv('UPLOAD_MAX_INCOMING_BYTES_PER_PROJECT', 10 * 1024 ** 3))
+UPLOAD_MAX_INCOMING_BYTES = int(os.getenv('UPLOAD_MAX_INCOMING_BYTES', 50 * 1024 ** 3))
+UPLOAD_RETRY_AFTER = int(os.getenv('UPLOAD_RETRY_AFTER', 10))
+# Summing the incoming folders of every project is cached this long per process
+INCOMING_USAGE_CACHE_SECONDS = 2
+ADMISSION_ENDPOINTS = UPLOAD_ENDPOINTS | {'create_resumable_upload'}
+
+incoming_usage_cache = {'time': 0, 'bytes': 0}
+incoming_usage_lock = threading.Lock()
+
+
+def upload_queue_key(project_id=None):
+    """Return the Redis sorted set of queued upload files, for a project or the whole server"""
+    return f"upload_queue:{project_id}" if project_id else "upload_queue"
+
+
+def enqueue_uploads(pipe, project_id, members):
+    """Count files as queued for processing until release_uploads() is called for them"""
+    if not members:
+        return
+    now = time.time()
+    for key in (upload_queue_key(project_id), upload_queue_key()):
+        pipe.zadd(key, {member: now for member in members})
+        pipe.expire(key, UPLOAD_TASK_TTL)
+
+
+def release_uploads(pipe, project_id, members):
+    """Stop counting processed (or failed) files as queued"""
+    if not members:
+        return
+    for key in (upload_queue_key(project_id), upload_queue_key()):
+        pipe.zrem(key, *members)
+
+
+def upload_queue_depth(project_id):
+    """Return (files queued for the project, files queued on the server)"""
+    # Entries left behind by lost tasks expire with the task state
+    cutoff = time.time() - UPLOAD_TASK_TTL
+    pipe = redis_client.pipeline(transaction=False)
+    for key in (upload_queue_key(project_id), upload_queue_key()):
+        pipe.zremrangebyscore(key, '-inf', cutoff)
+        pipe.zcard(key)
+    results = pipe.execute()
+    return results[1], results[3]
+
+
+def directory_size(path):
+    """Return the total size of the files directly inside path (0 if it doesn't exist)"""
+    total = 0
+    try:
+        with os.scandir(path) as entries:
+            for entry in entries:
+                try:
+                    if entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    # Moved into place while we were scanning
+                    pass
+    except FileNotFoundError:
+        pass
+    return total
+
+
+def total_incoming_bytes():
+    """Return the bytes spooled in the incoming folders of all projects"""
+    with incoming_usage_lock:
+        if time.time() - incoming_usage_cache['time'] < INCOMING_USAGE_CACHE_SECONDS:
+            return incoming_usage_cache['bytes']
+        total = 0
+        projects_folder = app.config['PROJECTS_FOLDER']
+        if os.path.isdir(projects_folder):
+            with os.scandir(projects_folder) as entries:
+                for entry in entries:
+                    if entry.is_dir() and not entry.name.startswith('.'):
+                        total += directory_size(incoming_dir(entry.path))
+        incoming_usage_cache.update(time=time.time(), bytes=total)
+        return total
+
+
+def upload_load(project_id):
+    """Return the queue depth and incoming usage of a project and of the server, with their limits"""
+    queued, total_queued = upload_queue_depth(project_id)
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    return {
+        'queued': queued,
+        'max_queued': UPLOAD_MAX_QUEUED_PER_PROJECT,
+        'total_queued': total_queued,
+        'max_total_queued': UPLOAD_MAX_QUEUED,
+        'incoming_bytes': directory_size(incoming_dir(project_path)),
+        'max_incoming_bytes': UPLOAD_MAX_INCOMING_BYTES_PER_PROJECT,
+        'total_incoming_bytes': total_incoming_bytes(),
+        'max_total_incoming_bytes': UPLOAD_MAX_INCOMING_BYTES
+    }
+
+
+def over_limit(used, incoming, limit):
+    """Whether adding incoming to used exceeds limit (0 means unlimited)"""
+    # A single request larger than the limit is let in once nothing else is pending,
+    # since waiting would never make room for it
+    return bool(limit) and used > 0 and used + incoming > limit
+
+
+@app.before_request
+def admit_upload():
+    """Refuse new uploads with 429 while the upload queue or incoming folders are full"""
+    if request.endpoint not in ADMISSION_ENDPOINTS or request.method != 'POST':
+        return None
+    project_id = (request.view_args or {}).get('project_id')
+    if not project_id or not os.path.isdir(os.path.join(app.config['PROJECTS_FOLDER'], project_id)):
+        return None
+
+    # Runs before the body is parsed, so a refused upload is never spooled to disk
+    if request.endpoint == 'create_resumable_upload':
+        try:
+            incoming = max(int((request.get_json(silent=True) or {}).get('size') or 0), 0)
+        except (TypeError, ValueError):
+            incoming = 0
+    else:
+        incoming = request.content_length or 0
+
+    try:
+        load = upload_load(project_id)
+    except Exception as e:
+        logger.error(f"Failed to check upload load: {str(e)}")
+        return None
+
+    reason = None
+    if UPLOAD_MAX_QUEUED_PER_PROJECT and load['queued'] >= UPLOAD_MAX_QUEUED_PER_PROJECT:
+        reason = 'Too many uploads queued for this project'
+    elif UPLOAD_MAX_QUEUED and load['total_queued'] >= UPLOAD_MAX_QUEUED:
+        reason = 'Too many uploads queued on the server'
+    elif over_limit(load['incoming_bytes'], incoming, UPLOAD_MAX_INCOMING_BYTES_PER_PROJECT):
+        reason = 'Too much upload data pending for this project'
+    elif over_limit(load['total_incoming_bytes'], incoming, UPLOAD_MAX_INCOMING_BYTES):
+        reason = 'Too much upload data pending on the server'
+    if reason is None:
+        return None
+
+    logger.info(f"Refused upload to project {project_id}: {reason}")
+    response = jsonify({'error': f'{reason}, retry later', 'retry_after': UPLOAD_RETRY_AFTER, **load})
+    response.status_code = 429
+    response.headers['Retry-After'] = str(UPLOAD_RETRY_AFTER)
+    return response
+
+
+def save_upload_stream(file, project_path):
+    """Return the path of a temp file with the uploaded content on the project's filesystem"""
+    stream = file.stream
+    temp_file_path = getattr(stream, 'name', None)
+    spool_dir = incoming_dir(project_path)
+    if isinstance(temp_file_path, str) and os.path.dirname(os.path.abspath(temp_file_path)) == os.path.abspath(spool_dir):
+        stream.flush()
+        return temp_file_path
+
+    # The part was not spooled by UploadRequest (e.g. it was kept in memory)
+    os.makedirs(spool_dir, exist_ok=True)
+    temp_file_path = os.path.join(spool_dir, f"{uuid.uuid4()}_{os.path.basename(file.filename)}")
+    file.save(temp_file_path)
+    return temp_file_path
+
+
+def place_uploaded_file(source_path, file_path):
+    """Atomically move an uploaded file to its final path, copying only across filesystems"""
+    os.chmod(source_path, UPLOAD_FILE_MODE)
+    try:
+        os.replace(source_path, file_path)
+    except OSError as e:
+        if e.errno != errno.EXDEV:
+            raise
+        # Copy next to the destination first so the final rename stays atomic
+        partial_path = f"{file_path}.{uuid.uuid4().hex}.part"
+        shutil.copyfile(source_path, partial_path)
+        os.replace(partial_path, file_path)
+        os.remove(source_path)
+
+
+# Content-addressed deduplication
+# With UPLOAD_DEDUP enabled, uploaded content is stored once under
+# projects/.blobs/<aa>/<sha256> and hardlinked into each project's images/
+# folder. A sidecar <sha256>.json records where the content was first ingested,
+# which is what uploads of the same bytes report as duplicate_of.
+BLOBS_DIRNAME = '.blobs'
+HASH_BUFFER_SIZE = 1024 * 1024
+
+
+def blob_path(digest):
+    """Return the path of the blob holding content with the given SHA-256"""
+    return os.path.join(app.config['PROJECTS_FOLDER'], BLOBS_DIRNAME, digest[:2], digest)
+
+
+def hash_file(path):
+    """Return the SHA-256 hex digest of a file"""
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_BUFFER_SIZE), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def upload_digest(file):
+    """Return the SHA-256 computed while an upload was spooled, or None"""
+    hexdigest = getattr(file.stream, 'hexdigest', None)
+    return hexdigest() if callable(hexdigest) else None
+
+
+def read_blob_origin(digest):
+    """Return the project and filename a blob was first ingested as, or None"""
+    try:
+        with open(f"{blob_path(digest)}.json", 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def link_into_place(source_path, file_path):
+    """Atomically make file_path a hardlink of source_path, copying if links are not possible"""
+    partial_path = f"{file_path}.{uuid.uuid4().hex}.part"
+    try:
+        os.link(source_path, partial_path)
+    except OSError:
+        # Different filesystem or no hardlink support
+        shutil.copyfile(source_path, partial_path)
+    os.replace(partial_path, file_path)
+
+
+def ingest_uploaded_file(source_path, file_path, project_id, digest=None):
+    """Move an uploaded file into place, deduplicating it when UPLOAD_DEDUP is enabled.
+
+    Returns the origin of the existing content when the upload was a duplicate, else None.
+    """
+    if not UPLOAD_DEDUP:
+        place_uploaded_file(source_path, file_path)
+        return None
+
+    digest = digest or hash_file(source_path)
+    blob = blob_path(digest)
+    os.makedirs(os.path.dirname(blob), exist_ok=True)
+    # The blob and every link to it share the mode of the upload
+    os.chmod(source_path, UPLOAD_FILE_MODE)
+    try:
+        # Creating the blob as a link of the upload is atomic, so concurrent uploads of
+        # the same content agree on which one was first
+        os.link(source_path, blob)
+    except FileExistsError:
+        link_into_place(blob, file_path)
+        os.remove(source_path)
+        origin = read_blob_origin(digest) or {}
+        return {'sha256': digest, 'project_id': origin.get('project_id'), 'filename': origin.get('filename')}
+    except OSError as e:
+        logger.warning(f"Could not add upload to the blob store, storing it without deduplication: {str(e)}")
+        place_uploaded_file(source_path, file_path)
+        return None
+
+    with open(f"{blob}.json", 'w') as f:
+        json.dump({'project_id': project_id, 'filename': os.path.basename(file_path)}, f)
+    place_uploaded_file(source_path, file_path)
+    return None
+
+
+def link_existing_content(digest, file_path):
+    """Link stored content into file_path without an upload; returns its origin or None if unknown"""
+    blob = blob_path(digest)
+    try:
+        link_into_place(blob, file_path)
+    except FileNotFoundError:
+        return None
+    origin = read_blob_origin(digest) or {}
+    return {'sha256': digest, 'project_id': origin.get('project_id'), 'filename': origin.get('filename')}
+
+
+def gc_blobs():
+    """Remove blobs no project links to any more; returns the number removed"""
+    blobs_root = os.path.join(app.config['PROJECTS_FOLDER'], BLOBS_DIRNAME)
+    removed = 0
+    if not os.path.isdir(blobs_root):
+        return removed
+    for prefix in os.scandir(blobs_root):
+        if not prefix.is_dir():
+            continue
+        for entry in os.scandir(prefix.path):
+            if entry.name.endswith('.json') or not entry.is_file():
+                continue
+            if entry.stat().st_nlink <= 1:
+                os.remove(entry.path)
+                try:
+                    os.remove(f"{entry.path}.json")
+                except FileNotFoundError:
+                    pass
+                removed += 1
+    return removed
+
+
+# Resumable uploads
+# A resumable upload is created with its final size, which preallocates a sparse
+# .part file in the project's incoming folder. Byte ranges are PUT with a
+# Content-Range header and written at their offsets; the received ranges are kept
+# in Redis as start -> end fields so an interrupted client can ask what is missing.
+# Part files whose state has expired are removed when an upload is created and
+# periodically by Celery beat.
+RESUMABLE_WRITE_BUFFER = 1024 * 1024
+# Largest file a resumable upload can be created for (0 disables the limit)
+RESUMABLE_MAX_SIZE = int(os.getenv('RESUMABLE_MAX_SIZE', 10 * 1024 ** 3))
+RESUMABLE_CLEANUP_INTERVAL = int(os.getenv('RESUMABLE_CLEANUP_INTERVAL', 3600))
+
+
+def resumable_upload_key(upload_id):
+    """Return the Redis key holding a resumable upload's metadata"""
+    return f"resumable_upload:{upload_id}"
+
+
+def parse_content_range(header, size):
+    """Parse 'bytes start-end/total' into a half-open (start, end) range.
+
+    Raises ValueError for malformed headers; the range may still extend past size.
+    """
+    if not header or not header.startswith('bytes '):
+        raise ValueError('Content-Range header must be of the form "bytes start-end/total"')
+    try:
+        byte_range, total = header[len('bytes '):].split('/')
+        start, end = (int(value) for value in byte_range.split('-'))
+    except ValueError:
+        raise ValueError(f'Invalid Content-Range header: {header}')
+    if total not in ('*', str(size)):
+        raise ValueError(f'Content-Range total does not match upload size {size}')
+    if start < 0 or end < start:
+        raise ValueError(f'Invalid Content-Range header: {header}')
+    return start, end + 1
+
+
+def merge_ranges(ranges):
+    """Merge overlapping or adjacent half-open ranges"""
+    merged = []
+    for start, end in sorted(ranges):
+        if merged and start <= merged[-1][1]:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def missing_ranges(received, size):
+    """Return the half-open ranges of [0, size) not covered by the merged received ranges"""
+    missing = []
+    position = 0
+    for start, end in received:
+        if start > position:
+            missing.append([position, start])
+        position = max(position, end)
+    if position < size:
+        missing.append([position, size])
+    return missing
+
+
+def get_resumable_upload(project_id, upload_id):
+    """Return the metadata of a resumable upload of the project, or None"""
+    upload = redis_client.hgetall(resumable_upload_key(upload_id))
+    if not upload:
+        return None
+    upload = {key.decode('utf-8'): value.decode('utf-8') for key, value in upload.items()}
+    if upload.get('project_id') != project_id:
+        return None
+    upload['size'] = int(upload['size'])
+    return upload
+
+
+def resumable_upload_ranges(upload_id, size):
+    """Return the received and missing ranges of a resumable upload"""
+    ranges = redis_client.hgetall(f"{resumable_upload_key(upload_id)}:ranges")
+    received = merge_ranges((int(start), int(end)) for start, end in ranges.items())
+    return received, missing_ranges(received, size)
+
+
+def remove_expired_resumable_parts(spool_dir):
+    """Remove part files of resumable uploads whose Redis state has expired"""
+    cutoff = time.time() - UPLOAD_TASK_TTL
+    with os.scandir(spool_dir) as entries:
+        for entry in entries:
+            if entry.name.startswith('resumable_') and entry.name.endswith('.part'):
+                try:
+                    if entry.stat().st_mtime < cutoff:
+                        os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+
+@celery.task(queue=BULK_QUEUE, priority=PRIORITY_LOW)
+def remove_expired_resumable_parts_task():
+    """Celery task removing expired resumable upload parts of every project"""
+    projects_folder = app.config['PROJECTS_FOLDER']
+    for name in os.listdir(projects_folder):
+        spool_dir = incoming_dir(os.path.join(projects_folder, name))
+        if os.path.isdir(spool_dir):
+            remove_expired_resumable_parts(spool_dir)
+    return {'success': True}
+
+
+celery.conf.beat_schedule = {
+    'remove-expired-resumable-parts': {
+        'task': remove_expired_resumable_parts_task.name,
+        'schedule': RESUMABLE_CLEANUP_INTERVAL
+    }
+}
+
+
+def write_upload_range(part_path, start, end, stream):
+    """Copy the request body into part_path at start; returns the number of bytes written"""
+    written = 0
+    with open(part_path, 'r+b') as part:
+        part.seek(start)
+        while written < end - start:
+            chunk = stream.read(min(RESUMABLE_WRITE_BUFFER, end - start - written))
+            if not chunk:
+                break
+            part.write(chunk)
+            written += len(chunk)
+    return written
+
+
+def probe_upload(path, filename):
+    """Probe an uploaded file; returns None for files without an image extension.
+
+    Raises ValueError if an image file can't be read, so it can be rejected at ingest.
+    """
+    if not filename.lower().endswith(IMAGE_EXTENSIONS):
+        return None
+    return probe_image(path)
+
+
+def register_uploaded_images(project_path, entries):
+    """Update the project indexes for images moved into images/.
+
+    entries is a list of (filename, is_new_image, metadata); returns the image info of each entry.
+    """
+    images_path = os.path.join(project_path, 'images')
+    new_images = sum(
+        1 for filename, is_new_image, _ in entries
+        if is_new_image and filename.lower().endswith(IMAGE_EXTENSIONS)
+    )
+
+    # Keep the stats index in sync; re-uploading an existing name replaces it
+    if new_images:
+        update_project_stats(project_path, image_delta=new_images)
+
+    # The upload time is recorded here rather than read from st_ctime later, which
+    # changes whenever the file gets another hardlink (dedup, exports)
+    uploaded_ts = time.time()
+    store = get_metadata_store(project_path)
+    if store:
+        store.add_images([(filename, uploaded_ts, metadata) for filename, _, metadata in entries])
+    else:
+        image_metadata.update(os.path.basename(project_path), {
+            filename: {**metadata, 'uploaded_ts': uploaded_ts} for filename, _, metadata in entries if metadata
+        })
+
+    now = datetime.fromtimestamp(uploaded_ts).isoformat()
+    return [
+        image_info_response(
+            {'name': filename, 'path': os.path.join(images_path, filename), 'uploaded': now},
+            metadata or {}
+        )
+        for filename, _, metadata in entries
+    ]
+
+
+def queue_image_derivatives(project_id, entries):
+    """Queue thumbnail (and, for large images, tile pyramid) generation of registered images"""
+    thumbnail_names = [filename for filename, _, metadata in entries if metadata]
+    if thumbnail_names:
+        generate_thumbnails_task.delay(project_id, thumbnail_names)
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    for filename, is_new_image, metadata in entries:
+        if not is_new_image:
+            # The replacement may be a linked blob older than the existing pyramid
+            remove_tile_pyramid(project_path, filename)
+        if metadata and max(metadata['width'], metadata['height']) > DEEPZOOM_MIN_SIZE:
+            build_tile_pyramid_task.delay(project_id, filename)
+
+
+def get_task_redis_client():
+    """Return a Redis client for use inside Celery tasks"""
+    # Use the global Redis client if available, otherwise initialize a new one
+    if redis_client and not isinstance(redis_client, SimpleRedisClient):
+        return redis_client
+
+    # Initialize Redis client for this task using the retry function
+    try:
+        logger.info("Initializing new Redis client for task")
+        return initialize_redis_with_retries(max_retries=3, initial_delay=2)
+    except Exception as e:
+        logger.error(f"Failed to connect to Redis for task: {e}")
+        # Fall back to the global redis client
+        return redis_client
+
+def publish_upload_progress(task_redis_client, task_id, project_id, filename, progress,
+                            status='processing', event_type='upload_progress', additional_data=None, state=None):
+    """Update an upload task's status in Redis and publish it as a Socket.IO event.
+
+    The state update (plus any extra state fields), its expiry and the event go out
+    in a single pipelined round trip.
+    """
+    try:
+        task_state = {'progress': str(progress)}
+        if status:
+            task_state['status'] = status
+        if state:
+            task_state.update(state)
+        pipe = task_redis_client.pipeline(transaction=False)
+        write_task_state(task_redis_client, f"upload_task:{task_id}", task_state, pipe)
+        if status in ('completed', 'failed'):
+            pipe.zrem(project_uploads_key(project_id), task_id)
+            release_uploads(pipe, project_id, [task_id])
+
+        # Prepare and publish event
+        event_data = {
+            'task_id': task_id,
+            'project_id': project_id,
+            'filename': filename,
+            'progress': progress,
+            'status': status
+        }
+
+        # Add any additional data
+        if additional_data:
+            event_data.update(additional_data)
+
+        # Publish event
+        pipe.publish('socketio_events', json.dumps({
+            'event': event_type,
+            'data': event_data
+        }))
+        pipe.execute()
+
+        logger.info(f"Task {task_id}: {status} ({progress}%)")
+    except Exception as e:
+        logger.error(f"Error updating progress: {e}")
+
+# Celery task for processing uploads
+@celery.task(bind=True, queue=INTERACTIVE_QUEUE, priority=PRIORITY_HIGH)
+def process_upload_task(self_or_task, project_id, filename, source_path, is_new_image=None, metadata=None):
+    """
+    Celery task for processing an uploaded image.
+    This runs asynchronously to avoid blocking the main thread.
+    The image is normally already in place (source_path is its final path) and probed
+    (metadata); the task only updates the project indexes and reports progress.
+    """
+    # Get task ID
+    task_id = getattr(self_or_task, 'id', None) or self_or_task.request.id
+
+    task_redis_client = get_task_redis_client()
+
+    # Helper function to update progress and publish events
+    def update_progress(progress, status='processing', event_type='upload_progress', additional_data=None):
+        # Failures keep their error in the task state for the status endpoint
+        state = {'error': additional_data['error']} if additional_data and 'error' in additional_data else None
+        publish_upload_progress(task_redis_client, task_id, project_id, filename,
+                                progress, status, event_type, additional_data, state)
+
+    try:
+        # Initialize task
+        update_progress(0, 'processing')
+
+        # Set up project directories
+        project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+        images_path = os.path.join(project_path, 'images')
+        try:
+            os.makedirs(images_path, exist_ok=True)
+        except Exception as e:
+            logger.error(f"Failed to create images directory: {str(e)}")
+            update_progress(0, 'failed', 'upload_failed', {'error': f"Failed to create images directory: {str(e)}"})
+            return {'success': False, 'error': f"Failed to create images directory: {str(e)}"}
+
+        # Update progress to 25%
+        update_progress(25)
+
+        # upload_image() has already moved the file into images/, so there is nothing
+        # to copy. Tasks queued with a file outside images/ (e.g. by an older web
+        # process) are moved into place here.
+        file_path = os.path.join(images_path, filename)
+        if os.path.abspath(source_path) != os.path.abspath(file_path):
+            if is_new_image is None:
+                is_new_image = not os.path.exists(file_path)
+            try:
+                place_uploaded_file(source_path, file_path)
+            except Exception as e:
+                logger.error(f"Failed to move uploaded file into place: {str(e)}")
+                update_progress(0, 'failed', 'upload_failed', {'error': f"Failed to move uploaded file into place: {str(e)}"})
+                return {'success': False, 'error': f"Failed to move uploaded file into place: {str(e)}"}
+        elif not os.path.exists(file_path):
+            update_progress(0, 'failed', 'upload_failed', {'error': 'Uploaded file not found'})
+            return {'success': False, 'error': 'Uploaded file not found'}
+
+        # Probe the image header if the upload endpoint didn't
+        if metadata is None:
+            try:
+                metadata = probe_upload(file_path, filename)
+            except ValueError as e:
+                if is_new_image:
+                    os.remove(file_path)
+                update_progress(0, 'failed', 'upload_failed', {'error': str(e)})
+                return {'success': False, 'error': str(e)}
+
+        # Update the stats index and metadata store, and create image info
+        image_info = register_uploaded_images(project_path, [(filename, is_new_image, metadata)])[0]
+
+        # Update progress to 75%
+        update_progress(75)
+
+        # Store image info and mark as completed
+        publish_upload_progress(task_redis_client, task_id, project_id, filename, 100, 'completed',
+                                'upload_completed', {'image_info': image_info},
+                                {'image_info': json.dumps(image_info)})
+
+        # Thumbnails are a separate stage so they don't delay the completion event
+        queue_image_derivatives(project_id, [(filename, is_new_image, metadata)])
+
+        return {'success': True, 'image': image_info}
+
+    except Exception as e:
+        # Handle errors
+        logger.error(f"Error processing upload: {e}")
+        update_progress(0, 'failed', 'upload_failed', {'error': str(e)})
+        return {'success': False, 'error': str(e)}
+
+def batch_upload_route(file_count):
+    """Return the queue and priority of a batch upload's tasks: small batches are interactive"""
+    if file_count <= UPLOAD_INTERACTIVE_MAX_FILES:
+        return {'queue': INTERACTIVE_QUEUE, 'priority': PRIORITY_NORMAL}
+    return {'queue': BULK_QUEUE, 'priority': PRIORITY_NORMAL}
+
+
+def batch_upload_member(batch_id, filename):
+    """Return the upload queue member of one file of a batch"""
+    return f"{batch_id}/{filename}"
+
+
+@celery.task(bind=True, queue=BULK_QUEUE)
+def process_upload_chunk_task(self_or_task, project_id, batch_id, entries):
+    """
+    Celery task for processing one chunk of a batch upload.
+    entries is a list of [filename, is_new_image, metadata] for files already placed in images/.
+    Progress is reported per batch rather than per file.
+    """
+    task_redis_client = get_task_redis_client()
+    batch_key = f"upload_batch:{batch_id}"
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    images_path = os.path.join(project_path, 'images')
+
+    present = []
+    for filename, is_new_image, metadata in entries:
+        file_path = os.path.join(images_path, filename)
+        if not os.path.exists(file_path):
+            continue
+        if metadata is None:
+            try:
+                metadata = probe_upload(file_path, filename)
+            except ValueError as e:
+                logger.warning(f"Rejected {filename} in batch {batch_id}: {str(e)}")
+                if is_new_image:
+                    os.remove(file_path)
+                continue
+        present.append((filename, is_new_image, metadata))
+    failed = len(entries) - len(present)
+    error = None
+    try:
+        image_infos = register_uploaded_images(project_path, present) if present else []
+    except Exception as e:
+        logger.error(f"Error processing upload batch {batch_id}: {e}")
+        image_infos = []
+        failed = len(entries)
+        error = str(e)
+
+    try:
+        pipe = task_redis_client.pipeline(transaction=False)
+        pipe.hincrby(batch_key, 'completed', len(image_infos))
+        pipe.hincrby(batch_key, 'failed', failed)
+        pipe.hget(batch_key, 'total')
+        release_uploads(pipe, project_id, [batch_upload_member(batch_id, filename) for filename, _, _ in entries])
+        completed, failed_total, total = pipe.execute()[:3]
+        total = int(total or 0)
+        done = completed + failed_total >= total
+        status = ('completed' if not failed_total else 'failed') if done else 'processing'
+        write_task_state(task_redis_client, batch_key, {'status': status})
+
+        event_data = {
+            'batch_id': batch_id,
+            'project_id': project_id,
+            'total': total,
+            'completed': completed,
+            'failed': failed_total,
+            'progress': int((completed + failed_total) * 100 / total) if total else 100,
+            'status': status,
+            'images': image_infos
+        }
+        if error:
+            event_data['error'] = error
+        task_redis_client.publish('socketio_events', json.dumps({
+            'event': 'upload_batch_completed' if done else 'upload_batch_progress',
+            'data': event_data
+        }))
+        logger.info(f"Batch {batch_id}: {completed + failed_total}/{total} files processed")
+    except Exception as e:
+        logger.error(f"Error updating batch progress: {e}")
+
+    if error is None:
+        queue_image_derivatives(project_id, present)
+
+    return {'success': error is None, 'completed': len(image_infos), 'failed': failed}
+
+
+@celery.task(queue=BULK_QUEUE, priority=PRIORITY_LOW)
+def generate_thumbnails_task(project_id, filenames):
+    """Celery task generating the thumbnails of newly processed images"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    generated = 0
+    for filename in filenames:
+        if not os.path.exists(os.path.join(project_path, 'images', filename)):
+            continue
+        if generate_thumbnails(project_path, filename, force=True):
+            generated += 1
+    return {'success': True, 'generated': generated}
+
+
+@celery.task(queue=BULK_QUEUE, priority=PRIORITY_LOW)
+def build_tile_pyramid_task(project_id, filename):
+    """Celery task building the Deep Zoom pyramid of an image"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    _, tiles_dir = deepzoom_paths(project_path, filename)
+    try:
+        if not os.path.exists(os.path.join(project_path, 'images', filename)):
+            return {'success': False, 'error': 'Image not found'}
+        return {'success': build_tile_pyramid(project_path, filename)}
+    finally:
+        try:
+            os.remove(f"{tiles_dir}.pending")
+        except FileNotFoundError:
+            pass
+
+
+def backfill_thumbnails(project_id):
+    """Generate missing or outdated thumbnails of every image of a project"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    image_catalog.invalidate(project_id)
+    generated = 0
+    for filename in image_catalog.get_image_names(project_id):
+        if thumbnails_stale(project_path, filename) and generate_thumbnails(project_path, filename, force=True):
+            generated += 1
+    return generated
+
+
+@celery.task(queue=BULK_QUEUE, priority=PRIORITY_LOW)
+def backfill_thumbnails_task(project_id):
+    """Celery task generating the thumbnails missing in an existing project"""
+    generated = backfill_thumbnails(project_id)
+    logger.info(f"Generated thumbnails of {generated} images in project {project_id}")
+    return {'success': True, 'generated': generated}
+
+# Archive ingest
+# A zip or tar(.gz/.bz2/.xz) archive uploaded in one request is extracted by a
+# Celery task member by member: each image is streamed into the incoming folder,
+# probed and renamed into images/, so the archive is never unpacked as a whole.
+# YOLO label files (<image stem>.txt) in the archive are imported as annotations.
+ARCHIVE_EXTENSIONS = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Label files larger than this are not YOLO labels
+YOLO_LABEL_MAX_SIZE = 1024 * 1024
+# Minimum number of seconds between two progress events of an archive task
+ARCHIVE_PROGRESS_INTERVAL = 1.0
+
+
+def iter_archive_members(archive_file):
+    """Yield (member name, file object) for the regular files of a zip or tar archive"""
+    if zipfile.is_zipfile(archive_file):
+        archive_file.seek(0)
+        with zipfile.ZipFile(archive_file) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as member:
+                        yield info.filename, member
+    else:
+        archive_file.seek(0)
+        # Stream mode reads the (compressed) tar sequentially without seeking back
+        with tarfile.open(fileobj=archive_file, mode='r|*') as archive:
+            for info in archive:
+                if info.isfile():
+                    yield info.name, archive.extractfile(info)
+
+
+def yolo_label_annotations(text, width, height):
+    """Convert YOLO label lines (boxes or segmentation polygons) to annotations in pixels"""
+    annotations = []
+    for line in text.splitlines():
+        values = line.split()
+        if len(values) < 5:
+            continue
+        try:
+            class_idx = int(values[0])
+            coordinates = [float(value) for value in values[1:]]
+        except ValueError:
+            continue
+        if len(coordinates) == 4:
+            cx, cy, w, h = coordinates
+            annotations.append({
+                'type': 'box',
+                'class': class_idx,
+                'startX': (cx - w / 2) * width,
+                'startY': (cy - h / 2) * height,
+                'width': w * width,
+                'height': h * height
+            })
+        elif len(coordinates) % 2 == 0:
+            annotations.append({
+                'type': 'polygon',
+                'class': class_idx,
+                'points': [[x * width, y * height] for x, y in zip(coordinates[::2], coordinates[1::2])]
+            })
+    return annotations
+
+
+@celery.task(bind=True, queue=BULK_QUEUE)
+def process_archive_task(self_or_task, project_id, archive_path, archive_name, import_labels=True):
+    """
+    Celery task extracting an uploaded archive into a project.
+    Progress is reported with the same upload_progress / upload_completed events as
+    single uploads, based on how much of the archive has been read.
+    """
+    task_id = getattr(self_or_task, 'id', None) or self_or_task.request.id
+    task_redis_client = get_task_redis_client()
+
+    def update_progress(progress, status='processing', event_type='upload_progress', additional_data=None):
+        state = {'error': additional_data['error']} if additional_data and 'error' in additional_data else None
+        publish_upload_progress(task_redis_client, task_id, project_id, archive_name,
+                                progress, status, event_type, additional_data, state)
+
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    images_path = os.path.join(project_path, 'images')
+    spool_dir = incoming_dir(project_path)
+    entries = []
+    images = {}
+    labels = {}
+    rejected = 0
+    # Spool file of the member being extracted, until it is moved into images/
+    temp_path = None
+
+    def flush_entries():
+        # Index updates and derivative tasks are batched like batch uploads
+        if entries:
+            register_uploaded_images(project_path, entries)
+            queue_image_derivatives(project_id, entries)
+            entries.clear()
+
+    try:
+        update_progress(0, 'processing')
+        os.makedirs(images_path, exist_ok=True)
+        os.makedirs(spool_dir, exist_ok=True)
+        archive_size = os.path.getsize(archive_path) or 1
+        last_report = time.monotonic()
+
+        with open(archive_path, 'rb') as archive_file:
+            for member_name, member in iter_archive_members(archive_file):
+                # Flatten the archive layout; never trust member paths
+                name = os.path.basename(member_name.replace('\\', '/'))
+                if not name or name.startswith('.') or '__MACOSX' in member_name:
+                    continue
+
+                stem, extension = os.path.splitext(name)
+                if import_labels and extension.lower() == '.txt':
+                    text = member.read(YOLO_LABEL_MAX_SIZE + 1)
+                    if len(text) <= YOLO_LABEL_MAX_SIZE:
+                        labels[stem] = text.decode('utf-8', 'replace')
+                elif name.lower().endswith(IMAGE_EXTENSIONS):
+                    with tempfile.NamedTemporaryFile('wb', dir=spool_dir, prefix='archive_', delete=False) as temp_file:
+                        temp_path = temp_file.name
+                        shutil.copyfileobj(member, temp_file, RESUMABLE_WRITE_BUFFER)
+                    try:
+                        metadata = probe_upload(temp_path, name)
+                    except ValueError:
+                        os.remove(temp_path)
+                        temp_path = None
+                        rejected += 1
+                        continue
+                    file_path = os.path.join(images_path, name)
+                    is_new_image = not os.path.exists(file_path)
+                    ingest_uploaded_file(temp_path, file_path, project_id)
+                    temp_path = None
+                    entries.append((name, is_new_image, metadata))
+                    images[stem] = (name, metadata)
+                    if len(entries) >= UPLOAD_BATCH_CHUNK_SIZE:
+                        flush_entries()
+
+                if time.monotonic() - last_report >= ARCHIVE_PROGRESS_INTERVAL:
+                    last_report = time.monotonic()
+                    # Keep the last 5% for the labels and the final index update
+                    update_progress(min(95, archive_file.tell() * 95 // archive_size),
+                                    additional_data={'image_count': len(images)})
+        flush_entries()
+
+        imported_labels = 0
+        for stem, text in labels.items():
+            if stem in images:
+                name, metadata = images[stem]
+                save_image_annotations(project_path, name,
+                                       yolo_label_annotations(text, metadata['width'], metadata['height']))
+                imported_labels += 1
+
+        update_progress(100, 'completed', 'upload_completed', {
+            'image_count': len(images),
+            'label_count': imported_labels,
+            'rejected_count': rejected
+        })
+        return {'success': True, 'image_count': len(images), 'label_count': imported_labels, 'rejected_count': rejected}
+
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        logger.error(f"Invalid archive {archive_name}: {e}")
+        update_progress(0, 'failed', 'upload_failed', {'error': f'Invalid archive: {str(e)}'})
+        return {'success': False, 'error': f'Invalid archive: {str(e)}'}
+    except Exception as e:
+        logger.error(f"Error processing archive {archive_name}: {e}")
+        update_progress(0, 'failed', 'upload_failed', {'error': str(e)})
+        return {'success': False, 'error': str(e)}
+    finally:
+        # Images already moved into images/ are indexed whatever stopped the extraction
+        try:
+            flush_entries()
+        except Exception as e:
+            logger.error(f"Error indexing images of archive {archive_name}: {e}")
+        for path in (temp_path, archive_path):
+            if path is None:
+                continue
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+# YOLO export
+# export/ gets train/ and val/ folders of images and YOLO label files, plus data.yaml.
+# Each image goes to the same split on every export, picked from a hash of its name.
+# Image sizes come from the metadata probed at upload, and all the points of an
+# image are normalized in one NumPy pass. Background images get empty label files
+# and unannotated images are left out.
+# export/.manifest.json records what each image produced and from which versions
+# of its image and annotations, so a re-export only rewrites what changed and
+# removes the outputs of images that are gone.
+EXPORT_DIRNAME = 'export'
+EXPORT_MANIFEST_FILENAME = '.manifest.json'
+EXPORT_MANIFEST_VERSION = 1
+EXPORT_SPLITS = ('train', 'val')
+EXPORT_TASKS = ('detect', 'segment')
+EXPORT_VAL_SPLIT = float(os.getenv('EXPORT_VAL_SPLIT', 0.2))
+EXPORT_PROGRESS_INTERVAL = 1.0
+# How exported images are placed: 'auto' tries, per file, a hardlink, a reflink
+# (copy-on-write clone on filesystems like btrfs and XFS), a symlink and finally a
+# copy, so exports take next to no space or time; the others force one method
+EXPORT_PLACEMENT_METHODS = ('hardlink', 'reflink', 'symlink', 'copy')
+EXPORT_PLACEMENTS = ('auto',) + EXPORT_PLACEMENT_METHODS
+EXPORT_PLACEMENT = os.getenv('EXPORT_PLACEMENT', 'auto')
+# Linux ioctl sharing the extents of one file with another
+FICLONE = 0x40049409
+# Held exclusively while an export writes export/ and shared while a download reads it
+EXPORT_LOCK_FILENAME = 'export.lock'
+# An export that finds export/ in use is retried after this many seconds instead of
+# holding a worker while it waits
+EXPORT_LOCK_RETRY_DELAY = int(os.getenv('EXPORT_LOCK_RETRY_DELAY', 5))
+# Hash of project ID -> ID of its latest export task
+PROJECT_EXPORTS_KEY = 'project_exports'
+
+
+class ExportLock:
+    """Keep an export of a project from running while another export or a download uses export/"""
+
+    def __init__(self, project_path, shared=False):
+        self.lock_path = os.path.join(project_path, EXPORT_LOCK_FILENAME)
+        self.shared = shared
+        self.lock_file = None
+
+    def acquire(self, blocking=True):
+        """Take the lock; without blocking, return False if it is held elsewhere"""
+        if fcntl is None:
+            return True
+        self.lock_file = open(self.lock_path, 'a')
+        operation = fcntl.LOCK_SH if self.shared else fcntl.LOCK_EX
+        try:
+            fcntl.flock(self.lock_file, operation if blocking else operation | fcntl.LOCK_NB)
+        except BlockingIOError:
+            self.lock_file.close()
+            self.lock_file = None
+            return False
+        return True
+
+    def release(self):
+        if self.lock_file is not None:
+            fcntl.flock(self.lock_file, fcntl.LOCK_UN)
+            self.lock_file.close()
+            self.lock_file = None
+
+    def __enter__(self):
+        self.acquire()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.release()
+        return False
+
+
+def export_split(image_name, val_split):
+    """Return the split ('train' or 'val') of an image"""
+    bucket = int(hashlib.md5(image_name.encode('utf-8')).hexdigest()[:8], 16) / 0x100000000
+    return 'val' if bucket < val_split else 'train'
+
+
+def export_shapes(annotations):
+    """Return (classes, shapes) of the box and polygon annotations, each shape a list of [x, y] pixels"""
+    classes = []
+    shapes = []
+    for annotation in annotations if isinstance(annotations, list) else []:
+        if not isinstance(annotation, dict):
+            continue
+        class_idx = annotation.get('class')
+        if not isinstance(class_idx, int) or class_idx < 0:
+            continue
+        if annotation.get('type') == 'box':
+            try:
+                x, y, w, h = (float(annotation[key]) for key in ('startX', 'startY', 'width', 'height'))
+            except (KeyError, TypeError, ValueError):
+                continue
+            shape = [[x, y], [x + w, y], [x + w, y + h], [x, y + h]]
+        elif annotation.get('type') == 'polygon':
+            shape = annotation.get('points')
+            if not isinstance(shape, list) or len(shape) < 3:
+                continue
+        else:
+            continue
+        classes.append(class_idx)
+        shapes.append(shape)
+    return classes, shapes
+
+
+def export_point_arrays(annotations):
+    """Return (classes, points, counts, starts) arrays of the box and polygon annotations, or None.
+
+    points holds the [x, y] pixels of all shapes back to back, shape i being
+    points[starts[i]:starts[i] + counts[i]]. Shapes with malformed points are dropped.
+    """
+    classes, shapes = export_shapes(annotations)
+    if not shapes:
+        return None
+    try:
+        points = np.array([point for shape in shapes for point in shape], dtype=np.float64)
+        if points.shape != (sum(map(len, shapes)), 2):
+            raise ValueError('Malformed point')
+    except (TypeError, ValueError):
+        valid = [
+            i for i, shape in enumerate(shapes)
+            if all(isinstance(point, (list, tuple)) and len(point) == 2
+                   and all(isinstance(value, (int, float)) for value in point) for point in shape)
+        ]
+        if not valid:
+            return None
+        classes = [classes[i] for i in valid]
+        shapes = [shapes[i] for i in valid]
+        points = np.array([point for shape in shapes for point in shape], dtype=np.float64)
+
+    counts = np.fromiter(map(len, shapes), dtype=np.intp, count=len(shapes))
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    return np.asarray(classes), points, counts, starts
+
+
+def yolo_label_lines(annotations, width, height, class_count, task='detect'):
+    """Convert the annotations of an image to YOLO label lines (boxes for detect, polygons for segment)"""
+    arrays = export_point_arrays(annotations)
+    if arrays is None or not width or not height:
+        return []
+    classes, points, counts, starts = arrays
+    points = np.clip(points / (width, height), 0.0, 1.0)
+
+    low = np.minimum.reduceat(points, starts)
+    high = np.maximum.reduceat(points, starts)
+    # Shapes outside the image (or degenerate) have no area left after clipping, and
+    # classes that aren't in data.yaml would make the dataset fail to load
+    keep = ((high - low) > 0).all(axis=1) & (classes < class_count)
+
+    if task == 'detect':
+        rows = np.char.mod('%.6f', np.hstack(((low + high) / 2, high - low))[keep])
+        return [f"{class_idx} {' '.join(row)}" for class_idx, row in zip(classes[keep], rows)]
+
+    values = np.char.mod('%.6f', points.ravel())
+    return [
+        f"{class_idx} {' '.join(values[2 * start:2 * (start + count)])}"
+        for class_idx, start, count in zip(classes[keep], starts[keep], counts[keep])
+    ]
+
+
+def read_export_annotations(annotation_file):
+    """Read an annotation file for export, treating invalid files as unannotated"""
+    try:
+        with open(annotation_file, 'r') as f:
+            return json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return None
+
+
+def iter_export_images(project_id, project_path):
+    """Yield (image name, metadata or None, annotations version, annotations loader) of the project's images.
+
+    The version (the annotation file's mtime and size, or a hash of the stored
+    annotations) lets a re-export skip loading annotations that haven't changed.
+    Unannotated images may be included; the loader returns their empty annotations.
+    """
+    store = get_metadata_store(project_path)
+    if store:
+        for image, annotations in store.iter_annotations('annotated'):
+            metadata = {field: image[field] for field in IMAGE_METADATA_FIELDS} if image.get('width') else None
+            version = hashlib.md5(json.dumps(annotations, sort_keys=True).encode('utf-8')).hexdigest()
+            yield image['name'], metadata, version, lambda annotations=annotations: annotations
+        return
+
+    metadata = image_metadata.get(project_id)
+    annotations_path = os.path.join(project_path, 'annotations')
+    for name in sorted(image_catalog.get_image_names(project_id)):
+        annotation_file = os.path.join(annotations_path, f"{os.path.splitext(name)[0]}.json")
+        try:
+            stat = os.stat(annotation_file)
+        except FileNotFoundError:
+            continue
+        yield name, metadata.get(name), [stat.st_mtime_ns, stat.st_size], partial(read_export_annotations, annotation_file)
+
+
+def count_export_images(project_id, project_path):
+    """Return how many images iter_export_images() yields at most, for progress reporting"""
+    store = get_metadata_store(project_path)
+    if store:
+        return store.count_images('annotated')
+    return len(image_catalog.get_image_names(project_id))
+
+
+def load_export_manifest(export_path, settings):
+    """Return the {image name: entry} manifest of the last export, empty if there is none.
+
+    Entries of an export made with other settings are marked stale, so their
+    outputs are rewritten (or removed) by the next export.
+    """
+    try:
+        with open(os.path.join(export_path, EXPORT_MANIFEST_FILENAME), 'r') as f:
+            manifest = json.load(f)
+    except (OSError, json.JSONDecodeError):
+        return {}
+    if manifest.get('version') != EXPORT_MANIFEST_VERSION:
+        return {}
+    images = manifest.get('images', {})
+    if manifest.get('settings') != settings:
+        for entry in images.values():
+            entry['stale'] = True
+    return images
+
+
+def save_export_manifest(export_path, settings, images):
+    """Atomically replace the export manifest"""
+    manifest_path = os.path.join(export_path, EXPORT_MANIFEST_FILENAME)
+    tmp_path = f"{manifest_path}.{uuid.uuid4().hex}.tmp"
+    with open(tmp_path, 'w') as f:
+        json.dump({'version': EXPORT_MANIFEST_VERSION, 'settings': settings, 'images': images}, f)
+    os.replace(tmp_path, manifest_path)
+
+
+def export_output_paths(export_path, split, image_name):
+    """Return the (image, label file) paths of an image in an export split"""
+    return (
+        os.path.join(export_path, split, 'images', image_name),
+        os.path.join(export_path, split, 'labels', f"{os.path.splitext(image_name)[0]}.txt")
+    )
+
+
+def remove_export_outputs(export_path, split, image_name):
+    """Remove the exported image and label file of an image"""
+    for path in export_output_paths(export_path, split, image_name):
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+
+
+def reflink_file(source, target):
+    """Create target as a copy-on-write clone of source, raising OSError where that isn't supported"""
+    if fcntl is None or not sys.platform.startswith('linux'):
+        raise OSError(errno.EOPNOTSUPP, 'Reflinks are not supported on this platform')
+    with open(source, 'rb') as src, open(target, 'xb') as dst:
+        try:
+            fcntl.ioctl(dst.fileno(), FICLONE, src.fileno())
+        except OSError:
+            dst.close()
+            os.remove(target)
+            raise
+
+
+def place_file(source, target, method):
+    """Place source at target with a single placement method"""
+    if method == 'hardlink':
+        os.link(source, target)
+    elif method == 'reflink':
+        reflink_file(source, target)
+    elif method == 'symlink':
+        # Relative, so the project folder can be moved
+        os.symlink(os.path.relpath(source, os.path.dirname(target)), target)
+    else:
+        shutil.copyfile(source, target)
+
+
+def place_export_image(source, target, placement='auto'):
+    """Put an image into an export split and return the placement method used"""
+    # Never write through an existing file, it may share its data with the original
+    try:
+        os.remove(target)
+    except FileNotFoundError:
+        pass
+    if placement != 'auto':
+        place_file(source, target, placement)
+        return placement
+
+    for method in EXPORT_PLACEMENT_METHODS[:-1]:
+        try:
+            place_file(source, target, method)
+            return method
+        except OSError:
+            # e.g. another filesystem, or links not supported
+            continue
+    place_file(source, target, 'copy')
+    return 'copy'
+
+
+def write_data_yaml(export_path, classes):
+    """Write the dataset description read by YOLO trainers"""
+    data_yaml = f"""train: train/images
+val: val/images
+nc: {len(classes)}
+names: {json.dumps(classes)}
+"""
+
+    with open(os.path.join(export_path, 'data.yaml'), 'w') as f:
+        f.write(data_yaml)
+
+
+def export_yolo(project_id, task='detect', val_split=EXPORT_VAL_SPLIT, placement=EXPORT_PLACEMENT,
+                progress_callback=None):
+    """Write the YOLO dataset of a project under export/ and return counts of what was written.
+
+    Only images whose image file, annotations or split changed since the last
+    export are written again, placed as given by placement (see EXPORT_PLACEMENTS).
+    progress_callback(done, total) is called about once per EXPORT_PROGRESS_INTERVAL.
+    """
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    with open(os.path.join(project_path, 'config.json'), 'r') as f:
+        classes = json.load(f).get('classes', [])
+
+    export_path = os.path.join(project_path, EXPORT_DIRNAME)
+    images_path = os.path.join(project_path, 'images')
+    for split in EXPORT_SPLITS:
+        if not os.path.exists(os.path.join(export_path, EXPORT_MANIFEST_FILENAME)):
+            # Outputs of an export without a manifest can't be tracked, start over
+            shutil.rmtree(os.path.join(export_path, split), ignore_errors=True)
+        os.makedirs(os.path.join(export_path, split, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(export_path, split, 'labels'), exist_ok=True)
+
+    # Labels of classes past the end of the list are dropped, so they depend on its length too
+    settings = {'task': task, 'val_split': val_split, 'classes': len(classes)}
+    previous_images = load_export_manifest(export_path, settings)
+    manifest_images = {}
+    total = count_export_images(project_id, project_path)
+    counts = {'images': 0, 'train': 0, 'val': 0, 'labels': 0, 'background': 0, 'skipped': 0,
+              'written': 0, 'unchanged': 0, 'removed': 0,
+              'placed': dict.fromkeys(EXPORT_PLACEMENT_METHODS, 0)}
+    last_report = time.monotonic()
+    for done, (name, metadata, annotations_version, load_annotations) in enumerate(
+            iter_export_images(project_id, project_path), 1):
+        if progress_callback and time.monotonic() - last_report >= EXPORT_PROGRESS_INTERVAL:
+            last_report = time.monotonic()
+            progress_callback(done, max(total, done))
+
+        source = os.path.join(images_path, name)
+        previous = previous_images.pop(name, None)
+        try:
+            stat = os.stat(source)
+        except OSError as e:
+            logger.warning(f"Skipped {name} in export of project {project_id}: {str(e)}")
+            counts['skipped'] += 1
+            if previous and previous.get('split'):
+                remove_export_outputs(export_path, previous['split'], name)
+            continue
+        image_version = [stat.st_size, stat.st_mtime_ns]
+        split = export_split(name, val_split)
+
+        if (previous and not previous.get('stale') and previous.get('image') == image_version
+                and previous.get('annotations') == annotations_version):
+            # Nothing this image's outputs depend on has changed
+            manifest_images[name] = previous
+            if previous.get('split'):
+                counts['unchanged'] += 1
+                counts['images'] += 1
+                counts[previous['split']] += 1
+                counts['labels'] += previous.get('labels', 0)
+                if not previous.get('labels'):
+                    counts['background'] += 1
+            continue
+
+        entry = {'image': image_version, 'annotations': annotations_version, 'split': None}
+        annotations = load_annotations()
+        if annotation_status(annotations) == 'unannotated':
+            if previous and previous.get('split'):
+                remove_export_outputs(export_path, previous['split'], name)
+                counts['removed'] += 1
+            manifest_images[name] = entry
+            continue
+
+        try:
+            # Labels are normalized by the dimensions the image is displayed (and annotated) in
+            metadata = oriented_metadata(metadata, source)
+            lines = yolo_label_lines(annotations, metadata['width'], metadata['height'], len(classes), task)
+            image_path, label_file = export_output_paths(export_path, split, name)
+            if previous and previous.get('split') and previous['split'] != split:
+                remove_export_outputs(export_path, previous['split'], name)
+            if (not previous or previous.get('split') != split or previous.get('image') != image_version
+                    or not os.path.exists(image_path)):
+                counts['placed'][place_export_image(source, image_path, placement)] += 1
+        except (OSError, ValueError) as e:
+            logger.warning(f"Skipped {name} in export of project {project_id}: {str(e)}")
+            counts['skipped'] += 1
+            # The image is left out of the manifest, so its outputs must not stay behind
+            if previous and previous.get('split'):
+                remove_export_outputs(export_path, previous['split'], name)
+            remove_export_outputs(export_path, split, name)
+            continue
+
+        with open(label_file, 'w') as f:
+            f.write(''.join(f"{line}\n" for line in lines))
+
+        entry.update(split=split, labels=len(lines))
+        manifest_images[name] = entry
+        counts['written'] += 1
+        counts['images'] += 1
+        counts[split] += 1
+        counts['labels'] += len(lines)
+        if not lines:
+            counts['background'] += 1
+
+    # Images deleted (or no longer annotated) since the last export
+    for name, previous in previous_images.items():
+        if previous.get('split'):
+            remove_export_outputs(export_path, previous['split'], name)
+            counts['removed'] += 1
+
+    write_data_yaml(export_path, classes)
+    save_export_manifest(export_path, settings, manifest_images)
+    return counts
+
+
+def export_task_key(task_id):
+    """Return the Redis key holding the state of an export task"""
+    return f"export_task:{task_id}"
+
+
+def active_export_task(project_id):
+    """Return the ID of the project's export task if it is queued or running, else None"""
+    task_id = redis_client.hget(PROJECT_EXPORTS_KEY, project_id)
+    if task_id is None:
+        return None
+    task_id = task_id.decode('utf-8')
+    status = redis_client.hget(export_task_key(task_id), 'status')
+    return task_id if status in (b'queued', b'processing') else None
+
+
+def publish_export_progress(client, task_id, project_id, progress, status='processing',
+                            event_type='export_progress', additional_data=None):
+    """Record an export task's state and emit its Socket.IO event in one round trip"""
+    try:
+        state = {'status': status, 'progress': str(progress)}
+        if additional_data:
+            state.update({key: json.dumps(value) for key, value in additional_data.items()})
+        pipe = client.pipeline(transaction=False)
+        write_task_state(client, export_task_key(task_id), state, pipe)
+        pipe.publish('socketio_events', json.dumps({
+            'event': event_type,
+            'data': {'task_id': task_id, 'project_id': project_id, 'progress': progress,
+                     'status': status, **(additional_data or {})}
+        }))
+        pipe.execute()
+    except Exception as e:
+        logger.error(f"Error updating export progress: {e}")
+
+
+def run_export_task(self_or_task, project_id, export_format, export):
+    """Run export(progress_callback) for an export task, reporting its progress and result"""
+    task_id = getattr(self_or_task, 'id', None) or self_or_task.request.id
+    task_redis_client = get_task_redis_client()
+
+    def update_progress(progress, status='processing', event_type='export_progress', additional_data=None):
+        publish_export_progress(task_redis_client, task_id, project_id, progress, status, event_type,
+                                {'format': export_format, **(additional_data or {})})
+
+    lock = ExportLock(os.path.join(app.config['PROJECTS_FOLDER'], project_id))
+    if not lock.acquire(blocking=False):
+        if self_or_task.request.is_eager:
+            # Retries of eager tasks run inline, so just wait
+            lock.acquire()
+        else:
+            # Another export or a download still uses export/; the task stays queued meanwhile
+            raise self_or_task.retry(countdown=EXPORT_LOCK_RETRY_DELAY, max_retries=None)
+
+    try:
+        update_progress(0)
+        counts = export(lambda done, total: update_progress(done * 99 // total))
+    except Exception as e:
+        logger.error(f"Error exporting project {project_id}: {e}")
+        update_progress(0, 'failed', 'export_failed', {'error': str(e)})
+        return {'success': False, 'error': str(e)}
+    finally:
+        lock.release()
+
+    update_progress(100, 'completed', 'export_completed', {'counts': counts})
+    logger.info(f"Exported project {project_id} as {export_format}: {counts}")
+    return {'success': True, 'counts': counts}
+
+
+@celery.task(bind=True, queue=EXPORT_QUEUE)
+def export_yolo_task(self_or_task, project_id, task='detect', val_split=EXPORT_VAL_SPLIT, placement=EXPORT_PLACEMENT):
+    """Celery task exporting a project in YOLO format, reporting export_progress events"""
+    return run_export_task(self_or_task, project_id, 'yolo',
+                           lambda progress_callback: export_yolo(project_id, task, val_split, placement,
+                                                                 progress_callback))
+
+
+# COCO export
+# export/coco gets annotations/instances_<split>.json and a folder of images per
+# split, with the same splits and image placement as the YOLO export. The JSON is
+# written incrementally while the images are processed, and the polygon areas and
+# bounding boxes of an image are computed in one NumPy pass, so memory use doesn't
+# grow with the size of the project.
+COCO_DIRNAME = 'coco'
+
+
+class CocoJsonWriter:
+    """Writes a COCO instances file incrementally.
+
+    Images are written to the file as they are added and annotations to a spool
+    file next to it, which is appended after the images on close().
+    """
+
+    def __init__(self, path, categories):
+        self.path = path
+        self._tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        self._file = open(self._tmp_path, 'w')
+        self._spool = tempfile.TemporaryFile('w+', dir=os.path.dirname(path))
+        self.image_count = 0
+        self.annotation_count = 0
+        self._file.write('{"info": ' + json.dumps({
+            'description': os.path.splitext(os.path.basename(path))[0],
+            'date_created': datetime.now().isoformat()
+        }) + ', "licenses": [], "categories": ' + json.dumps(categories) + ', "images": [')
+
+    def add_image(self, image):
+        """Write an image record and return its ID"""
+        self.image_count += 1
+        self._file.write((', ' if self.image_count > 1 else '') + json.dumps({'id': self.image_count, **image}))
+        return self.image_count
+
+    def add_annotation(self, annotation):
+        """Spool an annotation record and return its ID"""
+        self.annotation_count += 1
+        self._spool.write((', ' if self.annotation_count > 1 else '') +
+                          json.dumps({'id': self.annotation_count, **annotation}))
+        return self.annotation_count
+
+    def close(self):
+        """Finish the file and move it into place"""
+        self._file.write('], "annotations": [')
+        self._spool.seek(0)
+        shutil.copyfileobj(self._spool, self._file, RESUMABLE_WRITE_BUFFER)
+        self._file.write(']}\n')
+        self._spool.close()
+        self._file.close()
+        os.replace(self._tmp_path, self.path)
+
+    def abort(self):
+        """Discard the partial file"""
+        self._spool.close()
+        self._file.close()
+        try:
+            os.remove(self._tmp_path)
+        except FileNotFoundError:
+            pass
+
+
+def coco_objects(annotations, width, height, category_count):
+    """Return (category id, segmentation, area, bbox) of the box and polygon annotations of an image"""
+    arrays = export_point_arrays(annotations)
+    if arrays is None:
+        return []
+    classes, points, counts, starts = arrays
+    points = np.clip(points, 0.0, (width, height))
+
+    low = np.minimum.reduceat(points, starts)
+    high = np.maximum.reduceat(points, starts)
+    # Shapes outside the image (or degenerate), and classes without a category, are left out
+    keep = ((high - low) > 0).all(axis=1) & (classes < category_count)
+
+    # Shoelace formula, pairing every point with the next one of its shape
+    following = np.arange(1, len(points) + 1)
+    following[starts + counts - 1] = starts
+    cross = points[:, 0] * points[following, 1] - points[following, 0] * points[:, 1]
+    areas = np.round(np.abs(np.add.reduceat(cross, starts)) / 2, 2)
+    bboxes = np.round(np.hstack((low, high - low)), 2)
+    points = np.round(points, 2)
+
+    return [
+        (int(class_idx) + 1, [points[start:start + count].ravel().tolist()], area, bbox)
+        for class_idx, start, count, area, bbox in zip(
+            classes[keep], starts[keep], counts[keep], areas[keep].tolist(), bboxes[keep].tolist())
+    ]
+
+
+def export_coco(project_id, val_split=EXPORT_VAL_SPLIT, placement=EXPORT_PLACEMENT, progress_callback=None):
+    """Write the COCO dataset of a project under export/coco and return counts of what was written"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    with open(os.path.join(project_path, 'config.json'), 'r') as f:
+        classes = json.load(f).get('classes', [])
+
+    images_path = os.path.join(project_path, 'images')
+    coco_path = os.path.join(project_path, EXPORT_DIRNAME, COCO_DIRNAME)
+    shutil.rmtree(coco_path, ignore_errors=True)
+    os.makedirs(os.path.join(coco_path, 'annotations'))
+    for split in EXPORT_SPLITS:
+        os.makedirs(os.path.join(coco_path, split))
+
+    categories = [{'id': i + 1, 'name': name, 'supercategory': 'none'} for i, name in enumerate(classes)]
+    writers = {}
+    try:
+        for split in EXPORT_SPLITS:
+            writers[split] = CocoJsonWriter(
+                os.path.join(coco_path, 'annotations', f"instances_{split}.json"), categories)
+
+        total = count_export_images(project_id, project_path)
+        counts = {'images': 0, 'train': 0, 'val': 0, 'annotations': 0, 'background': 0, 'skipped': 0,
+                  'placed': dict.fromkeys(EXPORT_PLACEMENT_METHODS, 0)}
+        last_report = time.monotonic()
+        for done, (name, metadata, _, load_annotations) in enumerate(iter_export_images(project_id, project_path), 1):
+            if progress_callback and time.monotonic() - last_report >= EXPORT_PROGRESS_INTERVAL:
+                last_report = time.monotonic()
+                progress_callback(done, max(total, done))
+
+            annotations = load_annotations()
+            if annotation_status(annotations) == 'unannotated':
+                continue
+            source = os.path.join(images_path, name)
+            split = export_split(name, val_split)
+            try:
+                # Image sizes (and so areas and boxes) are those the image is displayed and annotated in
+                metadata = oriented_metadata(metadata, source)
+                counts['placed'][place_export_image(source, os.path.join(coco_path, split, name), placement)] += 1
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipped {name} in COCO export of project {project_id}: {str(e)}")
+                counts['skipped'] += 1
+                continue
+
+            writer = writers[split]
+            image_id = writer.add_image({'file_name': name, 'width': metadata['width'], 'height': metadata['height']})
+            objects = coco_objects(annotations, metadata['width'], metadata['height'], len(categories))
+            for category_id, segmentation, area, bbox in objects:
+                writer.add_annotation({
+                    'image_id': image_id,
+                    'category_id': category_id,
+                    'segmentation': segmentation,
+                    'area': area,
+                    'bbox': bbox,
+                    'iscrowd': 0
+                })
+
+            counts['images'] += 1
+            counts[split] += 1
+            counts['annotations'] += len(objects)
+            if not objects:
+                counts['background'] += 1
+
+        for split in EXPORT_SPLITS:
+            writers.pop(split).close()
+        return counts
+    finally:
+        for writer in writers.values():
+            writer.abort()
+
+
+@celery.task(bind=True, queue=EXPORT_QUEUE)
+def export_coco_task(self_or_task, project_id, val_split=EXPORT_VAL_SPLIT, placement=EXPORT_PLACEMENT):
+    """Celery task exporting a project in COCO format, reporting export_progress events"""
+    return run_export_task(self_or_task, project_id, 'coco',
+                           lambda progress_callback: export_coco(project_id, val_split, placement, progress_callback))
+
+
+# Export download
+# The export folder is streamed as a zip built on the fly: zipfile writes into a
+# buffer that the response generator drains after every chunk of every file, so
+# memory stays constant and the first bytes go out immediately. Images are
+# stored as they are (JPEG/PNG don't compress further); text files are deflated.
+EXPORT_ZIP_CHUNK_SIZE = 1024 * 1024
+EXPORT_ZIP_DEFLATED_EXTENSIONS = ('.txt', '.yaml', '.json')
+# Export format -> (folder under export/, top-level entries of the zip, file marking a finished export)
+EXPORT_FORMATS = {
+    'yolo': ('', ('data.yaml',) + EXPORT_SPLITS, 'data.yaml'),
+    'coco': (COCO_DIRNAME, ('annotations',) + EXPORT_SPLITS, os.path.join('annotations', 'instances_train.json'))
+}
+
+
+class ZipStreamBuffer:
+    """Write-only, unseekable file object collecting the output of a ZipFile"""
+
+    def __init__(self):
+        self._chunks = []
+        self._offset = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._offset += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._offset
+
+    def flush(self):
+        pass
+
+    def drain(self):
+        """Return and forget everything written since the last drain"""
+        data = b''.join(self._chunks)
+        self._chunks = []
+        return data
+
+
+def iter_export_files(export_path, entries):
+    """Yield (path, name in the archive) of the files of an export, in the order of its top-level entries"""
+    for entry in entries:
+        entry_path = os.path.join(export_path, entry)
+        if os.path.isfile(entry_path):
+            yield entry_path, entry
+            continue
+        for root, dirs, files in os.walk(entry_path):
+            dirs.sort()
+            for name in sorted(files):
+                if not name.startswith('.'):
+                    path = os.path.join(root, name)
+                    yield path, os.path.relpath(path, export_path).replace(os.sep, '/')
+
+
+def stream_export_zip(export_path, entries):
+    """Yield the bytes of a zip of an export, reading each file in EXPORT_ZIP_CHUNK_SIZE chunks"""
+    buffer = ZipStreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as archive:
+        for path, arcname in iter_export_files(export_path, entries):
+            try:
+                source = open(path, 'rb')
+            except FileNotFoundError:
+                # Removed since the export was listed
+                continue
+            with source:
+                info = zipfile.ZipInfo.from_file(path, arcname)
+                if arcname.lower().endswith(EXPORT_ZIP_DEFLATED_EXTENSIONS):
+                    info.compress_type = zipfile.ZIP_DEFLATED
+                with archive.open(info, 'w') as target:
+                    while True:
+                        chunk = source.read(EXPORT_ZIP_CHUNK_SIZE)
+                        if not chunk:
+                            break
+                        target.write(chunk)
+                        data = buffer.drain()
+                        if data:
+                            yield data
+            yield buffer.drain()
+    # Central directory
+    yield buffer.drain()
+
+
+# Conditional GET
+# Listing and count endpoints send an ETag derived from the mtimes and sizes of the
+# files every write path touches (images folder, stats index, membership log,
+# SQLite database, config). A client sending If-None-Match with the current ETag
+# gets a 304 before any listing or counting happens.
+PROJECT_VERSION_FILES = (
+    'config.json',
+    'images',
+    'annotations',
+    STATS_FILENAME,
+    MEMBERSHIP_FILENAME,
+    MEMBERSHIP_LOG_FILENAME,
+    IMAGE_META_LOG_FILENAME,
+    METADATA_DB_FILENAME,
+    f'{METADATA_DB_FILENAME}-wal'
+)
+
+
+def project_version(project_path):
+    """Return a cheap version token of a project (a few stat calls), or None if it doesn't exist"""
+    parts = [STORAGE_BACKEND]
+    last_modified = 0
+    for name in PROJECT_VERSION_FILES:
+        try:
+            st = os.stat(os.path.join(project_path, name))
+        except FileNotFoundError:
+            if name == 'config.json':
+                return None
+            parts.append('-')
+            continue
+        parts.append(f'{st.st_mtime_ns}:{st.st_size}')
+        last_modified = max(last_modified, st.st_mtime)
+    return '|'.join(parts), last_modified
+
+
+def projects_version():
+    """Return a version token covering every project"""
+    projects_folder = app.config['PROJECTS_FOLDER']
+    parts = [str(os.stat(projects_folder).st_mtime_ns)]
+    last_modified = 0
+    for name in sorted(os.listdir(projects_folder)):
+        version = project_version(os.path.join(projects_folder, name))
+        if version:
+            parts.append(f'{name}={version[0]}')
+            last_modified = max(last_modified, version[1])
+    return '|'.join(parts), last_modified
+
+
+def conditional_get(version_func):
+    """Answer GET requests with 304 when the version reported by version_func is unchanged.
+
+    version_func receives the view arguments and returns (token, last modified timestamp)
+    or None to skip conditional handling.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if request.method != 'GET':
+                return view(*args, **kwargs)
+
+            version = version_func(*args, **kwargs)
+            if version is None:
+                return view(*args, **kwargs)
+
+            token, last_modified = version
+            etag = hashlib.sha1(token.encode('utf-8')).hexdigest()
+            if etag in request.if_none_match:
+                response = app.response_class(status=304)
+                response.set_etag(etag)
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if response.status_code == 200:
+                response.set_etag(etag)
+                response.last_modified = datetime.fromtimestamp(last_modified, tz=timezone.utc)
+                # Let clients cache but always revalidate
+                response.headers['Cache-Control'] = 'no-cache'
+            return response
+        return wrapper
+    return decorator
+
+
+def project_version_for(project_id, *args, **kwargs):
+    """Version function for routes taking a project_id"""
+    return project_version(os.path.join(app.config['PROJECTS_FOLDER'], project_id))
+
+# Routes
+@app.route('/')
+def index():
+    """Home page with project management"""
+    return render_template('index.html')
+
+@app.route('/projects', methods=['GET', 'POST'])
+@conditional_get(projects_version)
+def projects():
+    """API for project management"""
+    if request.method == 'GET':
+        # List all projects
+        projects = []
+        if os.path.exists(app.config['PROJECTS_FOLDER']):
+            for project_name in os.listdir(app.config['PROJECTS_FOLDER']):
+                project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_name)
+                if os.path.isdir(project_path):
+                    config_path = os.path.join(project_path, 'config.json')
+                    if os.path.exists(config_path):
+                        try:
+                            with open(config_path, 'r') as f:
+                                config = json.load(f)
+                        except (json.JSONDecodeError, IOError) as e:
+                            logger.error(f"Error reading config file for project {project_name}: {str(e)}")
+                            continue
+
+                        # Counts come from the incrementally maintained stats index
+                        stats = get_project_stats(project_path)
+                        image_count = stats['imageCount']
+                        annotations_count = annotations_count_by_class(stats, config.get('classes', []))
+
+                        projects.append({
+                            'id': project_name,
+                            'name': config.get('name', project_name),
+                            'created': config.get('created', ''),
+                            'classes': config.get('classes', []),
+                            'classColors': config.get('classColors', {}),
+                            'imageCount': image_count,
+                            'annotationsCount': annotations_count
+                        })
+        return jsonify(projects)
+
+    elif request.method == 'POST':
+        # Create new project
+        data = request.json
+        project_name = data.get('name', '').strip()
+        classes = data.get('classes', [])
+        class_colors = data.get('classColors', {})
+
+        if not project_name:
+            return jsonify({'error': 'Project name is required'}), 400
+
+        # Create unique project ID
+        project_id = str(uuid.uuid4())
+        project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+        # Create project directory structure
+        os.makedirs(project_path, exist_ok=True)
+        os.makedirs(os.path.join(project_path, 'images'), exist_ok=True)
+        os.makedirs(os.path.join(project_path, 'annotations'), exist_ok=True)
+        os.makedirs(os.path.join(project_path, 'export'), exist_ok=True)
+
+        # Create project config
+        config = {
+            'name': project_name,
+            'created': datetime.now().isoformat(),
+            'classes': classes,
+            'classColors': class_colors
+        }
+
+        with open(os.path.join(project_path, 'config.json'), 'w') as f:
+            json.dump(config, f)
+
+        write_project_stats(project_path, empty_project_stats())
+
+        if STORAGE_BACKEND == 'sqlite':
+            store = ProjectMetadataStore(project_path)
+            store.initialize()
+            store.set_config(config)
+
+        return jsonify({
+            'id': project_id,
+            'name': project_name,
+            'created': config['created'],
+            'classes': classes,
+            'classColors': class_colors
+        })
+
+    return jsonify({'error': 'Invalid request method.'})
+
+@app.route('/projects/<project_id>', methods=['GET', 'PUT', 'DELETE'])
+@conditional_get(project_version_for)
+def project(project_id):
+    """API for individual project operations"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    config_path = os.path.join(project_path, 'config.json')
+
+    if request.method == 'GET':
+        # Get project details
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+
+        # Get list of images
+        images = image_catalog.get_image_names(project_id)
+
+        # Counts come from the incrementally maintained stats index
+        stats = get_project_stats(project_path)
+        image_count = stats['imageCount']
+        annotations_count = annotations_count_by_class(stats, config.get('classes', []))
+
+        return jsonify({
+            'id': project_id,
+            'name': config.get('name', ''),
+            'created': config.get('created', ''),
+            'classes': config.get('classes', []),
+            'classColors': config.get('classColors', {}),
+            'images': images,
+            'imageCount': image_count,
+            'annotationsCount': annotations_count
+        })
+
+    elif request.method == 'PUT':
+        # Update project
+        data = request.json
+
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+
+        if 'name' in data:
+            config['name'] = data['name']
+
+        if 'classes' in data:
+            config['classes'] = data['classes']
+
+        if 'classColors' in data:
+            config['classColors'] = data['classColors']
+
+        with open(config_path, 'w') as f:
+            json.dump(config, f)
+
+        store = get_metadata_store(project_path)
+        if store:
+            store.set_config(config)
+
+        return jsonify({
+            'id': project_id,
+            'name': config['name'],
+            'created': config['created'],
+            'classes': config['classes'],
+            'classColors': config.get('classColors', {})
+        })
+
+    elif request.method == 'DELETE':
+        # Delete project (this is dangerous, consider adding confirmation)
+        import shutil
+        shutil.rmtree(project_path)
+        redis_client.delete(project_uploads_key(project_id), upload_queue_key(project_id))
+        image_catalog.invalidate(project_id)
+        filter_index.invalidate(project_id)
+        image_metadata.invalidate(project_id)
+        return jsonify({'success': True})
+    return jsonify({'error': 'Invalid request method.'})
+
+
+def get_project_counts(project_path):
+    """Return the image and per-class annotation counts of a project.
+
+    Raises FileNotFoundError if the project doesn't exist and ValueError if its config can't be read.
+    """
+    if not os.path.exists(project_path):
+        raise FileNotFoundError('Project not found')
+
+    config_path = os.path.join(project_path, 'config.json')
+
+    try:
+        with open(config_path, 'r') as f:
+            config = json.load(f)
+    except (json.JSONDecodeError, IOError) as e:
+        raise ValueError(f'Failed to read project config: {str(e)}')
+
+    # Counts come from the incrementally maintained stats index
+    stats = get_project_stats(project_path)
+
+    return {
+        'imageCount': stats['imageCount'],
+        'annotationsCount': annotations_count_by_class(stats, config.get('classes', []))
+    }
+
+@app.route('/projects/counts', methods=['GET'])
+def projects_counts():
+    """API for getting the counts of many projects in one request.
+
+    ?ids=<id>,<id>,... selects projects; without it all projects are returned.
+    Projects are evaluated concurrently and errors are reported per project.
+    """
+    projects_folder = app.config['PROJECTS_FOLDER']
+    ids = request.args.get('ids')
+    if ids:
+        project_ids = [project_id.strip() for project_id in ids.split(',') if project_id.strip()]
+    else:
+        project_ids = [
+            name for name in os.listdir(projects_folder)
+            if os.path.exists(os.path.join(projects_folder, name, 'config.json'))
+        ]
+
+    def counts_for(project_id):
+        # Ids come from the query string, don't let them escape the projects folder
+        if project_id.startswith('.') or '/' in project_id or '\\' in project_id:
+            return {'error': 'Project not found'}
+        try:
+            return get_project_counts(os.path.join(projects_folder, project_id))
+        except FileNotFoundError as e:
+            return {'error': str(e)}
+        except Exception as e:
+            logger.error(f"Error getting counts for project {project_id}: {str(e)}")
+            return {'error': str(e)}
+
+    results = counts_executor.map(counts_for, project_ids)
+    return jsonify(dict(zip(project_ids, results)))
+
+@app.route('/projects/<project_id>/counts', methods=['GET'])
+@conditional_get(project_version_for)
+def project_counts(project_id):
+    """API for getting just the image and annotation counts for a project"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    try:
+        return jsonify(get_project_counts(project_path))
+    except FileNotFoundError as e:
+        return jsonify({'error': str(e)}), 404
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/projects/<project_id>/images', methods=['GET', 'POST'])
+@conditional_get(project_version_for)
+def project_images(project_id):
+    """API for project images list"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    images_path = os.path.join(project_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
+
+    if request.method == 'GET':
+        # List image files, newest first unless another sort is requested.
+        # With ?limit=N the list is paginated; pass next_cursor back as ?cursor=
+        try:
+            sort, order, limit, cursor = parse_image_list_args(request.args)
+            store = get_metadata_store(project_path)
+            if store:
+                return store_image_list_response(store, None, sort, order, limit, cursor)
+            return image_list_response(image_catalog.get_images(project_id, sort, order), sort, order, limit, cursor,
+                                       image_metadata.get(project_id))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+
+    elif request.method == 'POST':
+        # We still accept POST requests to maintain compatibility
+        # but we don't save to images_list.json anymore
+        return jsonify({'success': True})
+
+    return jsonify({'error': 'Invalid request method.'})
+
+def queue_upload_task(project_id, filename, file_path, is_new_image, metadata=None):
+    """Queue process_upload_task for a file placed in images/ and return the task ID"""
+    task_id = register_upload_task(project_id, filename)
+    process_upload_task.apply_async(args=(project_id, filename, file_path, is_new_image, metadata), task_id=task_id)
+    return task_id
+
+def register_upload_task(project_id, filename):
+    """Record a new upload task so its status can be queried, and return its ID.
+
+    The queued state is written before the task is dispatched, so a fast worker's
+    progress is never overwritten by it.
+    """
+    task_id = str(uuid.uuid4())
+    created = datetime.now().isoformat()
+
+    # Store initial task status in Redis, and add the task to the project's active uploads
+    pipe = redis_client.pipeline(transaction=False)
+    write_task_state(redis_client, f"upload_task:{task_id}", {
+        'status': 'queued',
+        'progress': '0',
+        'filename': filename,
+        'project_id': project_id,
+        'created': created
+    }, pipe)
+    pipe.zadd(project_uploads_key(project_id), {task_id: time.time()})
+    pipe.expire(project_uploads_key(project_id), UPLOAD_TASK_TTL)
+    enqueue_uploads(pipe, project_id, [task_id])
+    pipe.execute()
+    return task_id
+
+@app.route('/projects/<project_id>/upload', methods=['POST'])
 def upload_image(project_id):
     """API for uploading images to the project"""
     project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
@@ -990,122 +4408,426 @@ def upload_image(project_id):
         # Secure the filename to prevent directory traversal attacks
         filename = os.path.basename(file.filename)
 
-        # Create a temporary file to store the upload
-        temp_dir = os.path.join(app.config['PROJECTS_FOLDER'], 'temp')
-        os.makedirs(temp_dir, exist_ok=True)
-
-        # # Ensure the temp directory has the correct permissions
-        # try:
-        #     os.chmod(temp_dir, 0o777)
-        # except Exception as e:
-        #     # This is not a critical error - uploads will still work
-        #     # This commonly happens in Docker environments with mounted volumes,
-        #     # especially on Windows hosts where the container user doesn't have
-        #     # permission to change file modes in the mounted volume
-        #     logger.info(f"Non-critical: Could not set temp directory permissions: {str(e)}")
-        #     # Continue with the upload process regardless of permission errors
-
-        temp_file_path = os.path.join(temp_dir, f"{uuid.uuid4()}_{filename}")
-
-        # Save the file to the temporary location
+        # The upload was spooled into the project's incoming folder while the request
+        # was parsed; move it into images/ with an atomic rename instead of copying it
+        images_path = os.path.join(project_path, 'images')
+        os.makedirs(images_path, exist_ok=True)
+        file_path = os.path.join(images_path, filename)
         try:
-            file.save(temp_file_path)
+            temp_file_path = save_upload_stream(file, project_path)
+            # Reject unreadable images before they reach images/
+            metadata = probe_upload(temp_file_path, filename)
+            is_new_image = not os.path.exists(file_path)
+            duplicate_of = ingest_uploaded_file(temp_file_path, file_path, project_id, upload_digest(file))
+        except ValueError as e:
+            return jsonify({'error': f'Rejected {filename}: {str(e)}'}), 400
         except Exception as e:
-            logger.error(f"Failed to save uploaded file to temporary location: {str(e)}")
+            logger.error(f"Failed to save uploaded file: {str(e)}")
             return jsonify({'error': f'Failed to save uploaded file: {str(e)}'}), 500
 
-        # # Ensure the temporary file has the correct permissions
-        # try:
-        #     os.chmod(temp_file_path, 0o666)  # Read and write permissions for all users
-        # except Exception as e:
-        #     # This is not a critical error - uploads will still work
-        #     # This commonly happens in Docker environments with mounted volumes,
-        #     # especially on Windows hosts where the container user doesn't have
-        #     # permission to change file modes in the mounted volume
-        #     logger.info(f"Non-critical: Could not set temporary file permissions: {str(e)}")
-        #     # Continue with the upload process regardless of permission errors
-
-        # Queue the processing task
-        task = process_upload_task.delay(project_id, filename, temp_file_path)
-        task_id = task.id
-
-        # Store task info
-        upload_tasks[task_id] = {
-            'project_id': project_id,
-            'filename': filename,
-            'status': 'queued',
-            'created': datetime.now().isoformat()
-        }
-
-        # Store initial task status in Redis
-        redis_client.hset(f"upload_task:{task_id}", "status", "queued")
-        redis_client.hset(f"upload_task:{task_id}", "progress", "0")
-        redis_client.hset(f"upload_task:{task_id}", "filename", filename)
-        redis_client.hset(f"upload_task:{task_id}", "project_id", project_id)
-        redis_client.hset(f"upload_task:{task_id}", "created", datetime.now().isoformat())
+        # Queue the post-processing task
+        task_id = queue_upload_task(project_id, filename, file_path, is_new_image, metadata)
 
         # Return task ID for client to track progress
-        return jsonify({
+        response = {
             'success': True,
             'task_id': task_id,
             'status': 'queued'
-        })
+        }
+        if duplicate_of:
+            response['duplicate_of'] = duplicate_of
+        return jsonify(response)
 
     return jsonify({'error': 'Failed to upload file'}), 500
 
+@app.route('/projects/<project_id>/upload/batch', methods=['POST'])
+def upload_image_batch(project_id):
+    """API for uploading many images in one request, processed as one grouped job"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    files = [file for file in request.files.getlist('files') if file.filename]
+    if not files:
+        return jsonify({'error': 'No selected files'}), 400
+
+    images_path = os.path.join(project_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
+
+    entries = {}
+    errors = []
+    duplicates = []
+    for file in files:
+        filename = os.path.basename(file.filename)
+        file_path = os.path.join(images_path, filename)
+        try:
+            temp_file_path = save_upload_stream(file, project_path)
+            metadata = probe_upload(temp_file_path, filename)
+            is_new_image = not os.path.exists(file_path)
+            duplicate_of = ingest_uploaded_file(temp_file_path, file_path, project_id, upload_digest(file))
+        except ValueError as e:
+            errors.append({'filename': filename, 'error': f'Rejected: {str(e)}'})
+            continue
+        except Exception as e:
+            logger.error(f"Failed to save uploaded file {filename}: {str(e)}")
+            errors.append({'filename': filename, 'error': str(e)})
+            continue
+        if duplicate_of:
+            duplicates.append({'filename': filename, 'duplicate_of': duplicate_of})
+        # A name repeated within the batch replaces the earlier file
+        if filename in entries:
+            entries[filename][2] = metadata
+        else:
+            entries[filename] = [filename, is_new_image, metadata]
+
+    if not entries:
+        return jsonify({'error': 'Failed to save uploaded files', 'errors': errors}), 500
+
+    entries = list(entries.values())
+    batch_id = str(uuid.uuid4())
+    pipe = redis_client.pipeline(transaction=False)
+    write_task_state(redis_client, f"upload_batch:{batch_id}", {
+        'status': 'queued',
+        'total': str(len(entries)),
+        'completed': '0',
+        'failed': '0',
+        'project_id': project_id,
+        'created': datetime.now().isoformat()
+    }, pipe)
+    enqueue_uploads(pipe, project_id, [batch_upload_member(batch_id, filename) for filename, _, _ in entries])
+    pipe.execute()
+
+    # One task per chunk, so progress events and index updates are per chunk, not per file
+    group(
+        process_upload_chunk_task.s(project_id, batch_id, entries[i:i + UPLOAD_BATCH_CHUNK_SIZE]).set(**batch_upload_route(len(entries)))
+        for i in range(0, len(entries), UPLOAD_BATCH_CHUNK_SIZE)
+    ).apply_async()
+
+    response = {
+        'success': True,
+        'batch_id': batch_id,
+        'total': len(entries),
+        'status': 'queued'
+    }
+    if duplicates:
+        response['duplicates'] = duplicates
+    if errors:
+        response['errors'] = errors
+    return jsonify(response)
+
+@app.route('/projects/<project_id>/upload/batch/<batch_id>', methods=['GET'])
+def upload_batch_status(project_id, batch_id):
+    """API for checking the aggregated status of a batch upload"""
+    batch = redis_client.hgetall(f"upload_batch:{batch_id}")
+    if not batch:
+        return jsonify({'error': 'Batch not found'}), 404
+
+    batch = {key.decode('utf-8'): value.decode('utf-8') for key, value in batch.items()}
+    total = int(batch.get('total', 0))
+    processed = int(batch.get('completed', 0)) + int(batch.get('failed', 0))
+    return jsonify({
+        'batch_id': batch_id,
+        'status': batch.get('status'),
+        'total': total,
+        'completed': int(batch.get('completed', 0)),
+        'failed': int(batch.get('failed', 0)),
+        'progress': int(processed * 100 / total) if total else 100
+    })
+
+@app.route('/projects/<project_id>/upload/archive', methods=['POST'])
+def upload_archive(project_id):
+    """API for uploading a zip or tar archive of images (and YOLO labels)"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    if 'file' not in request.files or request.files['file'].filename == '':
+        return jsonify({'error': 'No selected file'}), 400
+
+    file = request.files['file']
+    archive_name = os.path.basename(file.filename)
+    extension = next((ext for ext in ARCHIVE_EXTENSIONS if archive_name.lower().endswith(ext)), None)
+    if extension is None:
+        return jsonify({'error': f'Unsupported archive type, expected one of {", ".join(ARCHIVE_EXTENSIONS)}'}), 400
+
+    try:
+        # Keep the archive in the incoming folder under a name the request won't clean up
+        archive_path = os.path.join(incoming_dir(project_path), f"archive_{uuid.uuid4().hex}{extension}")
+        os.replace(save_upload_stream(file, project_path), archive_path)
+    except Exception as e:
+        logger.error(f"Failed to save uploaded archive: {str(e)}")
+        return jsonify({'error': f'Failed to save uploaded archive: {str(e)}'}), 500
+
+    import_labels = request.form.get('labels', 'true').lower() != 'false'
+    task_id = register_upload_task(project_id, archive_name)
+    process_archive_task.apply_async(args=(project_id, archive_path, archive_name, import_labels), task_id=task_id)
+
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'status': 'queued'
+    })
+
+@app.route('/projects/<project_id>/uploads', methods=['POST'])
+def create_resumable_upload(project_id):
+    """API for starting a resumable upload of a single file"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename') or ''))
+    if not filename:
+        return jsonify({'error': 'No filename given'}), 400
+    try:
+        size = int(data.get('size'))
+        if size < 0:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'size must be a non-negative integer'}), 400
+    if RESUMABLE_MAX_SIZE and size > RESUMABLE_MAX_SIZE:
+        return jsonify({'error': f'File is larger than the {RESUMABLE_MAX_SIZE} byte upload limit'}), 413
+
+    upload_id = str(uuid.uuid4())
+    spool_dir = incoming_dir(project_path)
+    os.makedirs(spool_dir, exist_ok=True)
+    remove_expired_resumable_parts(spool_dir)
+    part_path = os.path.join(spool_dir, f"resumable_{upload_id}.part")
+    try:
+        # Preallocate a sparse file so ranges can be written at their offsets in any order
+        with open(part_path, 'wb') as part:
+            part.truncate(size)
+    except OSError as e:
+        logger.error(f"Failed to create resumable upload file: {str(e)}")
+        return jsonify({'error': f'Failed to create upload: {str(e)}'}), 500
+
+    write_task_state(redis_client, resumable_upload_key(upload_id), {
+        'project_id': project_id,
+        'filename': filename,
+        'size': str(size),
+        'path': part_path,
+        'created': datetime.now().isoformat()
+    })
+
+    return jsonify({
+        'success': True,
+        'upload_id': upload_id,
+        'filename': filename,
+        'size': size,
+        'missing': missing_ranges([], size)
+    }), 201
+
+@app.route('/projects/<project_id>/uploads/<upload_id>', methods=['GET', 'PUT', 'DELETE'])
+def resumable_upload(project_id, upload_id):
+    """API for querying, writing a byte range of, or aborting a resumable upload"""
+    upload = get_resumable_upload(project_id, upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    size = upload['size']
+
+    if request.method == 'DELETE':
+        redis_client.delete(resumable_upload_key(upload_id), f"{resumable_upload_key(upload_id)}:ranges")
+        try:
+            os.remove(upload['path'])
+        except FileNotFoundError:
+            pass
+        return jsonify({'success': True})
+
+    if request.method == 'PUT':
+        try:
+            start, end = parse_content_range(request.headers.get('Content-Range'), size)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+        if end > size:
+            return jsonify({'error': f'Content-Range {start}-{end - 1} is outside the upload size {size}'}), 416
+        if request.content_length is not None and request.content_length != end - start:
+            return jsonify({'error': 'Content-Length does not match Content-Range'}), 400
+
+        try:
+            written = write_upload_range(upload['path'], start, end, request.stream)
+        except FileNotFoundError:
+            return jsonify({'error': 'Upload not found'}), 404
+        except OSError as e:
+            logger.error(f"Failed to write upload range of {upload_id}: {str(e)}")
+            return jsonify({'error': f'Failed to write upload range: {str(e)}'}), 500
+
+        # Record what actually arrived, so a dropped connection only loses the rest of the range
+        if written:
+            # Every write extends the lifetime of the upload's state
+            pipe = redis_client.pipeline(transaction=False)
+            write_task_state(redis_client, f"{resumable_upload_key(upload_id)}:ranges",
+                             {str(start): str(start + written)}, pipe)
+            pipe.expire(resumable_upload_key(upload_id), UPLOAD_TASK_TTL)
+            pipe.execute()
+
+    received, missing = resumable_upload_ranges(upload_id, size)
+    return jsonify({
+        'upload_id': upload_id,
+        'filename': upload['filename'],
+        'size': size,
+        'received': received,
+        'missing': missing,
+        'complete': not missing
+    })
+
+@app.route('/projects/<project_id>/uploads/<upload_id>/finalize', methods=['POST'])
+def finalize_resumable_upload(project_id, upload_id):
+    """API for completing a resumable upload and queueing its processing"""
+    upload = get_resumable_upload(project_id, upload_id)
+    if not upload:
+        return jsonify({'error': 'Upload not found'}), 404
+
+    received, missing = resumable_upload_ranges(upload_id, upload['size'])
+    if missing:
+        return jsonify({'error': 'Upload is incomplete', 'missing': missing}), 409
+
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    images_path = os.path.join(project_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
+    filename = upload['filename']
+    file_path = os.path.join(images_path, filename)
+    try:
+        metadata = probe_upload(upload['path'], filename)
+        is_new_image = not os.path.exists(file_path)
+        duplicate_of = ingest_uploaded_file(upload['path'], file_path, project_id)
+    except FileNotFoundError:
+        return jsonify({'error': 'Upload not found'}), 404
+    except ValueError as e:
+        # The content is complete but not an image, uploading it again won't help
+        redis_client.delete(resumable_upload_key(upload_id), f"{resumable_upload_key(upload_id)}:ranges")
+        os.remove(upload['path'])
+        return jsonify({'error': f'Rejected {filename}: {str(e)}'}), 400
+    except Exception as e:
+        logger.error(f"Failed to place resumable upload {upload_id}: {str(e)}")
+        return jsonify({'error': f'Failed to save uploaded file: {str(e)}'}), 500
+
+    redis_client.delete(resumable_upload_key(upload_id), f"{resumable_upload_key(upload_id)}:ranges")
+
+    task_id = queue_upload_task(project_id, filename, file_path, is_new_image, metadata)
+    response = {
+        'success': True,
+        'task_id': task_id,
+        'status': 'queued'
+    }
+    if duplicate_of:
+        response['duplicate_of'] = duplicate_of
+    return jsonify(response)
+
+@app.route('/projects/<project_id>/upload/by_hash', methods=['POST'])
+def upload_image_by_hash(project_id):
+    """API for adding an image whose content is already stored, without sending its bytes"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    if not UPLOAD_DEDUP:
+        return jsonify({'error': 'Content deduplication is disabled'}), 404
+
+    data = request.get_json(silent=True) or {}
+    filename = os.path.basename(str(data.get('filename') or ''))
+    digest = str(data.get('sha256') or '').lower()
+    if not filename:
+        return jsonify({'error': 'No filename given'}), 400
+    if len(digest) != 64 or any(c not in '0123456789abcdef' for c in digest):
+        return jsonify({'error': 'sha256 must be a hex SHA-256 digest'}), 400
+
+    images_path = os.path.join(project_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
+    file_path = os.path.join(images_path, filename)
+    is_new_image = not os.path.exists(file_path)
+    duplicate_of = link_existing_content(digest, file_path)
+    if not duplicate_of:
+        # Unknown content, the client has to upload the bytes
+        return jsonify({'error': 'Content not found'}), 404
+
+    task_id = queue_upload_task(project_id, filename, file_path, is_new_image)
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'status': 'queued',
+        'duplicate_of': duplicate_of
+    })
+
 @app.route('/projects/<project_id>/upload/status/<task_id>', methods=['GET'])
 def upload_status(project_id, task_id):
     """API for checking upload status"""
-    # Check if task exists in Redis
-    if not redis_client.exists(f"upload_task:{task_id}"):
+    # Get task state from Redis in one round trip; fields missing from the hash (or
+    # the whole hash, once it has expired) come back as None
+    status, progress, image_info_json, error = (
+        value.decode('utf-8') if value is not None else None
+        for value in redis_client.hmget(f"upload_task:{task_id}", "status", "progress", "image_info", "error")
+    )
+    if status is None:
         return jsonify({'error': 'Task not found'}), 404
 
-    # Get task status from Redis
-    status = redis_client.hget(f"upload_task:{task_id}", "status").decode('utf-8')
-    progress = redis_client.hget(f"upload_task:{task_id}", "progress").decode('utf-8')
-
     response = {
         'task_id': task_id,
         'status': status,
-        'progress': progress
+        'progress': progress or '0'
     }
 
     # If task is completed, include image info
-    if status == 'completed':
-        image_info_json = redis_client.hget(f"upload_task:{task_id}", "image_info")
-        if image_info_json:
-            response['image_info'] = json.loads(image_info_json)
+    if status == 'completed' and image_info_json:
+        response['image_info'] = json.loads(image_info_json)
 
     # If task failed, include error message
-    if status == 'failed':
-        error = redis_client.hget(f"upload_task:{task_id}", "error")
-        if error:
-            response['error'] = error.decode('utf-8')
+    if status == 'failed' and error:
+        response['error'] = error
 
     return jsonify(response)
 
+@app.route('/projects/<project_id>/uploads/queue', methods=['GET'])
+def upload_queue_status(project_id):
+    """API for the upload queue depth and limits, so uploaders can adapt their concurrency"""
+    if not os.path.exists(os.path.join(app.config['PROJECTS_FOLDER'], project_id)):
+        return jsonify({'error': 'Project not found'}), 404
+
+    load = upload_load(project_id)
+    load['retry_after'] = UPLOAD_RETRY_AFTER
+    return jsonify(load)
+
 @app.route('/projects/<project_id>/uploads/pending', methods=['GET'])
 def pending_uploads(project_id):
     """API for getting all pending uploads for a project"""
     pending_tasks = []
 
-    # Get all tasks for this project
-    for task_id, task_info in upload_tasks.items():
-        if task_info.get('project_id') == project_id:
-            # Get current status from Redis
-            if redis_client.exists(f"upload_task:{task_id}"):
-                status = redis_client.hget(f"upload_task:{task_id}", "status").decode('utf-8')
-                progress = redis_client.hget(f"upload_task:{task_id}", "progress").decode('utf-8')
-
-                task_info['status'] = status
-                task_info['progress'] = progress
+    # Active tasks of this project, from any web process, with their state in one round trip
+    uploads_key = project_uploads_key(project_id)
+    pipe = redis_client.pipeline(transaction=False)
+    # Tasks whose state has expired can't be pending any more
+    pipe.zremrangebyscore(uploads_key, '-inf', time.time() - UPLOAD_TASK_TTL)
+    pipe.zrangebyscore(uploads_key, '-inf', '+inf')
+    task_ids = [task_id.decode('utf-8') for task_id in pipe.execute()[1]]
+
+    pipe = redis_client.pipeline(transaction=False)
+    for task_id in task_ids:
+        pipe.hmget(f"upload_task:{task_id}", "status", "progress", "filename", "created")
+    states = pipe.execute() if task_ids else []
+
+    finished = []
+    for task_id, (status, progress, filename, created) in zip(task_ids, states):
+        status = status.decode('utf-8') if status else None
+        # Only include tasks that are not completed or failed
+        if status is None or status in ['completed', 'failed']:
+            finished.append(task_id)
+            continue
+        pending_tasks.append({
+            'task_id': task_id,
+            'project_id': project_id,
+            'filename': filename.decode('utf-8') if filename else None,
+            'status': status,
+            'progress': progress.decode('utf-8') if progress else '0',
+            'created': created.decode('utf-8') if created else None
+        })
 
-                # Only include tasks that are not completed or failed
-                if status not in ['completed', 'failed']:
-                    pending_tasks.append({
-                        'task_id': task_id,
-                        **task_info
-                    })
+    # Drop tasks whose completion wasn't recorded in the index
+    if finished:
+        redis_client.zrem(uploads_key, *finished)
 
     return jsonify(pending_tasks)
 
@@ -1128,6 +4850,9 @@ def annotations(project_id, image_name):
 
     if request.method == 'GET':
         # Get annotations for an image
+        store = get_metadata_store(project_path)
+        if store:
+            return jsonify(store.get_annotations(decoded_image_name))
         if os.path.exists(annotation_file):
             with open(annotation_file, 'r') as f:
                 return jsonify(json.load(f))
@@ -1136,13 +4861,12 @@ def annotations(project_id, image_name):
     elif request.method == 'POST':
         # Save annotations for an image
         annotations = request.json
-
-        with open(annotation_file, 'w') as f:
-            json.dump(annotations, f)
+        save_image_annotations(project_path, decoded_image_name, annotations)
 
         return jsonify({'success': True})
 
 @app.route('/projects/<project_id>/filtered_images', methods=['GET'])
+@conditional_get(project_version_for)
 def get_filtered_images(project_id):
     """Get filtered images based on tab"""
     project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
@@ -1153,71 +4877,32 @@ def get_filtered_images(project_id):
     # Get the tab parameter from the query string
     tab = request.args.get('tab', 'all-images')
 
-    # Get all images
-    images_path = os.path.join(project_path, 'images')
-    os.makedirs(images_path, exist_ok=True)
+    # Pagination and sort parameters (optional, see project_images)
+    try:
+        sort, order, limit, cursor = parse_image_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
-    all_images = []
-    if os.path.exists(images_path):
-        for filename in os.listdir(images_path):
-            if filename.lower().endswith(('.png', '.jpg', '.jpeg', '.gif', '.bmp', '.webp')):
-                file_path = os.path.join(images_path, filename)
-                if os.path.isfile(file_path):
-                    # Create image info object
-                    image_info = {
-                        'name': filename,
-                        'path': file_path,
-                        'uploaded': datetime.fromtimestamp(os.path.getctime(file_path)).isoformat()
-                    }
-                    all_images.append(image_info)
-
-    # Sort images by creation time (newest first)
-    all_images.sort(key=lambda x: x['uploaded'], reverse=True)
-
-    # If tab is 'all-images', return all images
-    if tab == 'all-images':
-        return jsonify({'images': all_images})
-
-    # For other tabs, we need to check annotations
-    annotations_path = os.path.join(project_path, 'annotations')
-    os.makedirs(annotations_path, exist_ok=True)
+    # With the sqlite backend the tab is an indexed query on the image status
+    store = get_metadata_store(project_path)
+    if store:
+        try:
+            return store_image_list_response(store, TAB_STATUS_FILTERS.get(tab), sort, order, limit, cursor)
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-    annotated_images = []
-    unannotated_images = []
-    background_images = []
+    # Make sure the images folder exists
+    images_path = os.path.join(project_path, 'images')
+    os.makedirs(images_path, exist_ok=True)
 
-    # Check each image for annotations
-    for image in all_images:
-        image_name = image['name']
-        annotation_file = os.path.join(annotations_path, f"{os.path.splitext(image_name)[0]}.json")
+    # The membership index classifies images without opening annotation files;
+    # unknown tabs fall back to all images
+    images = filter_index.filter_images(project_id, tab, sort, order)
 
-        if os.path.exists(annotation_file):
-            with open(annotation_file, 'r') as f:
-                try:
-                    annotations = json.load(f)
-                    if annotations and len(annotations) > 0:
-                        annotated_images.append(image)
-
-                        # Check if it has a background annotation
-                        has_background = any(annotation.get('type') == 'background' for annotation in annotations)
-                        if has_background:
-                            background_images.append(image)
-                except json.JSONDecodeError:
-                    # If the file is not valid JSON, consider it unannotated
-                    unannotated_images.append(image)
-        else:
-            unannotated_images.append(image)
-
-    # Return images based on the tab
-    if tab == 'annotated-images':
-        return jsonify({'images': annotated_images})
-    elif tab == 'unannotated-images':
-        return jsonify({'images': unannotated_images})
-    elif tab == 'background-images':
-        return jsonify({'images': background_images})
-    else:
-        # Default to all images
-        return jsonify({'images': all_images})
+    try:
+        return image_list_response(images, sort, order, limit, cursor, image_metadata.get(project_id))
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
 @app.route('/projects/<project_id>/mark_as_background', methods=['POST'])
 def mark_as_background(project_id):
@@ -1238,10 +4923,6 @@ def mark_as_background(project_id):
     import urllib.parse
     decoded_image_name = urllib.parse.unquote(image_name)
 
-    # Create the annotations directory if it doesn't exist
-    annotations_path = os.path.join(project_path, 'annotations')
-    os.makedirs(annotations_path, exist_ok=True)
-
     # Create a background annotation
     background_annotation = [{
         "type": "background",
@@ -1250,9 +4931,7 @@ def mark_as_background(project_id):
     }]
 
     # Save the background annotation
-    annotation_file = os.path.join(annotations_path, f"{os.path.splitext(decoded_image_name)[0]}.json")
-    with open(annotation_file, 'w') as f:
-        json.dump(background_annotation, f)
+    save_image_annotations(project_path, decoded_image_name, background_annotation)
 
     return jsonify({'success': True})
 
@@ -1269,77 +4948,132 @@ def navigate_image(project_id):
     direction = request.args.get('direction', 'next')  # 'next' or 'previous'
     tab = request.args.get('tab', 'all-images')
 
-    # Get filtered images based on the tab
-    filtered_images_response = get_filtered_images(project_id)
-    filtered_images_data = filtered_images_response.json
-    filtered_images = filtered_images_data.get('images', [])
+    try:
+        sort, order, _, _ = parse_image_list_args(request.args)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    # Look up the neighbor directly in the ordered index of the tab
+    store = get_metadata_store(project_path)
+    if store:
+        image = store.neighbor_image(TAB_STATUS_FILTERS.get(tab), current_image, direction, sort, order)
+    else:
+        image = filter_index.neighbor(project_id, tab, current_image, direction, sort, order)
 
-    if not filtered_images:
+    if image is None:
         return jsonify({'error': 'No images found'}), 404
 
-    # Find the index of the current image
-    current_index = -1
-    for i, image in enumerate(filtered_images):
-        if image['name'] == current_image:
-            current_index = i
-            break
-
-    # If current image not found, return the first image
-    if current_index == -1:
-        return jsonify({'image': filtered_images[0]})
-
-    # Calculate the index of the previous/next image (with wrap-around)
-    if direction == 'previous':
-        new_index = (current_index - 1) % len(filtered_images)
-    else:  # direction == 'next'
-        new_index = (current_index + 1) % len(filtered_images)
-
     # Return the new image
-    return jsonify({'image': filtered_images[new_index]})
+    metadata = None if store else image_metadata.get(project_id).get(image['name'], {})
+    return jsonify({'image': image_info_response(image, metadata)})
 
 @app.route('/projects/<project_id>/export', methods=['POST'])
 def export_project(project_id):
-    """Export project in YOLO format"""
+    """Export project in YOLO or COCO format (queued as a Celery task)"""
     project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
 
     if not os.path.exists(project_path):
         return jsonify({'error': 'Project not found'}), 404
 
-    # Load project config
-    with open(os.path.join(project_path, 'config.json'), 'r') as f:
-        config = json.load(f)
+    data = request.get_json(silent=True) or {}
+    export_format = data.get('format', 'yolo')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    task = data.get('task', 'detect')
+    if task not in EXPORT_TASKS:
+        return jsonify({'error': f'task must be one of {", ".join(EXPORT_TASKS)}'}), 400
+    try:
+        val_split = float(data.get('val_split', EXPORT_VAL_SPLIT))
+        if not 0 <= val_split < 1:
+            raise ValueError
+    except (TypeError, ValueError):
+        return jsonify({'error': 'val_split must be a number from 0 to 1'}), 400
+    placement = data.get('placement', EXPORT_PLACEMENT)
+    if placement not in EXPORT_PLACEMENTS:
+        return jsonify({'error': f'placement must be one of {", ".join(EXPORT_PLACEMENTS)}'}), 400
+
+    active_task_id = active_export_task(project_id)
+    if active_task_id:
+        return jsonify({'error': 'An export of this project is already in progress',
+                        'task_id': active_task_id}), 409
+
+    # Write the queued state before dispatching, so a fast worker's progress isn't overwritten
+    task_id = str(uuid.uuid4())
+    write_task_state(redis_client, export_task_key(task_id), {
+        'status': 'queued',
+        'progress': '0',
+        'project_id': project_id,
+        'format': json.dumps(export_format),
+        'created': datetime.now().isoformat()
+    })
+    redis_client.hset(PROJECT_EXPORTS_KEY, project_id, task_id)
+    if export_format == 'coco':
+        export_coco_task.apply_async(args=(project_id, val_split, placement), task_id=task_id)
+    else:
+        export_yolo_task.apply_async(args=(project_id, task, val_split, placement), task_id=task_id)
 
-    classes = config.get('classes', [])
+    return jsonify({
+        'success': True,
+        'task_id': task_id,
+        'status': 'queued'
+    })
 
-    # Create export directories
-    export_path = os.path.join(project_path, 'export')
-    os.makedirs(export_path, exist_ok=True)
+@app.route('/projects/<project_id>/export/download', methods=['GET'])
+def download_export(project_id):
+    """Download the project's YOLO (or, with ?format=coco, COCO) export as a zip streamed while it is built"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
 
-    train_images_path = os.path.join(export_path, 'train', 'images')
-    train_labels_path = os.path.join(export_path, 'train', 'labels')
-    val_images_path = os.path.join(export_path, 'val', 'images')
-    val_labels_path = os.path.join(export_path, 'val', 'labels')
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
 
-    os.makedirs(train_images_path, exist_ok=True)
-    os.makedirs(train_labels_path, exist_ok=True)
-    os.makedirs(val_images_path, exist_ok=True)
-    os.makedirs(val_labels_path, exist_ok=True)
+    export_format = request.args.get('format', 'yolo')
+    if export_format not in EXPORT_FORMATS:
+        return jsonify({'error': f'format must be one of {", ".join(EXPORT_FORMATS)}'}), 400
+    folder, entries, marker = EXPORT_FORMATS[export_format]
+    export_path = os.path.join(project_path, EXPORT_DIRNAME, folder)
+    if not os.path.exists(os.path.join(export_path, marker)):
+        return jsonify({'error': f'The project has not been exported in {export_format.upper()} format yet'}), 404
 
-    # Create data.yaml
-    data_yaml = f"""train: train/images
-val: val/images
-nc: {len(classes)}
-names: {json.dumps(classes)}
-"""
+    try:
+        with open(os.path.join(project_path, 'config.json'), 'r') as f:
+            project_name = json.load(f).get('name') or project_id
+    except (OSError, json.JSONDecodeError):
+        project_name = project_id
+    import urllib.parse
+    filename = f"{project_name}_{export_format}.zip"
+    # ASCII fallback for old clients, the real (possibly non-ASCII) name in filename*
+    ascii_filename = secure_filename(filename) or f'export_{export_format}.zip'
+
+    # Held until the zip is fully sent, so no export rewrites the files halfway through
+    lock = ExportLock(project_path, shared=True)
+    if not lock.acquire(blocking=False):
+        return jsonify({'error': 'An export of this project is in progress, try again when it has finished'}), 409
+
+    response = Response(stream_with_context(stream_export_zip(export_path, entries)), mimetype='application/zip')
+    response.call_on_close(lock.release)
+    response.headers['Content-Disposition'] = (
+        f"attachment; filename=\"{ascii_filename}\"; filename*=UTF-8''{urllib.parse.quote(filename)}"
+    )
+    response.headers['Cache-Control'] = 'no-store'
+    return response
 
-    with open(os.path.join(export_path, 'data.yaml'), 'w') as f:
-        f.write(data_yaml)
+@app.route('/projects/<project_id>/export/<task_id>', methods=['GET'])
+def export_status(project_id, task_id):
+    """API for checking the status of an export task"""
+    state = redis_client.hgetall(export_task_key(task_id))
+    state = {key.decode('utf-8'): value.decode('utf-8') for key, value in state.items()}
+    if not state or state.get('project_id') != project_id:
+        return jsonify({'error': 'Export not found'}), 404
 
-    # For now, we'll just return success - actual export would copy images and convert annotations
-    return jsonify({
-        'success': True,
-        'message': 'Export structure created. In a real implementation, this would also convert and copy the annotations.'
-    })
+    response = {
+        'task_id': task_id,
+        'status': state.get('status'),
+        'progress': int(state.get('progress', 0))
+    }
+    for key in ('format', 'counts', 'error'):
+        if key in state:
+            response[key] = json.loads(state[key])
+    return jsonify(response)
 
 @app.route('/projects/<project_id>/images/<filename>')
 def serve_image(project_id, filename):
@@ -1363,6 +5097,86 @@ def serve_image(project_id, filename):
 
     return response
 
+@app.route('/projects/<project_id>/thumbs/<int:size>/<filename>')
+def serve_thumbnail(project_id, filename, size):
+    """Serve a thumbnail of an image, generating it if it doesn't exist yet"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return "Project not found", 404
+    if size not in THUMBNAIL_SIZES:
+        return "Unsupported thumbnail size", 404
+
+    filename = os.path.basename(filename)
+    if not os.path.exists(os.path.join(project_path, 'images', filename)):
+        return "Image not found", 404
+
+    if thumbnails_stale(project_path, filename, size) and not generate_thumbnails(project_path, filename, force=True):
+        return "Image can't be read", 415
+
+    response = send_from_directory(
+        os.path.dirname(thumbnail_path(project_path, size, filename)),
+        os.path.basename(thumbnail_path(project_path, size, filename)),
+        mimetype='image/webp' if THUMBNAIL_FORMAT == 'WEBP' else 'image/jpeg'
+    )
+    # Thumbnails only change when an image is replaced under the same name, in which
+    # case the ETag (from the thumbnail's mtime and size) changes too
+    response.headers['Cache-Control'] = 'public, max-age=604800'
+    return response
+
+@app.route('/projects/<project_id>/deepzoom/<filename>.dzi')
+def serve_deepzoom_descriptor(project_id, filename):
+    """Serve the Deep Zoom descriptor of an image, queueing its pyramid if needed"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    filename = os.path.basename(filename)
+    if not os.path.exists(os.path.join(project_path, 'images', filename)):
+        return "Image not found", 404
+
+    if not request_tile_pyramid(project_id, filename):
+        response = make_response("Tiles are being generated", 503)
+        response.headers['Retry-After'] = '2'
+        return response
+
+    descriptor_path, _ = deepzoom_paths(project_path, filename)
+    response = send_from_directory(os.path.dirname(descriptor_path), os.path.basename(descriptor_path),
+                                   mimetype='application/xml')
+    response.headers['Cache-Control'] = 'no-cache'
+    return response
+
+@app.route('/projects/<project_id>/deepzoom/<filename>_files/<int:level>/<int:col>_<int:row>.<tile_format>')
+def serve_deepzoom_tile(project_id, filename, level, col, row, tile_format):
+    """Serve one tile of an image's Deep Zoom pyramid"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+    filename = os.path.basename(filename)
+    if tile_format not in ('jpg', 'png') or not os.path.exists(os.path.join(project_path, 'images', filename)):
+        return "Tile not found", 404
+
+    if not request_tile_pyramid(project_id, filename):
+        response = make_response("Tiles are being generated", 503)
+        response.headers['Retry-After'] = '2'
+        return response
+
+    _, tiles_dir = deepzoom_paths(project_path, filename)
+    level_dir = os.path.join(tiles_dir, str(level))
+    if not os.path.exists(os.path.join(level_dir, f"{col}_{row}.{tile_format}")):
+        return "Tile not found", 404
+    response = send_from_directory(level_dir, f"{col}_{row}.{tile_format}")
+    # Tiles are rebuilt into a new folder when the image is replaced; the descriptor
+    # is revalidated on every load, tiles are revalidated through their ETag
+    response.headers['Cache-Control'] = 'public, max-age=604800'
+    return response
+
+@app.route('/projects/<project_id>/thumbs/backfill', methods=['POST'])
+def backfill_project_thumbnails(project_id):
+    """API for generating the thumbnails missing in an existing project"""
+    project_path = os.path.join(app.config['PROJECTS_FOLDER'], project_id)
+
+    if not os.path.exists(project_path):
+        return jsonify({'error': 'Project not found'}), 404
+
+    task = backfill_thumbnails_task.delay(project_id)
+    return jsonify({'success': True, 'task_id': task.id, 'status': 'queued'})
+
 @app.route('/projects/<project_id>/images/<filename>', methods=['DELETE'])
 def delete_image(project_id, filename):
     """Delete an image from the project"""
@@ -1387,17 +5201,40 @@ def delete_image(project_id, filename):
         os.remove(image_path)
     except Exception as e:
         return jsonify({'error': f'Failed to delete image file: {str(e)}'}), 500
+    image_catalog.invalidate(project_id)
 
     # We no longer use images_list.json
 
     # Delete any associated annotations
     annotations_path = os.path.join(project_path, 'annotations')
     annotation_file = os.path.join(annotations_path, f"{os.path.splitext(filename)[0]}.json")
-    if os.path.exists(annotation_file):
+    old_summary = None
+    image_delta = -1 if decoded_filename.lower().endswith(IMAGE_EXTENSIONS) else 0
+    # Read and remove the annotations under the stats lock, so a concurrent save
+    # can't change them between the read and the stats update
+    with ProjectStatsLock(project_path):
+        if os.path.exists(annotation_file):
+            summary = read_annotation_summary(annotation_file)
+            try:
+                os.remove(annotation_file)
+                old_summary = summary
+            except Exception as e:
+                logger.warning(f"Failed to delete annotation file: {str(e)}")
+
         try:
-            os.remove(annotation_file)
+            apply_project_stats_change(project_path, image_delta=image_delta, old_summary=old_summary)
         except Exception as e:
-            logger.warning(f"Failed to delete annotation file: {str(e)}")
+            logger.error(f"Failed to update stats for {project_path}: {str(e)}")
+    if old_summary:
+        filter_index.update(project_id, os.path.splitext(filename)[0], summarize_annotations(None))
+
+    store = get_metadata_store(project_path)
+    if store:
+        store.remove_image(decoded_filename)
+    else:
+        image_metadata.update(project_id, {decoded_filename: None})
+    remove_thumbnails(project_path, decoded_filename)
+    remove_tile_pyramid(project_path, decoded_filename)
 
     return jsonify({'success': True, 'message': 'Image deleted successfully'})
 
@@ -1420,6 +5257,69 @@ def serve_socketio_client():
     return send_from_directory('node_modules/socket.io-client/dist', 'socket.io.js')
 
 
+def rebuild_all_stats(project_ids=None):
+    """Rebuild the stats, filter membership and image metadata indexes of the given projects (all by default)"""
+    projects_folder = app.config['PROJECTS_FOLDER']
+    if not project_ids:
+        project_ids = [
+            name for name in os.listdir(projects_folder)
+            if os.path.exists(os.path.join(projects_folder, name, 'config.json'))
+        ]
+
+    for project_id in project_ids:
+        project_path = os.path.join(projects_folder, project_id)
+        if not os.path.exists(os.path.join(project_path, 'config.json')):
+            logger.error(f"Project {project_id} not found")
+            continue
+        stats = rebuild_project_stats(project_path)
+        filter_index.rebuild(project_id)
+        image_metadata.rebuild(project_id)
+        logger.info(f"Rebuilt stats for project {project_id}: {stats['imageCount']} images, "
+                    f"{stats['annotatedCount']} annotated, {stats['backgroundCount']} background")
+
+
+def migrate_all_to_sqlite(project_ids=None):
+    """Build the SQLite metadata store of the given projects (all projects by default)"""
+    projects_folder = app.config['PROJECTS_FOLDER']
+    if not project_ids:
+        project_ids = [
+            name for name in os.listdir(projects_folder)
+            if os.path.exists(os.path.join(projects_folder, name, 'config.json'))
+        ]
+
+    for project_id in project_ids:
+        project_path = os.path.join(projects_folder, project_id)
+        if not os.path.exists(os.path.join(project_path, 'config.json')):
+            logger.error(f"Project {project_id} not found")
+            continue
+        image_count, annotation_count = migrate_project_to_sqlite(project_path)
+        logger.info(f"Migrated project {project_id} to SQLite: {image_count} images, {annotation_count} annotations")
+
 
 if __name__ == '__main__':
+    if '--rebuild-stats' in sys.argv:
+        # Maintenance: python app.py --rebuild-stats [project_id ...]
+        rebuild_all_stats([arg for arg in sys.argv[1:] if not arg.startswith('--')])
+        sys.exit(0)
+
+    if '--migrate-sqlite' in sys.argv:
+        # Maintenance: python app.py --migrate-sqlite [project_id ...]
+        migrate_all_to_sqlite([arg for arg in sys.argv[1:] if not arg.startswith('--')])
+        sys.exit(0)
+
+    if '--backfill-thumbnails' in sys.argv:
+        # Maintenance: python app.py --backfill-thumbnails [project_id ...]
+        project_ids = [arg for arg in sys.argv[1:] if not arg.startswith('--')] or [
+            name for name in os.listdir(app.config['PROJECTS_FOLDER'])
+            if os.path.exists(os.path.join(app.config['PROJECTS_FOLDER'], name, 'config.json'))
+        ]
+        for project_id in project_ids:
+            logger.info(f"Generated thumbnails of {backfill_thumbnails(project_id)} images in project {project_id}")
+        sys.exit(0)
+
+    if '--gc-blobs' in sys.argv:
+        # Maintenance: python app.py --gc-blobs
+        logger.info(f"Removed {gc_blobs()} unreferenced blobs")
+        sys.exit(0)
+
     socketio.run(app, debug=True)
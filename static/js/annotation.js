@@ -43,16 +43,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Tab-related variables
     let currentTab = 'all-images'; // Default tab
-    let annotatedImages = []; // Array to store images with annotations
-    let unannotatedImages = []; // Array to store images without annotations
-    let backgroundImages = []; // Array to store images with background annotations
     let filteredImages = []; // Array to store images filtered by the current tab
 
+    // Image list paging: the images of the current tab are fetched a page at a time
+    const imagePageSize = 100; // Images fetched per request
+    let nextImagesCursor = null; // Cursor of the next page
+    let allImagesLoaded = false; // Flag set once the last page has been fetched
+    let imagesTotal = 0; // Number of images in the current tab (X-Total-Count)
+    let imagePageRequest = null; // Promise of the page being fetched
+    let imagePageGeneration = 0; // Incremented when the list is reset, to drop pages fetched for an older list
+
     // Upload queue variables
     let uploadQueue = []; // Queue of files to upload
     let pendingUploads = {}; // Map of task_id to upload info
     let isUploading = false; // Flag to indicate if uploads are in progress
     let maxConcurrentUploads = 3; // Maximum number of concurrent uploads
+    const uploadConcurrencyLimit = 3; // Concurrency is raised back up to this after the server stops refusing uploads
+    let uploadRetryAt = 0; // Time before which the server asked us not to upload (429 Retry-After)
+    let uploadQueueTimer = null; // Pending processUploadQueue call, so only one polling chain runs
+    let uploadBatchSize = 200; // Maximum number of files sent in one batch upload request
     let socket = null; // Socket.IO connection
 
     // Panning variables
@@ -62,6 +71,10 @@ document.addEventListener('DOMContentLoaded', function() {
     let offsetX = 0;
     let offsetY = 0;
 
+    // Tiled (Deep Zoom) display of large images
+    const maxTiledCanvasSize = 16384; // Largest canvas side browsers reliably allocate
+    let tileRedrawPending = false; // Flag to redraw tiles at most once per frame
+
     // Initialize
     init();
 
@@ -260,24 +273,19 @@ document.addEventListener('DOMContentLoaded', function() {
         if (existingIndex !== -1) {
             // Update existing image
             localImages[existingIndex] = {
-                name: imageInfo.name,
-                element: localImages[existingIndex].element,
-                path: imageInfo.path
+                ...imageInfo,
+                thumbnail: thumbnailUrl(imageInfo.name, 512)
             };
         } else {
-            // Create image object
+            // Preload the thumbnail; the image itself is fetched when it is opened
             const img = new Image();
-
-            // Load from the server path
-            const normalizedImageName = imageInfo.name.replace(/\\/g, '/');
-            img.src = `/projects/${projectId}/images/${encodeURIComponent(normalizedImageName)}`;
+            img.src = thumbnailUrl(imageInfo.name, 512);
 
             img.onload = function() {
                 // Add to local images array
                 localImages.push({
-                    name: imageInfo.name,
-                    element: img,
-                    path: imageInfo.path
+                    ...imageInfo,
+                    thumbnail: img.src
                 });
 
                 // Load the first image if none is loaded
@@ -300,169 +308,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Function to load saved images from server
     // This function works with partially uploaded projects, allowing users to annotate images
-    // that have already been uploaded while others are still being uploaded
+    // that have already been uploaded while others are still being uploaded.
+    // Only the first page of images is fetched here, the others as the user gets to them
     function loadSavedImages() {
-        // Show loading indicator in the image counter with static "Image 1" and dynamic total count
+        // Show loading indicator in the image counter
         imageCounter.innerHTML = 'Image 1 of 0 <div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div>';
 
         console.log(`[loadSavedImages] Starting to load images for project ${projectId}`);
 
-        // Get saved images for this project from the server
-        fetch(`/projects/${projectId}/images`)
-            .then(response => {
-                console.log(`[loadSavedImages] Server response status: ${response.status}`);
-                return response.json();
-            })
-            .then(data => {
-                console.log(`[loadSavedImages] Received data:`, data);
-
-                if (data && data.images && data.images.length > 0) {
-                    console.log(`[loadSavedImages] Found ${data.images.length} images`);
-
-                    // Reset localImages array to prevent duplication
-                    localImages = [];
-
-                    // Create a counter to track loaded images
-                    let loadedImagesCount = 0;
-                    const totalImages = data.images.length;
-
-                    // Update the image counter with static "Image 1" and initial total count
-                    imageCounter.innerHTML = `Image 1 of 0 <div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div>`;
-
-                    // Load each saved image
-                    data.images.forEach((savedImage, index) => {
-                        console.log(`[loadSavedImages] Processing image ${index + 1}/${totalImages}: ${savedImage.name}`);
-
-                        // If we have a path, use it to load the image
-                        if (savedImage.path) {
-                            // Create image object
-                            const img = new Image();
-
-                            // Load from the server path
-                            const normalizedImageName = savedImage.name.replace(/\\/g, '/');
-                            const imageSrc = `/projects/${projectId}/images/${encodeURIComponent(normalizedImageName)}`;
-                            console.log(`[loadSavedImages] Loading image from: ${imageSrc}`);
-
-                            // Add timestamp to prevent caching
-                            img.src = `${imageSrc}?t=${new Date().getTime()}`;
-
-                            img.onload = function() {
-                                console.log(`[loadSavedImages] Successfully loaded image: ${savedImage.name}`);
-
-                                // Add to local images array
-                                localImages.push({
-                                    name: savedImage.name,
-                                    element: img,
-                                    path: savedImage.path
-                                });
-
-                                // Increment the loaded images counter
-                                loadedImagesCount++;
-
-                                // Update the loading progress with static "Image 1" and dynamic total count
-                                imageCounter.innerHTML = `Image 1 of ${loadedImagesCount} <div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div>`;
-
-                                // Load the first image if none is loaded
-                                if (!currentImage && localImages.length === 1) {
-                                    console.log(`[loadSavedImages] Loading first image: ${savedImage.name}`);
-                                    loadLocalImage(savedImage.name);
-                                }
-
-                                // Update the image counter when all images are loaded
-                                if (loadedImagesCount === totalImages) {
-                                    console.log(`[loadSavedImages] All ${totalImages} images loaded successfully`);
-
-                                    // Initialize filtered images with all images
-                                    filteredImages = [...localImages];
-
-                                    // Update annotation status to categorize images
-                                    updateAnnotationStatus();
-
-                                    // Load the first image if there are images available
-                                    if (localImages.length > 0 && !currentImage) {
-                                        console.log(`[loadSavedImages] Loading first image after all images loaded: ${localImages[0].name}`);
-                                        loadLocalImage(localImages[0].name);
-                                    }
+        resetImagePages();
+        loadNextImagePage()
+            .then(() => {
+                console.log(`[loadSavedImages] Loaded ${localImages.length} of ${imagesTotal} images`);
 
-                                    updateImageCounter();
-
-                                    // Periodic refresh has been disabled as per requirements
-                                    // Users will only see images that were available at the time the annotation page was opened
-                                    // setUpPeriodicImageRefresh();
-                                }
-                            };
-
-                            // If image fails to load
-                            img.onerror = function() {
-                                console.error(`[loadSavedImages] Failed to load image: ${savedImage.name} from path: ${savedImage.path}`);
-
-                                // Try again with a different approach
-                                console.log(`[loadSavedImages] Retrying with a different approach for: ${savedImage.name}`);
-                                const retryImg = new Image();
-                                const retryImageSrc = `/projects/${projectId}/images/${encodeURIComponent(normalizedImageName)}?retry=true&t=${new Date().getTime()}`;
-                                retryImg.src = retryImageSrc;
-
-                                retryImg.onload = function() {
-                                    console.log(`[loadSavedImages] Retry successful for image: ${savedImage.name}`);
-
-                                    // Add to local images array
-                                    localImages.push({
-                                        name: savedImage.name,
-                                        element: retryImg,
-                                        path: savedImage.path
-                                    });
-
-                                    // Increment the loaded images counter
-                                    loadedImagesCount++;
-
-                                    // Update the loading progress with static "Image 1" and dynamic total count
-                                    imageCounter.innerHTML = `Image 1 of ${loadedImagesCount} <div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div>`;
-
-                                    // Load the first image if none is loaded
-                                    if (!currentImage && localImages.length === 1) {
-                                        loadLocalImage(savedImage.name);
-                                    }
-
-                                    // Update the image counter when all images are loaded
-                                    if (loadedImagesCount === totalImages) {
-                                        // Load the first image if there are images available
-                                        if (localImages.length > 0 && !currentImage) {
-                                            console.log(`[loadSavedImages] Loading first image after all images loaded (retry): ${localImages[0].name}`);
-                                            loadLocalImage(localImages[0].name);
-                                        }
-
-                                        updateImageCounter();
-                                    }
-                                };
-
-                                retryImg.onerror = function() {
-                                    console.error(`[loadSavedImages] Retry also failed for image: ${savedImage.name}`);
-
-                                    // Increment the loaded images counter even for failed images
-                                    loadedImagesCount++;
-
-                                    // Update the loading progress
-                                    imageCounter.innerHTML = `Loading images (${loadedImagesCount}/${totalImages})... <div class="spinner-border spinner-border-sm" role="status"><span class="visually-hidden">Loading...</span></div>`;
-
-                                    // Update the image counter when all images are loaded
-                                    if (loadedImagesCount === totalImages) {
-                                        updateImageCounter();
-                                    }
-                                };
-                            };
-                        } else {
-                            console.warn(`[loadSavedImages] Image ${savedImage.name} has no path`);
-                            loadedImagesCount++;
-                        }
-                    });
-
-                    // We'll now always load the first image when the page is opened
-                    // This is handled in the image loading completion code above
-                } else {
-                    console.log(`[loadSavedImages] No images found for project ${projectId}`);
-                    // No images found, update the counter
-                    updateImageCounter();
+                // Load the first image if there are images available
+                if (localImages.length > 0 && !currentImage) {
+                    loadLocalImage(localImages[0].name);
                 }
+
+                updateImageCounter();
             })
             .catch(error => {
                 console.error(`[loadSavedImages] Error loading saved images:`, error);
@@ -471,6 +335,70 @@ document.addEventListener('DOMContentLoaded', function() {
             });
     }
 
+    // Function to forget the loaded pages, before loading the images of another tab
+    function resetImagePages() {
+        localImages = [];
+        filteredImages = localImages;
+        nextImagesCursor = null;
+        allImagesLoaded = false;
+        imagesTotal = 0;
+        imagePageRequest = null;
+        imagePageGeneration++;
+    }
+
+    // Function to fetch the next page of images of the current tab into localImages
+    function loadNextImagePage() {
+        if (imagePageRequest) {
+            return imagePageRequest;
+        }
+        if (allImagesLoaded) {
+            return Promise.resolve();
+        }
+
+        const generation = imagePageGeneration;
+        const cursorParam = nextImagesCursor ? `&cursor=${encodeURIComponent(nextImagesCursor)}` : '';
+        imagePageRequest = fetch(`/projects/${projectId}/filtered_images?tab=${currentTab}&limit=${imagePageSize}${cursorParam}`)
+            .then(response => {
+                if (!response.ok) {
+                    throw new Error('Failed to get images');
+                }
+                const total = parseInt(response.headers.get('X-Total-Count'), 10);
+                return response.json().then(data => ({ data, total }));
+            })
+            .then(({ data, total }) => {
+                if (generation !== imagePageGeneration) {
+                    return; // The list was reset while this page was being fetched
+                }
+                // Skip images already listed, in case images were added since the previous page
+                const loadedNames = new Set(localImages.map(img => img.name));
+                (data.images || []).forEach(image => {
+                    if (!loadedNames.has(image.name)) {
+                        localImages.push({ ...image, thumbnail: thumbnailUrl(image.name, 512) });
+                    }
+                });
+                nextImagesCursor = data.next_cursor || null;
+                allImagesLoaded = !nextImagesCursor;
+                imagesTotal = Number.isNaN(total) ? localImages.length : total;
+            })
+            .finally(() => {
+                if (generation === imagePageGeneration) {
+                    imagePageRequest = null;
+                }
+            });
+        return imagePageRequest;
+    }
+
+    // Function to get the URL of a server-side thumbnail of an image (128, 256 or 512 pixels)
+    function thumbnailUrl(imageName, size) {
+        const normalizedImageName = imageName.replace(/\\/g, '/');
+        return `/projects/${projectId}/thumbs/${size}/${encodeURIComponent(normalizedImageName)}`;
+    }
+
+    // Function to fetch all remaining pages of the current tab
+    function loadAllImagePages() {
+        return allImagesLoaded ? Promise.resolve() : loadNextImagePage().then(loadAllImagePages);
+    }
+
     // Function to save images to server
     function saveImagesToServer() {
         // Only save the last active image information
@@ -525,6 +453,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 if (index !== -1) {
                     localImages.splice(index, 1);
                 }
+                imagesTotal = Math.max(0, imagesTotal - 1);
 
                 // If this was the current image, clear it
                 if (currentImageName === imageName) {
@@ -643,6 +572,10 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Function to process the upload queue
     function processUploadQueue() {
+        // Called directly (e.g. after a refusal) while a call is scheduled: replace it
+        clearTimeout(uploadQueueTimer);
+        uploadQueueTimer = null;
+
         // If no files in queue or already at max concurrent uploads, return
         if (uploadQueue.length === 0) {
             isUploading = false;
@@ -656,20 +589,28 @@ document.addEventListener('DOMContentLoaded', function() {
             return;
         }
 
-        // Count current active uploads
+        // Wait while the server is refusing uploads
+        const retryDelay = uploadRetryAt - Date.now();
+        if (retryDelay > 0) {
+            isUploading = true;
+            uploadQueueTimer = setTimeout(processUploadQueue, retryDelay);
+            return;
+        }
+
+        // Count current active uploads, including requests still being sent
         const activeUploads = Object.values(pendingUploads).filter(
-            upload => upload.status === 'queued' || upload.status === 'processing'
+            upload => upload.status === 'uploading' || upload.status === 'queued' || upload.status === 'processing'
         ).length;
 
         // If at max concurrent uploads, wait and try again later
         if (activeUploads >= maxConcurrentUploads) {
             isUploading = true;
-            setTimeout(processUploadQueue, 1000);
+            uploadQueueTimer = setTimeout(processUploadQueue, 1000);
             return;
         }
 
-        // Get next file from queue
-        const file = uploadQueue.shift();
+        // Get next batch of files from queue
+        const files = uploadQueue.splice(0, uploadBatchSize);
 
         // Update queue status
         const queueStatusElement = document.getElementById('upload-queue-status');
@@ -677,28 +618,28 @@ document.addEventListener('DOMContentLoaded', function() {
             queueStatusElement.innerHTML = `Queued ${uploadQueue.length} files for upload`;
         }
 
-        // Upload the file
-        uploadFile(file);
+        // Upload the batch
+        uploadBatch(files);
 
         // Set uploading flag
         isUploading = true;
 
         // Process next file after a short delay
-        setTimeout(processUploadQueue, 500);
+        uploadQueueTimer = setTimeout(processUploadQueue, 500);
     }
 
-    // Function to upload a single file
-    function uploadFile(file) {
-        // Create FormData to send the file to the server
+    // Function to upload a batch of files in a single request
+    function uploadBatch(files) {
+        // Create FormData to send the files to the server
         const formData = new FormData();
-        formData.append('file', file);
+        files.forEach(file => formData.append('files', file));
 
-        // Create a unique ID for this upload (before we get the task ID from the server)
+        // Create a unique ID for this upload (before we get the batch ID from the server)
         const clientId = `client-${Date.now()}-${Math.random().toString(36).substr(2, 9)}`;
 
         // Add to pending uploads with initial status
         pendingUploads[clientId] = {
-            filename: file.name,
+            filenames: files.map(file => file.name),
             status: 'uploading',
             progress: 0,
             created: new Date().toISOString()
@@ -710,44 +651,54 @@ document.addEventListener('DOMContentLoaded', function() {
         // Save pending uploads to localStorage
         savePendingUploads();
 
-        // Upload the file to the server
-        fetch(`/projects/${projectId}/upload`, {
+        // Upload the files to the server
+        fetch(`/projects/${projectId}/upload/batch`, {
             method: 'POST',
             body: formData
         })
         .then(response => {
+            if (response.status === 429) {
+                // The server's upload queue is full: requeue the files and back off
+                return response.json().catch(() => ({})).then(data => {
+                    deferUploadBatch(clientId, files, response.headers.get('Retry-After'), data);
+                    return null;
+                });
+            }
             if (!response.ok) {
-                throw new Error('Failed to upload image');
+                throw new Error('Failed to upload images');
             }
             return response.json();
         })
         .then(data => {
-            if (data.success && data.task_id) {
-                // Update pending uploads with task ID
-                const taskId = data.task_id;
+            if (!data) {
+                return;
+            }
+            if (data.success && data.batch_id) {
+                // Accepted, so slowly raise concurrency again after a back-off
+                maxConcurrentUploads = Math.min(maxConcurrentUploads + 1, uploadConcurrencyLimit);
+
+                // Update pending uploads with batch ID
+                const batchId = data.batch_id;
 
-                // Copy client upload info to task ID
-                pendingUploads[taskId] = {
+                // Copy client upload info to batch ID
+                pendingUploads[batchId] = {
                     ...pendingUploads[clientId],
                     status: data.status || 'queued',
-                    task_id: taskId
+                    batch_id: batchId
                 };
 
                 // Remove client ID entry
                 delete pendingUploads[clientId];
 
-                // Update UI with task ID
-                const progressElement = document.getElementById(`upload-progress-${clientId}`);
-                if (progressElement) {
-                    progressElement.id = `upload-progress-${taskId}`;
-                    updateUploadProgress(taskId, 0, data.status || 'queued');
-                }
+                // Update UI with batch ID
+                updateUploadProgress(batchId, 0, data.status || 'queued');
 
                 // Save pending uploads to localStorage
                 savePendingUploads();
 
                 // Start checking status
-                checkUploadStatus(taskId);
+                checkUploadStatus(batchId);
+                waitForUploadBatch(batchId);
             } else {
                 // Update status to failed
                 pendingUploads[clientId].status = 'failed';
@@ -767,7 +718,7 @@ document.addEventListener('DOMContentLoaded', function() {
             }
         })
         .catch(error => {
-            console.error('Error uploading image:', error);
+            console.error('Error uploading images:', error);
 
             // Update status to failed
             pendingUploads[clientId].status = 'failed';
@@ -787,15 +738,58 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
 
+    // Function to follow an accepted batch until the server has processed it, so it stops
+    // counting against maxConcurrentUploads (checkUploadStatus is disabled on this page)
+    function waitForUploadBatch(batchId) {
+        fetch(`/projects/${projectId}/upload/batch/${batchId}`)
+            .then(response => response.ok ? response.json() : { status: 'unknown' })
+            .catch(() => null)
+            .then(data => {
+                if (!data || data.status === 'queued' || data.status === 'processing') {
+                    // Still running, or the status request failed
+                    if (data) {
+                        pendingUploads[batchId].status = data.status;
+                    }
+                    setTimeout(() => waitForUploadBatch(batchId), 2000);
+                    return;
+                }
+                delete pendingUploads[batchId];
+            });
+    }
+
+    // Function to put a batch refused by the server back in the queue and slow down uploads
+    function deferUploadBatch(clientId, files, retryAfter, load) {
+        delete pendingUploads[clientId];
+        savePendingUploads();
+        uploadQueue.unshift(...files);
+
+        const seconds = parseInt(retryAfter, 10) || (load && load.retry_after) || 10;
+        uploadRetryAt = Date.now() + seconds * 1000;
+        maxConcurrentUploads = Math.max(1, Math.floor(maxConcurrentUploads / 2));
+        console.log(`Server is busy (${(load && load.error) || 'upload queue full'}), retrying in ${seconds}s`);
+
+        const queueStatusElement = document.getElementById('upload-queue-status');
+        if (queueStatusElement) {
+            queueStatusElement.innerHTML = `Server is busy, ${uploadQueue.length} files waiting to upload`;
+        }
+        processUploadQueue();
+    }
+
     // Function to confirm and delete all images
     function confirmDeleteAllImages() {
-        if (localImages.length === 0) {
+        if (imagesTotal === 0) {
             alert('No images to delete.');
             return;
         }
 
         if (confirm('Are you sure you want to delete ALL images? This action cannot be undone.')) {
-            deleteAllImages();
+            // The images to delete are taken from localImages, so list them all first
+            loadAllImagePages()
+                .then(deleteAllImages)
+                .catch(error => {
+                    console.error('Error listing images to delete:', error);
+                    alert('Failed to delete images. Please try again.');
+                });
         }
     }
 
@@ -887,7 +881,7 @@ document.addEventListener('DOMContentLoaded', function() {
         }
 
         // Clear local images array
-        localImages = [];
+        resetImagePages();
 
         // Save empty images list to server
         saveImagesToServer();
@@ -905,11 +899,33 @@ document.addEventListener('DOMContentLoaded', function() {
     function loadLocalImage(imageName) {
         console.log(`[loadLocalImage] Loading image: ${imageName}`);
 
-        const imageData = localImages.find(img => img.name === imageName);
-        if (!imageData) {
+        const imageIndex = localImages.findIndex(img => img.name === imageName);
+        if (imageIndex === -1) {
+            if (!allImagesLoaded) {
+                // Navigated past the pages fetched so far
+                loadNextImagePage()
+                    .then(() => loadLocalImage(imageName))
+                    .catch(error => console.error(`[loadLocalImage] Error loading more images:`, error));
+                return;
+            }
             console.error(`[loadLocalImage] Image not found in localImages array: ${imageName}`);
             return;
         }
+        const imageData = localImages[imageIndex];
+
+        // Fetch the next page before navigation gets to the end of this one
+        if (!allImagesLoaded && imageIndex >= localImages.length - 10) {
+            loadNextImagePage()
+                .then(updateImageCounter)
+                .catch(error => console.error(`[loadLocalImage] Error loading more images:`, error));
+        }
+
+        // Fetch the thumbnails of the next images, so they show as soon as they are navigated to
+        localImages.slice(imageIndex + 1, imageIndex + 3).forEach(nextImage => {
+            if (!nextImage.tiled) {
+                new Image().src = nextImage.thumbnail;
+            }
+        });
 
         console.log(`[loadLocalImage] Found image data:`, imageData);
 
@@ -917,6 +933,12 @@ document.addEventListener('DOMContentLoaded', function() {
         currentImageName = imageName;
         currentImageElement = imageData;
 
+        // Large images are drawn from their tile pyramid instead of being downloaded whole
+        if (imageData.tiled) {
+            loadTiledImage(imageName);
+            return;
+        }
+
         // If we already have a loaded element, use it directly
         if (imageData.element && imageData.element.complete && imageData.element.naturalWidth !== 0) {
             console.log(`[loadLocalImage] Using already loaded image element`);
@@ -931,6 +953,30 @@ document.addEventListener('DOMContentLoaded', function() {
         // Create a new image object to load from server
         const img = new Image();
 
+        // Show the thumbnail, stretched to the size of the image, until the image itself has loaded
+        if (imageData.thumbnail && imageData.width && imageData.height) {
+            const preview = new Image();
+            preview.onload = function() {
+                if (currentImageName !== imageName || imageData.element) {
+                    return;
+                }
+                currentImage = {
+                    source: preview,
+                    complete: true,
+                    width: imageData.width,
+                    height: imageData.height,
+                    naturalWidth: imageData.width,
+                    naturalHeight: imageData.height
+                };
+                // The annotations are loaded with the image
+                annotations = [];
+                selectedAnnotation = null;
+                selectedVertex = null;
+                displayImage();
+            };
+            preview.src = imageData.thumbnail;
+        }
+
         // Convert Windows backslashes to forward slashes for URL
         const normalizedImageName = imageName.replace(/\\/g, '/');
         console.log(`[loadLocalImage] Normalized image name: ${normalizedImageName}`);
@@ -945,8 +991,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
         img.onload = function() {
             console.log(`[loadLocalImage] Successfully loaded image: ${imageName}`);
-            // Update current image with the loaded image
+            // Update current image with the loaded image, and keep it for the next visit
             currentImage = img;
+            imageData.element = img;
 
             // Display the image
             displayImage();
@@ -972,6 +1019,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 console.log(`[loadLocalImage] Second attempt succeeded for: ${imageName}`);
                 // Update current image with the loaded image
                 currentImage = img;
+                imageData.element = img;
                 displayImage();
                 loadAnnotations(imageName);
 
@@ -992,6 +1040,7 @@ document.addEventListener('DOMContentLoaded', function() {
                 thirdImg.onload = function() {
                     console.log(`[loadLocalImage] Third attempt succeeded for: ${imageName}`);
                     currentImage = thirdImg;
+                    imageData.element = thirdImg;
                     displayImage();
                     loadAnnotations(imageName);
 
@@ -1010,7 +1059,15 @@ document.addEventListener('DOMContentLoaded', function() {
 
                         thumbImg.onload = function() {
                             console.log(`[loadLocalImage] Thumbnail loaded for: ${imageName}`);
-                            currentImage = thumbImg;
+                            // Scaled up to the size of the image, so annotations keep their coordinates
+                            currentImage = imageData.width && imageData.height ? {
+                                source: thumbImg,
+                                complete: true,
+                                width: imageData.width,
+                                height: imageData.height,
+                                naturalWidth: imageData.width,
+                                naturalHeight: imageData.height
+                            } : thumbImg;
                             displayImage();
                             loadAnnotations(imageName);
 
@@ -1048,6 +1105,147 @@ document.addEventListener('DOMContentLoaded', function() {
         updateImageCounter();
     }
 
+    // Function to load a large image from its Deep Zoom descriptor
+    function loadTiledImage(imageName) {
+        const normalizedImageName = imageName.replace(/\\/g, '/');
+        const baseUrl = `/projects/${projectId}/deepzoom/${encodeURIComponent(normalizedImageName)}`;
+
+        fetch(`${baseUrl}.dzi`)
+            .then(response => {
+                if (response.status === 503) {
+                    // The pyramid is still being built, ask again when the server says so
+                    const retryAfter = parseInt(response.headers.get('Retry-After'), 10) || 2;
+                    noImageMessage.style.display = 'block';
+                    noImageMessage.innerHTML = 'Preparing image tiles... Please wait.';
+                    canvasContainer.style.display = 'none';
+                    setTimeout(() => {
+                        if (currentImageName === imageName) {
+                            loadTiledImage(imageName);
+                        }
+                    }, retryAfter * 1000);
+                    return null;
+                }
+                if (!response.ok) {
+                    throw new Error(`Failed to load tile descriptor: ${response.status}`);
+                }
+                return response.text();
+            })
+            .then(text => {
+                if (text === null || currentImageName !== imageName) {
+                    return;
+                }
+                const descriptor = new DOMParser().parseFromString(text, 'application/xml');
+                const imageNode = descriptor.getElementsByTagName('Image')[0];
+                const sizeNode = descriptor.getElementsByTagName('Size')[0];
+                const width = parseInt(sizeNode.getAttribute('Width'), 10);
+                const height = parseInt(sizeNode.getAttribute('Height'), 10);
+
+                // Stands in for an Image element in displayImage and resetZoom
+                currentImage = {
+                    tiled: true,
+                    complete: true,
+                    width: width,
+                    height: height,
+                    naturalWidth: width,
+                    naturalHeight: height,
+                    tileSize: parseInt(imageNode.getAttribute('TileSize'), 10),
+                    overlap: parseInt(imageNode.getAttribute('Overlap'), 10),
+                    format: imageNode.getAttribute('Format'),
+                    maxLevel: Math.ceil(Math.log2(Math.max(width, height))),
+                    baseUrl: `${baseUrl}_files`,
+                    tiles: new Map() // Map of "level/col_row" to tile Image
+                };
+                displayImage();
+                loadAnnotations(imageName);
+                updateImageCounter();
+            })
+            .catch(error => {
+                console.error(`[loadTiledImage] Failed to load tiles of ${imageName}:`, error);
+                alert('Failed to load image: ' + imageName);
+            });
+    }
+
+    // Function to draw the visible tiles of the current tiled image
+    function drawTiles() {
+        const image = currentImage;
+        // Level whose resolution matches the current scale (level maxLevel is full size)
+        const level = Math.max(0, Math.min(image.maxLevel, image.maxLevel + Math.ceil(Math.log2(scale))));
+        // Levels up to this one fit in a single tile, which stands in while better tiles load
+        const coarseLevel = Math.min(level, Math.floor(Math.log2(image.tileSize)));
+
+        // Part of the canvas inside the visible area
+        const canvasRect = imageCanvas.getBoundingClientRect();
+        const viewRect = canvasContainer.parentElement.getBoundingClientRect();
+        const visible = {
+            left: Math.max(0, viewRect.left - canvasRect.left),
+            top: Math.max(0, viewRect.top - canvasRect.top),
+            right: Math.min(imageCanvas.width, viewRect.right - canvasRect.left),
+            bottom: Math.min(imageCanvas.height, viewRect.bottom - canvasRect.top)
+        };
+
+        ctx.clearRect(0, 0, imageCanvas.width, imageCanvas.height);
+        drawTileLevel(coarseLevel, visible);
+        if (level !== coarseLevel) {
+            drawTileLevel(level, visible);
+        }
+    }
+
+    // Function to draw the loaded tiles of one pyramid level that cover the visible area
+    function drawTileLevel(level, visible) {
+        const image = currentImage;
+        const size = image.tileSize;
+        // Each level halves the next one, rounding up
+        const levelScale = Math.pow(2, image.maxLevel - level);
+        const levelWidth = Math.ceil(image.width / levelScale);
+        const levelHeight = Math.ceil(image.height / levelScale);
+        const ratioX = imageCanvas.width / levelWidth;
+        const ratioY = imageCanvas.height / levelHeight;
+
+        const lastCol = Math.min(Math.ceil(levelWidth / size), Math.ceil(visible.right / ratioX / size)) - 1;
+        const lastRow = Math.min(Math.ceil(levelHeight / size), Math.ceil(visible.bottom / ratioY / size)) - 1;
+        for (let col = Math.floor(visible.left / ratioX / size); col <= lastCol; col++) {
+            for (let row = Math.floor(visible.top / ratioY / size); row <= lastRow; row++) {
+                const tile = getTile(level, col, row);
+                if (!tile.complete || tile.naturalWidth === 0) {
+                    continue;
+                }
+                // Tiles overlap their left and top neighbours
+                const left = col * size - (col ? image.overlap : 0);
+                const top = row * size - (row ? image.overlap : 0);
+                ctx.drawImage(tile, left * ratioX, top * ratioY, tile.naturalWidth * ratioX, tile.naturalHeight * ratioY);
+            }
+        }
+    }
+
+    // Function to get a tile of the current tiled image, starting to load it if needed
+    function getTile(level, col, row) {
+        const image = currentImage;
+        const key = `${level}/${col}_${row}`;
+        let tile = image.tiles.get(key);
+        if (!tile) {
+            tile = new Image();
+            tile.onload = scheduleTileRedraw;
+            tile.onerror = () => image.tiles.delete(key); // Asked for again on the next redraw
+            tile.src = `${image.baseUrl}/${key}.${image.format}`;
+            image.tiles.set(key, tile);
+        }
+        return tile;
+    }
+
+    // Function to redraw the tiles of the current tiled image in the next frame
+    function scheduleTileRedraw() {
+        if (tileRedrawPending || !currentImage || !currentImage.tiled) {
+            return;
+        }
+        tileRedrawPending = true;
+        requestAnimationFrame(() => {
+            tileRedrawPending = false;
+            if (currentImage && currentImage.tiled) {
+                drawTiles();
+            }
+        });
+    }
+
     // Function to handle mouse wheel for zooming
     function handleMouseWheel(e) {
         e.preventDefault(); // Prevent page scrolling
@@ -1164,6 +1362,10 @@ document.addEventListener('DOMContentLoaded', function() {
                 scale = Math.min(scaleX, scaleY, 1); // Don't scale up images that are smaller than the container
                 console.log(`[displayImage] Calculated scale: ${scale}`);
             }
+            if (currentImage.tiled) {
+                // The canvas covers the whole scaled image, keep it within what browsers allocate
+                scale = Math.min(scale, maxTiledCanvasSize / Math.max(currentImage.width, currentImage.height));
+            }
 
             // Set canvas dimensions based on current scale
             const scaledWidth = currentImage.width * scale;
@@ -1183,8 +1385,13 @@ document.addEventListener('DOMContentLoaded', function() {
 
             try {
                 // Draw image
-                ctx.clearRect(0, 0, imageCanvas.width, imageCanvas.height);
-                ctx.drawImage(currentImage, 0, 0, scaledWidth, scaledHeight);
+                if (currentImage.tiled) {
+                    drawTiles();
+                } else {
+                    ctx.clearRect(0, 0, imageCanvas.width, imageCanvas.height);
+                    // Thumbnail previews stand in for the image, scaled up to its size
+                    ctx.drawImage(currentImage.source || currentImage, 0, 0, scaledWidth, scaledHeight);
+                }
                 console.log(`[displayImage] Image drawn successfully`);
             } catch (error) {
                 console.error(`[displayImage] Error drawing image:`, error);
@@ -1513,6 +1720,8 @@ document.addEventListener('DOMContentLoaded', function() {
 
             // Apply the new offset to the canvas container
             canvasContainer.style.transform = `translate(${offsetX}px, ${offsetY}px)`;
+            // Fetch the tiles panned into view
+            scheduleTileRedraw();
             return;
         }
 
@@ -2404,7 +2613,7 @@ document.addEventListener('DOMContentLoaded', function() {
             return response.json();
         })
         .then(data => {
-            alert('Export successful. Check the export folder in your project directory.');
+            alert('Export started. The dataset will be written to the export folder in your project directory.');
             // Close modal
             const exportModal = bootstrap.Modal.getInstance(document.getElementById('exportModal'));
             exportModal.hide();
@@ -2547,21 +2756,10 @@ document.addEventListener('DOMContentLoaded', function() {
         document.getElementById('background-images-tab').classList.remove('active');
         document.getElementById(tabId + '-tab').classList.add('active');
 
-        // Use AJAX to get filtered images from the server
-        fetch(`/projects/${projectId}/filtered_images?tab=${tabId}`)
-            .then(response => {
-                if (!response.ok) {
-                    throw new Error('Failed to get filtered images');
-                }
-                return response.json();
-            })
-            .then(data => {
-                // Update local arrays with the filtered images
-                localImages = data.images || [];
-
-                // Update filtered images based on the current tab
-                filteredImages = [...localImages];
-
+        // Use AJAX to get the first page of filtered images from the server
+        resetImagePages();
+        loadNextImagePage()
+            .then(() => {
                 // Update the image counter and tab counts
                 updateImageCounter();
                 updateTabCounts();
@@ -2596,127 +2794,25 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Function to update toggle button text with image counts
     function updateTabCounts() {
-        // Update the toggle button text with the count of images in each category
-        document.getElementById('all-images-tab').textContent = `All Images (${localImages.length})`;
-        document.getElementById('annotated-images-tab').textContent = `Annotated Images (${annotatedImages.length})`;
-        document.getElementById('unannotated-images-tab').textContent = `Images without Annotations (${unannotatedImages.length})`;
-        document.getElementById('background-images-tab').textContent = `Background (${backgroundImages.length})`;
-    }
-
-    // Function to filter images based on the current tab
-    function filterImages() {
-        // Filter images based on the current tab
-        if (currentTab === 'all-images') {
-            filteredImages = [...localImages];
-        } else if (currentTab === 'annotated-images') {
-            filteredImages = [...annotatedImages];
-        } else if (currentTab === 'unannotated-images') {
-            filteredImages = [...unannotatedImages];
-        } else if (currentTab === 'background-images') {
-            filteredImages = [...backgroundImages];
-        }
-
-        // Update the image counter
-        updateImageCounter();
-
-        // Update tab counts
-        updateTabCounts();
-    }
-
-    // Function to update the annotation status of all images
-    function updateAnnotationStatus() {
-        // Clear the arrays
-        annotatedImages = [];
-        unannotatedImages = [];
-        backgroundImages = [];
-
-        // Limit the number of concurrent API calls to avoid overwhelming the server
-        // and to prevent interference with the upload process
-        const batchSize = 3; // Reduced batch size to 3 images at a time to reduce server load
-        const imagesToProcess = [...localImages]; // Create a copy of the array
-        const results = [];
-
-        // Process images in batches
-        function processBatch() {
-            if (imagesToProcess.length === 0) {
-                // All images processed, update the UI
-                return Promise.resolve(results);
-            }
-
-            // Take the next batch of images
-            const batch = imagesToProcess.splice(0, batchSize);
-
-            // Process this batch
-            const batchPromises = batch.map(image => {
-                return checkImageAnnotationStatus(image.name)
-                    .then(result => {
-                        if (result.hasAnnotations) {
-                            annotatedImages.push(image);
-
-                            // If it has a background annotation, add to background images array
-                            if (result.hasBackgroundAnnotation) {
-                                backgroundImages.push(image);
-                            }
-                        } else {
-                            unannotatedImages.push(image);
-                        }
-                        results.push(result);
-                    });
-            });
-
-            // Wait for this batch to complete, then process the next batch
-            return Promise.all(batchPromises).then(() => {
-                // Add a longer delay between batches to allow other operations (like uploads) to proceed
-                // This significantly reduces contention with the upload process
-                return new Promise(resolve => setTimeout(() => resolve(processBatch()), 200));
-            });
-        }
-
-        // Start processing batches and return the promise
-        return processBatch().then(() => {
-            // Update the filtered images based on the current tab
-            filterImages();
-
-            // Log the counts for debugging
-            console.log(`Annotation status updated: ${annotatedImages.length} annotated, ${unannotatedImages.length} unannotated, ${backgroundImages.length} background`);
-        });
-    }
+        const tabLabels = {
+            'all-images': 'All Images',
+            'annotated-images': 'Annotated Images',
+            'unannotated-images': 'Images without Annotations',
+            'background-images': 'Background'
+        };
 
-    // Function to check if an image has annotations
-    function checkImageAnnotationStatus(imageName) {
-        return new Promise((resolve) => {
-            // Add a significant delay before making the API call to reduce contention with uploads
-            // This helps prevent overwhelming the server with too many concurrent requests
-            // and allows upload operations to proceed without interference
-            setTimeout(() => {
-                // Convert Windows backslashes to forward slashes for URL
-                const normalizedImageName = imageName.replace(/\\/g, '/');
-
-                // Try to load annotations from server
-                fetch(`/projects/${projectId}/annotations/${encodeURIComponent(normalizedImageName)}`)
-                    .then(response => response.json())
-                    .then(data => {
-                        // Check if there are any annotations
-                        const hasAnnotations = data && data.length > 0;
-
-                        // Check if there's a background annotation
-                        const hasBackgroundAnnotation = hasAnnotations && data.some(annotation => annotation.type === 'background');
-
-                        // Resolve with an object containing both flags
-                        resolve({
-                            hasAnnotations,
-                            hasBackgroundAnnotation
-                        });
-                    })
-                    .catch(error => {
-                        console.error('Error checking annotation status:', error);
-                        // If there's an error, assume no annotations
-                        resolve({
-                            hasAnnotations: false,
-                            hasBackgroundAnnotation: false
-                        });
-                    });
-            }, 50); // Increased to 50ms delay to significantly reduce contention with uploads
+        // The total count of a one-image page is the number of images in the tab
+        Object.entries(tabLabels).forEach(([tabId, label]) => {
+            fetch(`/projects/${projectId}/filtered_images?tab=${tabId}&limit=1`)
+                .then(response => {
+                    if (!response.ok) {
+                        throw new Error('Failed to get image count');
+                    }
+                    document.getElementById(`${tabId}-tab`).textContent = `${label} (${response.headers.get('X-Total-Count') || 0})`;
+                })
+                .catch(error => {
+                    console.error('Error updating tab counts:', error);
+                });
         });
     }
 
@@ -2808,7 +2904,9 @@ document.addEventListener('DOMContentLoaded', function() {
 
     // Function to update the image counter display
     function updateImageCounter() {
-        if (!filteredImages.length) {
+        // Not every page may be loaded yet, the total comes from the server
+        const total = Math.max(imagesTotal, filteredImages.length);
+        if (!total) {
             imageCounter.textContent = 'Image 0 of 0';
             return;
         }
@@ -2816,13 +2914,13 @@ document.addEventListener('DOMContentLoaded', function() {
         // Find the index of the current image in the filtered images
         const currentIndex = filteredImages.findIndex(img => img.name === currentImageName);
         if (currentIndex === -1) {
-            imageCounter.textContent = 'Image 0 of ' + filteredImages.length;
+            imageCounter.textContent = 'Image 0 of ' + total;
             return;
         }
 
         // Display 1-based index for better user experience
         const displayIndex = currentIndex + 1;
-        imageCounter.textContent = 'Image ' + displayIndex + ' of ' + filteredImages.length;
+        imageCounter.textContent = 'Image ' + displayIndex + ' of ' + total;
     }
 
     // Function to set up periodic refresh to check for new images
@@ -2857,24 +2955,17 @@ document.addEventListener('DOMContentLoaded', function() {
                             // Load each new image
                             newImages.forEach(savedImage => {
                                 if (savedImage.path) {
-                                    // Create image object
+                                    // Preload the thumbnail; the image itself is fetched when it is opened
                                     const img = new Image();
-
-                                    // Load from the server path
-                                    const normalizedImageName = savedImage.name.replace(/\\/g, '/');
-                                    const imageSrc = `/projects/${projectId}/images/${encodeURIComponent(normalizedImageName)}`;
-
-                                    // Add timestamp to prevent caching
-                                    img.src = `${imageSrc}?t=${new Date().getTime()}`;
+                                    img.src = thumbnailUrl(savedImage.name, 512);
 
                                     img.onload = function() {
                                         console.log(`Successfully loaded new image: ${savedImage.name}`);
 
                                         // Add to local images array
                                         localImages.push({
-                                            name: savedImage.name,
-                                            element: img,
-                                            path: savedImage.path
+                                            ...savedImage,
+                                            thumbnail: img.src
                                         });
 
                                         // Update the image counter
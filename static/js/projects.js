@@ -203,6 +203,27 @@ function initSocketConnection() {
         // Process next item in queue
         processUploadQueue();
     });
+
+    // Listen for export events
+    socket.on('export_completed', function(data) {
+        if (!pendingExports[data.task_id]) {
+            return;
+        }
+        const counts = data.counts || {};
+        if (confirm(`Export of "${pendingExports[data.task_id]}" finished: ${counts.images || 0} images ` +
+                    `(${counts.train || 0} train, ${counts.val || 0} val). Download it as a zip?`)) {
+            window.location.href = `/projects/${data.project_id}/export/download?format=${data.format || 'yolo'}`;
+        }
+        delete pendingExports[data.task_id];
+    });
+
+    socket.on('export_failed', function(data) {
+        if (!pendingExports[data.task_id]) {
+            return;
+        }
+        alert(`Export of "${pendingExports[data.task_id]}" failed: ${data.error || 'Unknown error'}`);
+        delete pendingExports[data.task_id];
+    });
 }
 
 // Function to load projects
@@ -262,13 +283,10 @@ function loadProjects() {
 
                     const projectCard = createProjectCard(projectWithPlaceholders);
                     projectsList.appendChild(projectCard);
-
-                    // Update counts in the background with a small delay between each project
-                    // to avoid overwhelming the server with requests
-                    setTimeout(() => {
-                        updateProjectImageCount(project.id);
-                    }, Math.random() * 1000); // Random delay between 0-1000ms to stagger requests
                 });
+
+                // Update the counts of all projects in the background with a single request
+                updateAllProjectCounts(projects.map(project => project.id));
             }
         })
         .catch(error => {
@@ -620,13 +638,17 @@ function exportProject(projectId, projectName) {
             method: 'POST'
         })
         .then(response => {
-            if (!response.ok) {
+            if (!response.ok && response.status !== 409) {
                 throw new Error('Failed to export project');
             }
-            return response.json();
+            return response.json().then(data => ({ data, running: response.status === 409 }));
         })
-        .then(data => {
-            alert('Export successful. Check the export folder in your project directory.');
+        .then(({ data, running }) => {
+            // The export runs in the background and reports back over Socket.IO
+            pendingExports[data.task_id] = projectName;
+            alert(running
+                ? 'This project is already being exported. You will be notified when it is finished.'
+                : 'Export started. You will be notified when it is finished.');
         })
         .catch(error => {
             console.error('Error exporting project:', error);
@@ -831,6 +853,7 @@ let currentUploadInProgress = {}; // Map of projectId to boolean indicating if a
 let projectTotalFiles = {}; // Map of projectId to total files to upload
 let projectCompletedUploads = {}; // Map of projectId to completed uploads
 let projectFailedUploads = {}; // Map of projectId to failed uploads
+let pendingExports = {}; // Map of export task_id to project name
 let projectFailedQueues = {}; // Map of projectId to failed uploads queue
 let projectLastProgressValues = {}; // Map of projectId to last progress value
 // Maximum number of retry attempts
@@ -2176,6 +2199,118 @@ function updateUploadProgress(projectId, progress, status, error) {
     // to ensure we show the real number of files in the project
 }
 
+// Function to render image and annotation counts on a project card
+function renderProjectCounts(projectCard, projectId, data, isCurrentlyUploading) {
+    // Always use the server's imageCount to ensure we show the real number of files in the project
+    let imageCount = data.imageCount !== undefined ? data.imageCount : 0;
+    console.log(`Using server image count: ${imageCount}`);
+
+    // If we're at the end of an upload process, log the difference between local and server counts
+    if (isCurrentlyUploading && projectCompletedUploads[projectId] !== imageCount) {
+        console.log(`Note: Local count (${projectCompletedUploads[projectId] || 0}) differs from server count (${imageCount})`);
+    }
+
+    // Find the image count element and update it
+    const imageCountElement = projectCard.querySelector('.image-count');
+    if (imageCountElement) {
+        // Update the image count and remove the loading class if present
+        imageCountElement.textContent = imageCount;
+        imageCountElement.classList.remove('loading-count');
+    }
+
+    // Update annotation counts
+    if (data.annotationsCount) {
+        const annotationStatsElement = projectCard.querySelector('.annotation-stats');
+        if (annotationStatsElement) {
+            // If we have annotation counts, update them
+            if (Object.keys(data.annotationsCount).length > 0) {
+                let annotationStatsHtml = '';
+                for (const [className, count] of Object.entries(data.annotationsCount)) {
+                    annotationStatsHtml += `<li>${className}: <span class="annotation-count">${count}</span></li>`;
+                }
+                annotationStatsElement.innerHTML = annotationStatsHtml;
+            } else {
+                // If no annotations, show empty state
+                annotationStatsElement.innerHTML = '<li>No annotations yet</li>';
+            }
+
+            // Remove loading class from any annotation count elements
+            const annotationCountElements = annotationStatsElement.querySelectorAll('.annotation-count');
+            annotationCountElements.forEach(element => {
+                element.classList.remove('loading-count');
+            });
+        } else {
+            // If the annotation stats element doesn't exist, update the entire stats section
+            const statsElement = projectCard.querySelector('.project-stats');
+            if (statsElement) {
+                // Create updated stats HTML
+                let statsHtml = '';
+
+                // Always show Images count
+                statsHtml += `<div><strong>Images:</strong> <span class="image-count">${imageCount}</span></div>`;
+
+                // Add annotation counts per class if available
+                statsHtml += '<div><strong>Annotations:</strong></div>';
+                statsHtml += '<ul class="annotation-stats">';
+                if (Object.keys(data.annotationsCount).length > 0) {
+                    for (const [className, count] of Object.entries(data.annotationsCount)) {
+                        statsHtml += `<li>${className}: <span class="annotation-count">${count}</span></li>`;
+                    }
+                } else {
+                    statsHtml += '<li>No annotations yet</li>';
+                }
+                statsHtml += '</ul>';
+
+                // Update the stats HTML
+                statsElement.innerHTML = statsHtml;
+
+                // Remove loading class from any count elements
+                const countElements = statsElement.querySelectorAll('.image-count, .annotation-count');
+                countElements.forEach(element => {
+                    element.classList.remove('loading-count');
+                });
+            }
+        }
+    }
+}
+
+// Function to update the counts of many projects with a single batched request
+function updateAllProjectCounts(projectIds) {
+    if (!projectIds.length) {
+        return;
+    }
+
+    fetch(`/projects/counts?ids=${projectIds.map(encodeURIComponent).join(',')}`)
+        .then(response => {
+            if (!response.ok) {
+                throw new Error(`Failed to get project counts: ${response.status}`);
+            }
+            return response.json();
+        })
+        .then(countsByProject => {
+            projectIds.forEach(projectId => {
+                const projectCard = document.getElementById(`project-card-${projectId}`);
+                const data = countsByProject[projectId];
+                if (!projectCard || !data) {
+                    return;
+                }
+
+                if (data.error) {
+                    console.error(`Error getting counts for project ${projectId}: ${data.error}`);
+                    return;
+                }
+
+                renderProjectCounts(projectCard, projectId, data, isUploading && currentProjectId === projectId);
+            });
+        })
+        .catch(error => {
+            console.error(`Error updating project counts: ${error}`);
+
+            // Fall back to per-project requests
+            projectIds.forEach(projectId => updateProjectImageCount(projectId));
+        });
+}
+
 // Function to update project image count and annotations count
 function updateProjectImageCount(projectId) {
     // Find the project card
@@ -2214,77 +2349,7 @@ function updateProjectImageCount(projectId) {
                 return response.json();
             })
             .then(data => {
-                // Always use the server's imageCount to ensure we show the real number of files in the project
-                let imageCount = data.imageCount !== undefined ? data.imageCount : 0;
-                console.log(`Using server image count: ${imageCount}`);
-
-                // If we're at the end of an upload process, log the difference between local and server counts
-                if (isCurrentlyUploading && projectCompletedUploads[projectId] !== imageCount) {
-                    console.log(`Note: Local count (${projectCompletedUploads[projectId] || 0}) differs from server count (${imageCount})`);
-                }
-
-                // Find the image count element and update it
-                const imageCountElement = projectCard.querySelector('.image-count');
-                if (imageCountElement) {
-                    // Update the image count and remove the loading class if present
-                    imageCountElement.textContent = imageCount;
-                    imageCountElement.classList.remove('loading-count');
-                }
-
-                // Update annotation counts
-                if (data.annotationsCount) {
-                    const annotationStatsElement = projectCard.querySelector('.annotation-stats');
-                    if (annotationStatsElement) {
-                        // If we have annotation counts, update them
-                        if (Object.keys(data.annotationsCount).length > 0) {
-                            let annotationStatsHtml = '';
-                            for (const [className, count] of Object.entries(data.annotationsCount)) {
-                                annotationStatsHtml += `<li>${className}: <span class="annotation-count">${count}</span></li>`;
-                            }
-                            annotationStatsElement.innerHTML = annotationStatsHtml;
-                        } else {
-                            // If no annotations, show empty state
-                            annotationStatsElement.innerHTML = '<li>No annotations yet</li>';
-                        }
-
-                        // Remove loading class from any annotation count elements
-                        const annotationCountElements = annotationStatsElement.querySelectorAll('.annotation-count');
-                        annotationCountElements.forEach(element => {
-                            element.classList.remove('loading-count');
-                        });
-                    } else {
-                        // If the annotation stats element doesn't exist, update the entire stats section
-                        const statsElement = projectCard.querySelector('.project-stats');
-                        if (statsElement) {
-                            // Create updated stats HTML
-                            let statsHtml = '';
-
-                            // Always show Images count
-                            statsHtml += `<div><strong>Images:</strong> <span class="image-count">${imageCount}</span></div>`;
-
-                            // Add annotation counts per class if available
-                            statsHtml += '<div><strong>Annotations:</strong></div>';
-                            statsHtml += '<ul class="annotation-stats">';
-                            if (Object.keys(data.annotationsCount).length > 0) {
-                                for (const [className, count] of Object.entries(data.annotationsCount)) {
-                                    statsHtml += `<li>${className}: <span class="annotation-count">${count}</span></li>`;
-                                }
-                            } else {
-                                statsHtml += '<li>No annotations yet</li>';
-                            }
-                            statsHtml += '</ul>';
-
-                            // Update the stats HTML
-                            statsElement.innerHTML = statsHtml;
-
-                            // Remove loading class from any count elements
-                            const countElements = statsElement.querySelectorAll('.image-count, .annotation-count');
-                            countElements.forEach(element => {
-                                element.classList.remove('loading-count');
-                            });
-                        }
-                    }
-                }
+                renderProjectCounts(projectCard, projectId, data, isCurrentlyUploading);
             })
             .catch(error => {
                 console.error(`Error updating project counts: ${error}`);